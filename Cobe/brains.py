@@ -0,0 +1,224 @@
+###
+# Copyright (c) 2015, waratte
+# Copyright (c) 2020, oddluck <oddluck@riseup.net>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+###
+
+import collections
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import supybot.log as log
+import supybot.schedule as schedule
+
+
+def learn_lines(brain, lines):
+    """Learn lines in a single transaction."""
+    # cobe commits after each learn() unless it is batch learning. Its
+    # start_batch_learning() also drops the reply indexes, which is only worth
+    # it for whole corpora, so set the flag it uses directly.
+    brain._learning = True
+    try:
+        for line in lines:
+            brain.learn(line)
+    finally:
+        brain._learning = False
+        brain.graph.commit()
+
+
+class OpenBrain(object):
+    """
+    An open brain and the thread it belongs to. Every operation on the brain
+    runs on that thread, one at a time: a SQLite connection can't be used
+    from other threads, and a cobe brain isn't safe for concurrent use.
+
+    Lines to learn are queued and learned together, when batch_size lines are
+    waiting, after batch_time seconds, or before anything else is done with
+    the brain.
+    """
+
+    def __init__(self, brain_class, filename):
+        self.brain_class = brain_class
+        self.filename = filename
+        self.brain = None
+        self.used = time.time()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="Cobe")
+        self.lock = threading.Lock()
+        self.pending = []
+        self.flushing = False
+        self.event = None
+        self.closed = False
+
+    def _open(self):
+        if not os.path.exists(self.filename):
+            log.info("Cobe: creating a brain in %s", self.filename)
+            os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+            self.brain_class.init(self.filename)
+        self.brain = self.brain_class(self.filename)
+
+    def _flush(self):
+        with self.lock:
+            lines, self.pending = self.pending, []
+            self.flushing = False
+        if lines:
+            if self.brain is None:
+                self._open()
+            learn_lines(self.brain, lines)
+
+    def _call(self, function, args):
+        self._flush()
+        if self.brain is None:
+            self._open()
+        return function(self.brain, *args)
+
+    def _learn(self):
+        try:
+            self._flush()
+        except Exception:
+            log.exception("Cobe: error while learning in %s", self.filename)
+
+    def _close(self):
+        self._learn()
+        if self.brain is not None:
+            try:
+                self.brain.graph.close()
+            except Exception:
+                log.exception("Cobe: error while closing %s", self.filename)
+            self.brain = None
+
+    def _timeout(self):
+        with self.lock:
+            self.event = None
+            if self.pending and not self.flushing and not self.closed:
+                self.flushing = True
+                self.executor.submit(self._learn)
+
+    def submit(self, function, *args):
+        """Queue function(brain, *args), returning its future."""
+        self.used = time.time()
+        return self.executor.submit(self._call, function, args)
+
+    def learn(self, text, batch_size, batch_time):
+        """Queue text to be learned."""
+        self.used = time.time()
+        with self.lock:
+            self.pending.append(text)
+            if len(self.pending) >= batch_size:
+                if not self.flushing:
+                    self.flushing = True
+                    self.executor.submit(self._learn)
+            elif self.event is None:
+                self.event = schedule.addEvent(self._timeout, time.time() + batch_time)
+
+    def close(self):
+        """
+        Close the brain once the lines and operations queued are done,
+        returning the future of the close.
+        """
+        with self.lock:
+            self.closed = True
+            if self.event is not None:
+                try:
+                    schedule.removeEvent(self.event)
+                except KeyError:
+                    pass
+                self.event = None
+        closing = self.executor.submit(self._close)
+        self.executor.shutdown(wait=False)
+        return closing
+
+
+class BrainManager(object):
+    """
+    Keeps the brains of the most recently used channels open, at most
+    max_brains of them. Brains are created when first used.
+    """
+
+    def __init__(self, brain_class, max_brains=10, batch_size=20, batch_time=1.0):
+        self.brain_class = brain_class
+        self.max_brains = max_brains
+        self.batch_size = batch_size
+        self.batch_time = batch_time
+        self.lock = threading.Lock()
+        # filename -> OpenBrain, least recently used first
+        self.brains = collections.OrderedDict()
+        # filename -> future of a close still in progress
+        self.closing = {}
+
+    def _close(self, filename, brain):
+        for name, closing in list(self.closing.items()):
+            if closing.done():
+                del self.closing[name]
+        self.closing[filename] = brain.close()
+
+    def _get(self, filename):
+        brain = self.brains.pop(filename, None)
+        if brain is None:
+            # Two connections writing the same brain would lock each other
+            # out, so let the old one finish before opening the file again.
+            closing = self.closing.pop(filename, None)
+            if closing is not None:
+                closing.result()
+            brain = OpenBrain(self.brain_class, filename)
+        self.brains[filename] = brain
+        while len(self.brains) > self.max_brains:
+            self._close(*self.brains.popitem(last=False))
+        return brain
+
+    def submit(self, filename, function, *args):
+        """
+        Queue function(brain, *args) on the brain stored in filename, returning
+        its future.
+        """
+        with self.lock:
+            return self._get(filename).submit(function, *args)
+
+    def run(self, filename, function, *args):
+        """Call function(brain, *args) on the brain stored in filename."""
+        return self.submit(filename, function, *args).result()
+
+    def learn(self, filename, text):
+        """Queue text to be learned by the brain stored in filename."""
+        with self.lock:
+            self._get(filename).learn(text, self.batch_size, self.batch_time)
+
+    def close_idle(self, idle_time):
+        """Close the brains which weren't used in the last idle_time seconds."""
+        limit = time.time() - idle_time
+        with self.lock:
+            for filename, brain in list(self.brains.items()):
+                if brain.used < limit:
+                    del self.brains[filename]
+                    self._close(filename, brain)
+
+    def close(self):
+        with self.lock:
+            for filename, brain in self.brains.items():
+                self._close(filename, brain)
+            self.brains.clear()
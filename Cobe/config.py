@@ -149,5 +149,43 @@ conf.registerChannelValue(
     ),
 )
 
+conf.registerGlobalValue(
+    Cobe,
+    "maxBrains",
+    registry.PositiveInteger(
+        10, _("""Determines how many channel brains are kept open at once.""")
+    ),
+)
+conf.registerGlobalValue(
+    Cobe,
+    "brainIdleTime",
+    registry.PositiveInteger(
+        600,
+        _(
+            """Determines how many seconds a channel brain is kept open after it was last used."""
+        ),
+    ),
+)
+conf.registerGlobalValue(
+    Cobe,
+    "learnBatchSize",
+    registry.PositiveInteger(
+        20,
+        _(
+            """Determines how many channel messages are learned together, in a single transaction."""
+        ),
+    ),
+)
+conf.registerGlobalValue(
+    Cobe,
+    "learnBatchTime",
+    registry.PositiveInteger(
+        1000,
+        _(
+            """Determines how many milliseconds channel messages may wait before they are learned."""
+        ),
+    ),
+)
+
 
 # vim:set shiftwidth=4 tabstop=4 expandtab textwidth=79:
@@ -33,7 +33,7 @@ import random
 import time
 import os
 import re
-import subprocess
+import sqlite3
 import requests
 
 import supybot.utils as utils
@@ -63,8 +63,15 @@ try:
 except ImportError:
     raise callbacks.Error("You need to install cobe for this plugin to work!")
 
+from .brains import BrainManager, learn_lines
+
 MATCH_MESSAGE_STRIPNICK = re.compile("^(<[^ ]+> )?(?P<message>.*)$")
 
+# Lines learned per transaction when importing text
+BULK_LINES = 5000
+# Seconds between progress reports when importing text
+PROGRESS_INTERVAL = 30
+
 
 class Cobe(callbacks.Plugin):
     """
@@ -78,6 +85,21 @@ class Cobe(callbacks.Plugin):
     def __init__(self, irc):
         self.__parent = super(Cobe, self)
         self.__parent.__init__(irc)
+        self.brains = BrainManager(SQLiteBrain)
+        self._brainSettings()
+
+        def closeIdle():
+            self.brains.close_idle(self.registryValue("brainIdleTime"))
+
+        schedule.addPeriodicEvent(closeIdle, 60, "Cobe_closeIdle", now=False)
+
+    def die(self):
+        try:
+            schedule.removeEvent("Cobe_closeIdle")
+        except KeyError:
+            pass
+        self.brains.close()
+        self.__parent.die()
 
     def _strip_nick(self, irc, msg, text):
         for user in irc.state.channels[msg.args[0]].users:
@@ -95,11 +117,23 @@ class Cobe(callbacks.Plugin):
         directory = directory.dirize(channel.lower() + "/cobe.brain")
         return directory
 
-    def _doCommand(self, channel):
-        """Internal method for accessing a cobe brain."""
-        dataDirectory = conf.supybot.directories.data
-        dataDirectory = dataDirectory.dirize(channel.lower() + "/cobe.brain")
-        return "cobe --brain %s" % dataDirectory
+    def _brainSettings(self):
+        """Internal method for passing the current settings to the brain manager."""
+        self.brains.max_brains = self.registryValue("maxBrains")
+        self.brains.batch_size = self.registryValue("learnBatchSize")
+        self.brains.batch_time = self.registryValue("learnBatchTime") / 1000
+
+    def _brain(self, channel, function, *args):
+        """Internal method for calling function(brain, *args) on a channel's brain."""
+        self._brainSettings()
+        return self.brains.run(
+            self._getBrainDirectoryForChannel(channel), function, *args
+        )
+
+    def _queueLearn(self, channel, text):
+        """Internal method for learning text in the background."""
+        self._brainSettings()
+        self.brains.learn(self._getBrainDirectoryForChannel(channel), text)
 
     def _cleanText(self, text):
         """Internal method for cleaning text of imperfections."""
@@ -165,27 +199,15 @@ class Cobe(callbacks.Plugin):
     def _learn(self, irc, msg, channel, text, probability):
         """Internal method for learning phrases."""
         text = self._processText(channel, text)  # Run text ignores/strips/cleanup.
-        if os.path.exists(self._getBrainDirectoryForChannel(channel)):
-            # Does this channel have a directory for the brain file stored and does this file exist?
-            if text:
-                self.log.debug("Learning: {0}".format(text))
-                cobeBrain = SQLiteBrain(self._getBrainDirectoryForChannel(channel))
-                cobeBrain.learn(text)
-                if random.randint(0, 10000) <= probability:
-                    self._reply(irc, msg, channel, text)
-        else:  # Nope, let's make it!
-            subprocess.getoutput("{0} {1}".format(self._doCommand(channel), "init"))
-            if text:
-                self.log.debug("Learning: {0}".format(text))
-                cobeBrain = SQLiteBrain(self._getBrainDirectoryForChannel(channel))
-                cobeBrain.learn(text)
-                if random.randint(0, 10000) <= probability:
-                    self._reply(irc, msg, channel, text)
+        if text:
+            self.log.debug("Learning: {0}".format(text))
+            self._queueLearn(channel, text)
+            if random.randint(0, 10000) <= probability:
+                self._reply(irc, msg, channel, text)
 
     def _reply(self, irc, msg, channel, text):
         """Send a response to text"""
-        cobeBrain = SQLiteBrain(self._getBrainDirectoryForChannel(channel))
-        response = cobeBrain.reply(text)
+        response = self._brain(channel, SQLiteBrain.reply, text)
         response = self._strip_nick(irc, msg, response)
         for i in range(response.lower().count(self.magicnick.lower())):
             # If first word is nick, switch with the callers nick.
@@ -199,7 +221,8 @@ class Cobe(callbacks.Plugin):
                     self.magicnick.lower(),
                     random.choice(list(irc.state.channels[msg.args[0]].users)),
                 )
-        cobeBrain.learn(response)  # Let's have the bot learn the wacky things it says
+        # Let's have the bot learn the wacky things it says
+        self._queueLearn(channel, response)
         self.log.info(
             "Attempting to respond in {0} with message: {1}".format(channel, response)
         )
@@ -301,60 +324,14 @@ class Cobe(callbacks.Plugin):
             not channel
         ):  # Did the user enter in a channel? If not, set the current channel
             channel = msg.args[0]
-        if not irc.isChannel(msg.args[0]) and irc.isChannel(channel):
-            # Are we in a channel and is the channel supplied a channel?
-            if os.path.exists(self._getBrainDirectoryForChannel(channel)):
-                # Does this channel have a brain file?
-                text = self._cleanText(text)
-                if text and len(text) > 1 and not text.isspace():
-                    irc.reply("Learning text: {0}".format(text))
-                    cobeBrain = SQLiteBrain(self._getBrainDirectoryForChannel(channel))
-                    cobeBrain.learn(text)
-                else:
-                    irc.error(_("No text to learn!"), Raise=True)
-            else:
-                # Nope, create one!
-                self.log.info("Non-existent brainfile in {0}!".format(channel))
-                self.log.info(
-                    "Creating a brainfile now in {0}".format(
-                        self._getBrainDirectoryForChannel(channel)
-                    )
-                )
-                subprocess.getoutput("{0} {1}".format(self._doCommand(channel), "init"))
-                text = self._cleanText(text)
-                if text and len(text) > 1 and not text.isspace():
-                    irc.reply("Learning text: {0}".format(text))
-                    cobeBrain = SQLiteBrain(self._getBrainDirectoryForChannel(channel))
-                    cobeBrain.learn(text)
-        elif os.path.exists(
-            self._getBrainDirectoryForChannel(channel)
-        ) and irc.isChannel(channel):
-            # We are in a channel! Does the brain file exist and are we supplied a channel?
-            text = self._cleanText(text)
-            if text and len(text) > 1 and not text.isspace():
-                irc.reply("Learning text: {0}".format(text))
-                cobeBrain = SQLiteBrain(self._getBrainDirectoryForChannel(channel))
-                cobeBrain.learn(text)
-            else:
-                irc.error(_("No text to learn!"), Raise=True)
-        elif not os.path.exists(
-            self._getBrainDirectoryForChannel(channel)
-        ) and irc.isChannel(channel):
-            # Nope, create one!
-            self.log.info("Non-existent brainfile in {0}!".format(channel))
-            self.log.info(
-                "Creating a brainfile now in {0}".format(
-                    self._getBrainDirectoryForChannel(channel)
-                )
-            )
-            subprocess.getoutput("{0} {1}".format(self._doCommand(channel), "init"))
-            text = self._cleanText(text)
-            if text and len(text) > 1 and not text.isspace():
-                irc.reply("Learning text: {0}".format(text))
-                cobeBrain = SQLiteBrain(self._getBrainDirectoryForChannel(channel))
-                cobeBrain.learn(text)
-        else:
+        if not irc.isChannel(channel):
             irc.error(_("Improper channel given!"), Raise=True)
+        text = self._cleanText(text)
+        if text and len(text) > 1 and not text.isspace():
+            irc.reply("Learning text: {0}".format(text))
+            self._queueLearn(channel, text)
+        else:
+            irc.error(_("No text to learn!"), Raise=True)
 
     teach = wrap(teach, [("checkCapability", "admin"), additional("channel"), "text"])
 
@@ -373,128 +350,60 @@ class Cobe(callbacks.Plugin):
             not channel
         ):  # Did the user enter in a channel? If not, set the current channel
             channel = msg.args[0]
-        if not irc.isChannel(msg.args[0]) and irc.isChannel(channel):
-            # Are we in a channel and is the channel supplied a channel?
-            if os.path.exists(self._getBrainDirectoryForChannel(channel)):
-                # Does this channel have a brain file?
-                r = requests.head(url)
-                if "text/plain" in r.headers["content-type"]:
-                    file = requests.get(url)
-                else:
-                    irc.reply("Invalid file type.", private=False, notice=False)
-                    return
-                text = file.content.decode().replace("\r\n", "\n")
-                for line in text.split("\n"):
-                    if process:
-                        line = self._processText(channel, line)
-                    else:
-                        line = self._cleanText(line)
-                    if line:
-                        cobeBrain = SQLiteBrain(
-                            self._getBrainDirectoryForChannel(channel)
-                        )
-                        cobeBrain.learn(line)
-                        lines += 1
-                    else:
-                        continue
-                irc.reply(
-                    "{0} lines added to brain file for channel {1}.".format(
-                        lines, channel
-                    )
-                )
-            else:
-                # Nope, create one!
-                self.log.info("Non-existent brainfile in {0}!".format(channel))
-                self.log.info(
-                    "Creating a brainfile now in {0}".format(
-                        self._getBrainDirectoryForChannel(channel)
-                    )
-                )
-                subprocess.getoutput("{0} {1}".format(self._doCommand(channel), "init"))
-                r = requests.head(url)
-                if "text/plain" in r.headers["content-type"]:
-                    file = requests.get(url)
-                else:
-                    irc.reply("Invalid file type.", private=False, notice=False)
-                    return
-                text = file.content.decode().replace("\r\n", "\n")
-                for line in text.split("\n"):
-                    if process:
-                        line = self._processText(channel, line)
-                    else:
-                        line = self._cleanText(line)
-                    if line:
-                        cobeBrain = SQLiteBrain(
-                            self._getBrainDirectoryForChannel(channel)
-                        )
-                        cobeBrain.learn(line)
-                        lines += 1
-                    else:
-                        continue
-                irc.reply(
-                    "{0} lines added to brain file for channel {1}.".format(
-                        lines, channel
-                    )
-                )
-        elif os.path.exists(
-            self._getBrainDirectoryForChannel(channel)
-        ) and irc.isChannel(channel):
-            # We are in a channel! Does the brain file exist and are we supplied a channel?
-            r = requests.head(url)
-            if "text/plain" in r.headers["content-type"]:
-                file = requests.get(url)
-            else:
-                irc.reply("Invalid file type.", private=False, notice=False)
-                return
-            text = file.content.decode().replace("\r\n", "\n")
-            for line in text.split("\n"):
-                if process:
-                    line = self._processText(channel, line)
-                else:
-                    line = self._cleanText(line)
-                if line:
-                    cobeBrain = SQLiteBrain(self._getBrainDirectoryForChannel(channel))
-                    cobeBrain.learn(line)
-                    lines += 1
-                else:
-                    continue
-            irc.reply(
-                "{0} lines added to brain file for channel {1}.".format(lines, channel)
-            )
-        elif not os.path.exists(
-            self._getBrainDirectoryForChannel(channel)
-        ) and irc.isChannel(channel):
-            # Nope, create one!
-            self.log.info("Non-existent brainfile in {0}!".format(channel))
-            self.log.info(
-                "Creating a brainfile now in {0}".format(
-                    self._getBrainDirectoryForChannel(channel)
-                )
-            )
-            subprocess.getoutput("{0} {1}".format(self._doCommand(channel), "init"))
-            r = requests.head(url)
-            if "text/plain" in r.headers["content-type"]:
-                file = requests.get(url)
-            else:
-                irc.reply("Invalid file type.", private=False, notice=False)
-                return
-            text = file.content.decode().replace("\r\n", "\n")
-            for line in text.split("\n"):
+        if not irc.isChannel(channel):
+            irc.error(_("Improper channel given!"), Raise=True)
+        try:
+            r = requests.get(url, stream=True, timeout=10)
+            r.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            log.debug("Cobe: error retrieving data for text: {0}".format(e))
+            irc.error(_("Unable to retrieve {0}").format(url), Raise=True)
+        if "text/plain" not in r.headers.get("content-type", ""):
+            irc.reply("Invalid file type.", private=False, notice=False)
+            return
+        # Learn the file in big transactions while it is downloaded, learning
+        # a chunk while the next one is read.
+        filename = self._getBrainDirectoryForChannel(channel)
+        self._brainSettings()
+        chunk = []
+        learning = None
+        reported = time.time()
+        try:
+            for line in r.iter_lines():
+                line = line.decode("utf-8", "replace")
                 if process:
                     line = self._processText(channel, line)
                 else:
                     line = self._cleanText(line)
                 if line:
-                    cobeBrain = SQLiteBrain(self._getBrainDirectoryForChannel(channel))
-                    cobeBrain.learn(line)
-                    lines += 1
-                else:
-                    continue
-            irc.reply(
-                "{0} lines added to brain file for channel {1}.".format(lines, channel)
+                    chunk.append(line)
+                if len(chunk) >= BULK_LINES:
+                    if learning:
+                        learning.result()
+                    learning = self.brains.submit(filename, learn_lines, chunk)
+                    lines += len(chunk)
+                    chunk = []
+                    if time.time() - reported >= PROGRESS_INTERVAL:
+                        irc.reply(
+                            "{0} lines read so far for channel {1}...".format(
+                                lines, channel
+                            )
+                        )
+                        reported = time.time()
+            if learning:
+                learning.result()
+            if chunk:
+                self.brains.run(filename, learn_lines, chunk)
+                lines += len(chunk)
+        except sqlite3.Error as e:
+            log.error("Cobe: error while learning {0}: {1}".format(url, e))
+            irc.error(
+                _("Unable to learn the text for channel {0}: {1}").format(channel, e),
+                Raise=True,
             )
-        else:
-            irc.error(_("Improper channel given!"), Raise=True)
+        irc.reply(
+            "{0} lines added to brain file for channel {1}.".format(lines, channel)
+        )
 
     text = wrap(text, [additional("channel"), getopts({"process": ""}), "text"])
 
@@ -506,66 +415,13 @@ class Cobe(callbacks.Plugin):
             not channel
         ):  # Did the user enter in a channel? If not, set the current channel
             channel = msg.args[0]
-        if not irc.isChannel(msg.args[0]) and irc.isChannel(channel):
-            # Are we in a channel and is the channel supplied a channel?
-            if os.path.exists(self._getBrainDirectoryForChannel(channel)):
-                # Does this channel have a brain file?
-                text = self._cleanText(text)
-                if text and len(text) > 1 and not text.isspace():
-                    cobeBrain = SQLiteBrain(self._getBrainDirectoryForChannel(channel))
-                    response = cobeBrain.reply(text)
-                    irc.reply(response)
-                else:
-                    irc.error(_("No text to reply to!"), Raise=True)
-            else:
-                # Nope, create one!
-                self.log.info("Non-existent brainfile in {0}!".format(channel))
-                self.log.info(
-                    "Creating a brainfile now in {0}".format(
-                        self._getBrainDirectoryForChannel(channel)
-                    )
-                )
-                subprocess.getoutput("{0} {1}".format(self._doCommand(channel), "init"))
-                text = self._cleanText(text)
-                if text and len(text) > 1 and not text.isspace():
-                    cobeBrain = SQLiteBrain(self._getBrainDirectoryForChannel(channel))
-                    response = cobeBrain.reply(text)
-                    irc.reply(response)
-                else:
-                    irc.error(_("No text to reply to!"), Raise=True)
-        elif os.path.exists(
-            self._getBrainDirectoryForChannel(channel)
-        ) and irc.isChannel(channel):
-            # We are in a channel! Does the brain file exist and is this a channel?
-            text = self._cleanText(text)
-            if text and len(text) > 1 and not text.isspace():
-
-                cobeBrain = SQLiteBrain(self._getBrainDirectoryForChannel(channel))
-                response = cobeBrain.reply(text)
-                irc.reply(response)
-
-            else:
-                irc.error(_("No text to reply to!"), Raise=True)
-        elif not os.path.exists(
-            self._getBrainDirectoryForChannel(channel)
-        ) and irc.isChannel(channel):
-            # Nope, create one!
-            self.log.info("Non-existent brainfile in {0}!".format(channel))
-            self.log.info(
-                "Creating a brainfile now in {0}".format(
-                    self._getBrainDirectoryForChannel(channel)
-                )
-            )
-            subprocess.getoutput("{0} {1}".format(self._doCommand(channel), "init"))
-            text = self._cleanText(text)
-            if text and len(text) > 1 and not text.isspace():
-                irc.reply("Learning text: {0}".format(text))
-                cobeBrain = SQLiteBrain(self._getBrainDirectoryForChannel(channel))
-                cobeBrain.learn(text)
-            else:
-                irc.error(_("No text to reply to!"), Raise=True)
-        else:
+        if not irc.isChannel(channel):
             irc.error(_("Improper channel given!"), Raise=True)
+        text = self._cleanText(text)
+        if text and len(text) > 1 and not text.isspace():
+            irc.reply(self._brain(channel, SQLiteBrain.reply, text))
+        else:
+            irc.error(_("No text to reply to!"), Raise=True)
 
     respond = wrap(respond, [additional("channel"), "text"])
 
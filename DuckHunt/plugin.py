@@ -38,7 +38,56 @@ import supybot.log as log
 import supybot.conf as conf
 from operator import itemgetter
 
-import threading, random, pickle, os, time, datetime
+import threading, random, os, time, datetime
+
+from .store import ScoreStore
+
+
+class Hunt(object):
+    """
+    State of the hunt in a channel. A new one is created when a hunt starts
+    and it is dropped when the hunt ends.
+    """
+
+    __slots__ = (
+        "channel",
+        "duck",  # Is there currently a duck to shoot?
+        "shoots",  # Number of successfull shoots in a hunt
+        "scores",  # Scores for the current hunt
+        "times",  # Time when the last duck was launched
+        "toptimes",  # Times for the current hunt
+        "worsttimes",  # Worst times for the current hunt
+        "averagetime",  # Average shooting time for the current hunt
+        "fridayMode",  # Are we on friday mode? (automatic)
+        "missprobability",  # Probability to miss a duck when shooting
+        "reloading",  # Who is currently reloading?
+        "reloadtime",  # Time to reload after shooting (in seconds)
+        "reloadcount",  # Number of shots fired while reloading
+        # Does a duck needs to be launched?
+        "lastSpoke",
+        "minthrottle",
+        "maxthrottle",
+        "throttle",
+    )
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.duck = False
+        self.shoots = 0
+        self.scores = {}
+        self.times = False
+        self.toptimes = {}
+        self.worsttimes = {}
+        self.averagetime = 0
+        self.fridayMode = False
+        self.missprobability = 0.2
+        self.reloading = {}
+        self.reloadtime = 5
+        self.reloadcount = {}
+        self.lastSpoke = time.time()
+        self.minthrottle = 30
+        self.maxthrottle = 300
+        self.throttle = 0
 
 
 class DuckHunt(callbacks.Plugin):
@@ -51,36 +100,9 @@ class DuckHunt(callbacks.Plugin):
 
     threaded = True
 
-    # Those parameters are per-channel parameters
-    started = {}  # Has the hunt started?
-    duck = {}  # Is there currently a duck to shoot?
-    shoots = {}  # Number of successfull shoots in a hunt
-    scores = {}  # Scores for the current hunt
-    times = {}  # Elapsed time since the last duck was launched
-    channelscores = {}  # Saved scores for the channel
-    toptimes = {}  # Times for the current hunt
-    channeltimes = {}  # Saved times for the channel
-    worsttimes = {}  # Worst times for the current hunt
-    channelworsttimes = {}  # Saved worst times for the channel
-    averagetime = {}  # Average shooting time for the current hunt
-    fridayMode = {}  # Are we on friday mode? (automatic)
-    manualFriday = {}  # Are we on friday mode? (manual)
-    missprobability = {}  # Probability to miss a duck when shooting
-    week = {}  # Scores for the week
-    channelweek = {}  # Saved scores for the week
-    leader = {}  # Who is the leader for the week?
-    reloading = {}  # Who is currently reloading?
-    reloadtime = {}  # Time to reload after shooting (in seconds)
-    reloadcount = {}  # Number of shots fired while reloading
-
-    # Does a duck needs to be launched?
-    lastSpoke = {}
-    minthrottle = {}
-    maxthrottle = {}
-    throttle = {}
-
     # Where to save scores?
-    fileprefix = "DuckHunt_"
+    filename = "DuckHunt.db"
+    fileprefix = "DuckHunt_"  # Scores saved by older versions
     path = conf.supybot.directories.data
 
     # Enable the 'dbg' command, which launch a duck, if true
@@ -93,7 +115,7 @@ class DuckHunt(callbacks.Plugin):
     toplist = 5  # How many high{scores|times} are displayed by default?
     dow = int(time.strftime("%u"))  # Day of week
     woy = int(time.strftime("%V"))  # Week of year
-    year = time.strftime("%Y")
+    year = int(time.strftime("%Y"))
     dayname = [
         "Monday",
         "Tuesday",
@@ -104,194 +126,101 @@ class DuckHunt(callbacks.Plugin):
         "Sunday",
     ]
 
-    def _calc_scores(self, channel):
-        """
-        Adds new scores and times to the already saved ones
-        """
+    def __init__(self, irc):
+        self.__parent = super(DuckHunt, self)
+        self.__parent.__init__(irc)
+        self.store = ScoreStore(self.path.dirize(self.filename))
+        self.store.import_pickles(self.path(), self.fileprefix)
 
-        # scores
-        # Adding current scores to the channel scores
-        for player, value in self.scores[channel].items():
-            if not player in self.channelscores[channel]:
-                # It's a new player
-                self.channelscores[channel][player] = value
-            else:
-                # It's a player that already has a saved score
-                self.channelscores[channel][player] += value
-
-        # times
-        # Adding times scores to the channel scores
-        for player, value in self.toptimes[channel].items():
-            if not player in self.channeltimes[channel]:
-                # It's a new player
-                self.channeltimes[channel][player] = value
-            else:
-                # It's a player that already has a saved score
-                # And we save the time of the current hunt if it's better than it's previous time
-                if self.toptimes[channel][player] < self.channeltimes[channel][player]:
-                    self.channeltimes[channel][player] = self.toptimes[channel][player]
-
-        # worst times
-        # Adding worst times scores to the channel scores
-        for player, value in self.worsttimes[channel].items():
-            if not player in self.channelworsttimes[channel]:
-                # It's a new player
-                self.channelworsttimes[channel][player] = value
-            else:
-                # It's a player that already has a saved score
-                # And we save the time of the current hunt if it's worst than it's previous time
-                if self.worsttimes[channel][player] > value:
-                    self.channelworsttimes[channel][player] = value
-
-        # week scores
-        for player, value in self.scores[channel].items():
-            # FIXME: If the hunt starts a day and ends the day after, this will produce an error:
-            if not player in self.channelweek[channel][self.woy][self.dow]:
-                # It's a new player
-                self.channelweek[channel][self.woy][self.dow][player] = value
-            else:
-                # It's a player that already has a saved score
-                self.channelweek[channel][self.woy][self.dow][player] += value
-
-    def _write_scores(self, channel):
-        """
-        Write scores and times to the disk
-        """
+        # Running hunts, by (network, channel)
+        self.hunts = {}
 
-        # scores
-        outputfile = open(self.path.dirize(self.fileprefix + channel + ".scores"), "wb")
-        pickle.dump(self.channelscores[channel], outputfile)
-        outputfile.close()
+        # Those parameters are kept between hunts, by (network, channel)
+        self.manualFriday = {}  # Are we on friday mode? (manual)
+        self.leader = {}  # Who is the leader for the week?
 
-        # times
-        outputfile = open(self.path.dirize(self.fileprefix + channel + ".times"), "wb")
-        pickle.dump(self.channeltimes[channel], outputfile)
-        outputfile.close()
-
-        # worst times
-        outputfile = open(
-            self.path.dirize(self.fileprefix + channel + ".worsttimes"), "wb"
-        )
-        pickle.dump(self.channelworsttimes[channel], outputfile)
-        outputfile.close()
+    def die(self):
+        for network, channel in list(self.hunts):
+            try:
+                schedule.removeEvent(self._eventname(network, channel))
+            except KeyError:
+                pass
+        self.store.close()
+        self.__parent.die()
 
-        # week scores
-        outputfile = open(
-            self.path.dirize(self.fileprefix + channel + self.year + ".weekscores"),
-            "wb",
-        )
-        pickle.dump(self.channelweek[channel], outputfile)
-        outputfile.close()
+    def _eventname(self, network, channel):
+        return "DuckHunt_%s_%s" % (network, channel)
 
-    def _read_scores(self, channel):
+    def _save_scores(self, hunt):
         """
-        Reads scores and times from disk
+        Adds the scores and times of the current hunt to the saved ones
         """
-        filename = self.path.dirize(self.fileprefix + channel)
-        # scores
-        if not self.channelscores.get(channel):
-            if os.path.isfile(filename + ".scores"):
-                inputfile = open(filename + ".scores", "rb")
-                self.channelscores[channel] = pickle.load(inputfile)
-                inputfile.close()
-
-        # times
-        if not self.channeltimes.get(channel):
-            if os.path.isfile(filename + ".times"):
-                inputfile = open(filename + ".times", "rb")
-                self.channeltimes[channel] = pickle.load(inputfile)
-                inputfile.close()
-
-        # worst times
-        if not self.channelworsttimes.get(channel):
-            if os.path.isfile(filename + ".worsttimes"):
-                inputfile = open(filename + ".worsttimes", "rb")
-                self.channelworsttimes[channel] = pickle.load(inputfile)
-                inputfile.close()
-
-        # week scores
-        if not self.channelweek.get(channel):
-            if os.path.isfile(filename + self.year + ".weekscores"):
-                inputfile = open(filename + self.year + ".weekscores", "rb")
-                self.channelweek[channel] = pickle.load(inputfile)
-                inputfile.close()
+        self.store.add_hunt(
+            hunt.channel,
+            hunt.scores,
+            hunt.toptimes,
+            hunt.worsttimes,
+            self.year,
+            self.woy,
+            self.dow,
+        )
 
     def _initdayweekyear(self, channel):
         self.dow = int(time.strftime("%u"))  # Day of week
         self.woy = int(time.strftime("%V"))  # Week of year
-        year = time.strftime("%Y")
-
-        # Init week scores
-        try:
-            self.channelweek[channel]
-        except:
-            self.channelweek[channel] = {}
-        try:
-            self.channelweek[channel][self.woy]
-        except:
-            self.channelweek[channel][self.woy] = {}
-        try:
-            self.channelweek[channel][self.woy][self.dow]
-        except:
-            self.channelweek[channel][self.woy][self.dow] = {}
-
-    def _initthrottle(self, irc, msg, args, channel):
+        self.year = int(time.strftime("%Y"))
 
-        self._initdayweekyear(channel)
+    def _initthrottle(self, irc, hunt):
+        channel = hunt.channel
 
-        if not self.leader.get(channel):
-            self.leader[channel] = None
+        self._initdayweekyear(channel)
 
         # autoFriday?
-        if not self.fridayMode.get(channel):
-            self.fridayMode[channel] = False
-
-        if not self.manualFriday.get(channel):
-            self.manualFriday[channel] = False
-
+        hunt.fridayMode = False
         if self.registryValue("autoFriday", channel) == True:
             if (
                 int(time.strftime("%w")) == 5
                 and int(time.strftime("%H")) > 8
                 and int(time.strftime("%H")) < 17
             ):
-                self.fridayMode[channel] = True
-            else:
-                self.fridayMode[channel] = False
+                hunt.fridayMode = True
 
         # Miss probability
         if self.registryValue("missProbability", channel):
-            self.missprobability[channel] = self.registryValue(
-                "missProbability", channel
-            )
+            hunt.missprobability = self.registryValue("missProbability", channel)
         else:
-            self.missprobability[channel] = 0.2
+            hunt.missprobability = 0.2
 
         # Reload time
         if self.registryValue("reloadTime", channel):
-            self.reloadtime[channel] = self.registryValue("reloadTime", channel)
+            hunt.reloadtime = self.registryValue("reloadTime", channel)
         else:
-            self.reloadtime[channel] = 5
+            hunt.reloadtime = 5
 
-        if self.fridayMode[channel] == False and self.manualFriday[channel] == False:
-            # Init min throttle[currentChannel] and max throttle[currentChannel]
+        manualFriday = self.manualFriday.get((irc.network, channel))
+        if hunt.fridayMode == False and not manualFriday:
+            # Init min throttle and max throttle
             if self.registryValue("minthrottle", channel):
-                self.minthrottle[channel] = self.registryValue("minthrottle", channel)
+                hunt.minthrottle = self.registryValue("minthrottle", channel)
             else:
-                self.minthrottle[channel] = 30
+                hunt.minthrottle = 30
 
             if self.registryValue("maxthrottle", channel):
-                self.maxthrottle[channel] = self.registryValue("maxthrottle", channel)
+                hunt.maxthrottle = self.registryValue("maxthrottle", channel)
             else:
-                self.maxthrottle[channel] = 300
+                hunt.maxthrottle = 300
 
         else:
-            self.minthrottle[channel] = 3
-            self.maxthrottle[channel] = 60
+            hunt.minthrottle = 3
+            hunt.maxthrottle = 60
 
-        self.throttle[channel] = random.randint(
-            self.minthrottle[channel], self.maxthrottle[channel]
-        )
+        hunt.throttle = random.randint(hunt.minthrottle, hunt.maxthrottle)
+
+    def _newhunt(self, irc, channel):
+        hunt = Hunt(channel)
+        self._initthrottle(irc, hunt)
+        self.hunts[(irc.network, channel)] = hunt
+        return hunt
 
     def starthunt(self, irc, msg, args):
         """
@@ -301,70 +230,18 @@ class DuckHunt(callbacks.Plugin):
         currentChannel = msg.args[0]
         if irc.isChannel(currentChannel):
 
-            if self.started.get(currentChannel) == True:
+            if (irc.network, currentChannel) in self.hunts:
                 irc.reply("There is already a hunt right now!")
             else:
 
-                # First of all, let's read the score if needed
-                self._read_scores(currentChannel)
-
-                self._initthrottle(irc, msg, args, currentChannel)
-
-                # Init saved scores
-                try:
-                    self.channelscores[currentChannel]
-                except:
-                    self.channelscores[currentChannel] = {}
-
-                # Init saved times
-                try:
-                    self.channeltimes[currentChannel]
-                except:
-                    self.channeltimes[currentChannel] = {}
-
-                # Init saved times
-                try:
-                    self.channelworsttimes[currentChannel]
-                except:
-                    self.channelworsttimes[currentChannel] = {}
-
-                # Init times
-                self.toptimes[currentChannel] = {}
-                self.worsttimes[currentChannel] = {}
-
-                # Init bangdelay
-                self.times[currentChannel] = False
-
-                # Init lastSpoke
-                self.lastSpoke[currentChannel] = time.time()
-
-                # Reinit current hunt scores
-                if self.scores.get(currentChannel):
-                    self.scores[currentChannel] = {}
-
-                # Reinit reloading
-                self.reloading[currentChannel] = {}
-
-                # Reinit reloadcount
-                self.reloadcount[currentChannel] = {}
-
-                # No duck launched
-                self.duck[currentChannel] = False
-
-                # Hunt started
-                self.started[currentChannel] = True
-
-                # Init shoots
-                self.shoots[currentChannel] = 0
-
-                # Init averagetime
-                self.averagetime[currentChannel] = 0
+                self._newhunt(irc, currentChannel)
 
                 # Init schedule
+                eventname = self._eventname(irc.network, currentChannel)
 
                 # First of all, stop the scheduler if it was still running
                 try:
-                    schedule.removeEvent("DuckHunt_" + currentChannel)
+                    schedule.removeEvent(eventname)
                 except KeyError:
                     pass
 
@@ -373,9 +250,7 @@ class DuckHunt(callbacks.Plugin):
                     self._launchEvent(irc, msg)
 
                 try:
-                    schedule.addPeriodicEvent(
-                        myEventCaller, 5, "DuckHunt_" + currentChannel, False
-                    )
+                    schedule.addPeriodicEvent(myEventCaller, 5, eventname, False)
                 except AssertionError:
                     pass
 
@@ -386,16 +261,10 @@ class DuckHunt(callbacks.Plugin):
     starthunt = wrap(starthunt)
 
     def _launchEvent(self, irc, msg):
-        currentChannel = msg.args[0]
-        now = time.time()
-        if irc.isChannel(currentChannel):
-            if self.started.get(currentChannel) == True:
-                if self.duck[currentChannel] == False:
-                    if (
-                        now
-                        > self.lastSpoke[currentChannel] + self.throttle[currentChannel]
-                    ):
-                        self._launch(irc, msg, "")
+        hunt = self.hunts.get((irc.network, msg.args[0]))
+        if hunt and hunt.duck == False:
+            if time.time() > hunt.lastSpoke + hunt.throttle:
+                self._launch(irc, msg, "")
 
     def stophunt(self, irc, msg, args):
         """
@@ -404,14 +273,14 @@ class DuckHunt(callbacks.Plugin):
 
         currentChannel = msg.args[0]
         if irc.isChannel(currentChannel):
-            if self.started.get(currentChannel) == True:
+            if (irc.network, currentChannel) in self.hunts:
                 self._end(irc, msg, args)
             else:
                 irc.reply("Nothing to stop: there's no hunt right now.")
             # If someone uses the stop command,
             # we stop the scheduler, even if autoRestart is enabled
             try:
-                schedule.removeEvent("DuckHunt_" + currentChannel)
+                schedule.removeEvent(self._eventname(irc.network, currentChannel))
             except:
                 pass
         else:
@@ -425,34 +294,34 @@ class DuckHunt(callbacks.Plugin):
         Enable/disable friday mode! (there are lots of ducks on friday :))
         """
         if irc.isChannel(channel):
+            key = (irc.network, channel)
+            hunt = self.hunts.get(key)
 
             if status == "status":
                 irc.reply(
                     "Manual friday mode for "
                     + channel
                     + " is "
-                    + str(self.manualFriday.get(channel))
+                    + str(self.manualFriday.get(key))
                 )
                 irc.reply(
                     "Auto friday mode for "
                     + channel
                     + " is "
-                    + str(self.fridayMode.get(channel))
+                    + str(hunt.fridayMode if hunt else None)
                 )
             else:
-                if (
-                    self.manualFriday.get(channel) == None
-                    or self.manualFriday[channel] == False
-                ):
-                    self.manualFriday[channel] = True
+                if not self.manualFriday.get(key):
+                    self.manualFriday[key] = True
                     irc.reply(
                         "Friday mode is now enabled! Shoot alllllllllllll the ducks!"
                     )
                 else:
-                    self.manualFriday[channel] = False
+                    self.manualFriday[key] = False
                     irc.reply("Friday mode is now disabled.")
 
-            self._initthrottle(irc, msg, args, channel)
+            if hunt:
+                self._initthrottle(irc, hunt)
         else:
             irc.error("You have to be on a channel")
 
@@ -465,8 +334,9 @@ class DuckHunt(callbacks.Plugin):
 
         currentChannel = msg.args[0]
         if irc.isChannel(currentChannel):
-            if self.started.get(currentChannel) == True:
-                if self.duck[currentChannel] == True:
+            hunt = self.hunts.get((irc.network, currentChannel))
+            if hunt:
+                if hunt.duck == True:
                     irc.reply(
                         "There is currently a duck! You can shoot it with the 'bang'"
                         " command"
@@ -493,15 +363,10 @@ class DuckHunt(callbacks.Plugin):
         """
         currentChannel = msg.args[0]
         if irc.isChannel(currentChannel):
-            self._read_scores(currentChannel)
-            try:
-                self.channelscores[currentChannel]
-            except:
-                self.channelscores[currentChannel] = {}
-
-            try:
-                irc.reply(self.channelscores[currentChannel][nick])
-            except:
+            score = self.store.get_score(currentChannel, nick)
+            if score is not None:
+                irc.reply(score)
+            else:
                 irc.reply("There is no score for %s on %s" % (nick, currentChannel))
         else:
             irc.error("You have to be on a channel")
@@ -514,40 +379,19 @@ class DuckHunt(callbacks.Plugin):
         nickto gets the points of nickfrom and nickfrom is removed from the scorelist
         """
         if irc.isChannel(channel):
-            self._read_scores(channel)
-
             # Total scores
-            try:
-                self.channelscores[channel][nickto] += self.channelscores[channel][
-                    nickfrom
-                ]
-                del self.channelscores[channel][nickfrom]
-                self._write_scores(channel)
+            if self.store.merge_scores(channel, nickto, nickfrom):
                 irc.reply("Total scores merged")
-
-            except:
+            else:
                 irc.error("Can't merge total scores")
 
             # Day scores
-            try:
-                self._initdayweekyear(channel)
-                day = self.dow
-                week = self.woy
-
-                try:
-                    self.channelweek[channel][week][day][nickto] += self.channelweek[
-                        channel
-                    ][week][day][nickfrom]
-                except:
-                    self.channelweek[channel][week][day][nickto] = self.channelweek[
-                        channel
-                    ][week][day][nickfrom]
-
-                del self.channelweek[channel][week][day][nickfrom]
-                self._write_scores(channel)
+            self._initdayweekyear(channel)
+            if self.store.merge_day_scores(
+                channel, nickto, nickfrom, self.year, self.woy, self.dow
+            ):
                 irc.reply("Day scores merged")
-
-            except:
+            else:
                 irc.error("Can't merge day scores")
 
         else:
@@ -561,34 +405,9 @@ class DuckHunt(callbacks.Plugin):
         nickto gets the best time of nickfrom if nickfrom time is better than nickto time, and nickfrom is removed from the timelist. Also works with worst times.
         """
         if irc.isChannel(channel):
-            try:
-                self._read_scores(channel)
-
-                # Merge best times
-                if (
-                    self.channeltimes[channel][nickfrom]
-                    < self.channeltimes[channel][nickto]
-                ):
-                    self.channeltimes[channel][nickto] = self.channeltimes[channel][
-                        nickfrom
-                    ]
-                del self.channeltimes[channel][nickfrom]
-
-                # Merge worst times
-                if (
-                    self.channelworsttimes[channel][nickfrom]
-                    > self.channelworsttimes[channel][nickto]
-                ):
-                    self.channelworsttimes[channel][nickto] = self.channelworsttimes[
-                        channel
-                    ][nickfrom]
-                del self.channelworsttimes[channel][nickfrom]
-
-                self._write_scores(channel)
-
+            if self.store.merge_times(channel, nickto, nickfrom):
                 irc.replySuccess()
-
-            except:
+            else:
                 irc.replyError()
 
         else:
@@ -602,10 +421,10 @@ class DuckHunt(callbacks.Plugin):
         Remove <nick>'s best time
         """
         if irc.isChannel(channel):
-            self._read_scores(channel)
-            del self.channeltimes[channel][nick]
-            self._write_scores(channel)
-            irc.replySuccess()
+            if self.store.remove_time(channel, nick):
+                irc.replySuccess()
+            else:
+                irc.replyError()
 
         else:
             irc.error("Are you sure " + str(channel) + " is a channel?")
@@ -618,13 +437,9 @@ class DuckHunt(callbacks.Plugin):
         Remove <nick>'s score
         """
         if irc.isChannel(channel):
-            try:
-                self._read_scores(channel)
-                del self.channelscores[channel][nick]
-                self._write_scores(channel)
+            if self.store.remove_score(channel, nick):
                 irc.replySuccess()
-
-            except:
+            else:
                 irc.replyError()
 
         else:
@@ -640,35 +455,17 @@ class DuckHunt(callbacks.Plugin):
 
         if irc.isChannel(channel):
 
-            self._read_scores(channel)
             self._initdayweekyear(channel)
-            day = self.dow
-            week = self.woy
-
-            if self.channelweek.get(channel):
-                if self.channelweek[channel].get(week):
-                    if self.channelweek[channel][week].get(day):
-                        # Getting all scores, to get the winner of the week
-                        msgstring = ""
-                        scores = sorted(
-                            iter(self.channelweek[channel][week][day].items()),
-                            key=itemgetter(1),
-                            reverse=True,
-                        )
-                        for item in scores:
-                            msgstring += "(x{0}x: {1}) ".format(item[0], str(item[1]))
+            scores = self.store.day_scores(channel, self.year, self.woy, self.dow)
+            msgstring = ""
+            for item in scores:
+                msgstring += "(x{0}x: {1}) ".format(item[0], str(item[1]))
 
-                        if msgstring != "":
-                            irc.reply("Scores for today:")
-                            irc.reply(msgstring)
-                        else:
-                            irc.reply("There aren't any day scores for today yet.")
-                    else:
-                        irc.reply("There aren't any day scores for today yet.")
-                else:
-                    irc.reply("There aren't any day scores for today yet.")
+            if msgstring != "":
+                irc.reply("Scores for today:")
+                irc.reply(msgstring)
             else:
-                irc.reply("There aren't any day scores for this channel yet.")
+                irc.reply("There aren't any day scores for today yet.")
         else:
             irc.reply("Are you sure this is a channel?")
 
@@ -682,78 +479,69 @@ class DuckHunt(callbacks.Plugin):
 
         if irc.isChannel(channel):
 
-            self._read_scores(channel)
+            self._initdayweekyear(channel)
             weekscores = {}
 
             if not week:
                 week = self.woy
 
-            if self.channelweek.get(channel):
-                if self.channelweek[channel].get(week):
-                    # Showing the winner for each day
-                    if not nick:
-                        msgstring = ""
-                        # for each day of week
-                        for i in (1, 2, 3, 4, 5, 6, 7):
-                            if self.channelweek[channel][week].get(i):
-                                # Getting winner of the day
-                                winnernick, winnerscore = max(
-                                    iter(self.channelweek[channel][week][i].items()),
-                                    key=lambda k_v: (k_v[1], k_v[0]),
-                                )
-                                msgstring += "{0}: (x{1}x: {2}) ".format(
-                                    self.dayname[i - 1], winnernick, str(winnerscore)
-                                )
-
-                        # Getting all scores, to get the winner of the week
-                        for i, players in self.channelweek[channel][week].items():
-                            for player, value in players.items():
-                                weekscores.setdefault(player, 0)
-                                weekscores[player] += value
-
-                        if msgstring != "":
-                            irc.reply("Scores for week " + str(week) + ":")
-                            irc.reply(msgstring)
-                            # Who's the winner at this point?
+            days = self.store.week_scores(channel, self.year, week)
+            if days:
+                # Showing the winner for each day
+                if not nick:
+                    msgstring = ""
+                    # for each day of week
+                    for i in (1, 2, 3, 4, 5, 6, 7):
+                        if days.get(i):
+                            # Getting winner of the day
                             winnernick, winnerscore = max(
-                                iter(weekscores.items()),
-                                key=lambda k_v1: (k_v1[1], k_v1[0]),
+                                iter(days[i].items()),
+                                key=lambda k_v: (k_v[1], k_v[0]),
                             )
-                            irc.reply(
-                                "Leader: x%sx with %i points."
-                                % (winnernick, winnerscore)
+                            msgstring += "{0}: (x{1}x: {2}) ".format(
+                                self.dayname[i - 1], winnernick, str(winnerscore)
                             )
 
-                        else:
-                            irc.reply("There aren't any week scores for this week yet.")
+                    # Getting all scores, to get the winner of the week
+                    for i, players in days.items():
+                        for player, value in players.items():
+                            weekscores.setdefault(player, 0)
+                            weekscores[player] += value
+
+                    if msgstring != "":
+                        irc.reply("Scores for week " + str(week) + ":")
+                        irc.reply(msgstring)
+                        # Who's the winner at this point?
+                        winnernick, winnerscore = max(
+                            iter(weekscores.items()),
+                            key=lambda k_v1: (k_v1[1], k_v1[0]),
+                        )
+                        irc.reply(
+                            "Leader: x%sx with %i points." % (winnernick, winnerscore)
+                        )
+
                     else:
-                        # Showing the scores of <nick>
-                        msgstring = ""
-                        total = 0
-                        for i in (1, 2, 3, 4, 5, 6, 7):
-                            if self.channelweek[channel][week].get(i):
-                                if self.channelweek[channel][week][i].get(nick):
-                                    msgstring += "({0}: {1}) ".format(
-                                        self.dayname[i - 1],
-                                        str(
-                                            self.channelweek[channel][week][i].get(nick)
-                                        ),
-                                    )
-                                    total += self.channelweek[channel][week][i].get(
-                                        nick
-                                    )
+                        irc.reply("There aren't any week scores for this week yet.")
+                else:
+                    # Showing the scores of <nick>
+                    msgstring = ""
+                    total = 0
+                    for i in (1, 2, 3, 4, 5, 6, 7):
+                        if days.get(i, {}).get(nick):
+                            msgstring += "({0}: {1}) ".format(
+                                self.dayname[i - 1], str(days[i][nick])
+                            )
+                            total += days[i][nick]
 
-                        if msgstring != "":
-                            irc.reply(nick + " scores for week " + str(self.woy) + ":")
-                            irc.reply(msgstring)
-                            irc.reply("Total: " + str(total) + " points.")
-                        else:
-                            irc.reply("There aren't any week scores for this nick.")
+                    if msgstring != "":
+                        irc.reply(nick + " scores for week " + str(week) + ":")
+                        irc.reply(msgstring)
+                        irc.reply("Total: " + str(total) + " points.")
+                    else:
+                        irc.reply("There aren't any week scores for this nick.")
 
-                else:
-                    irc.reply("There aren't any week scores for this week yet.")
             else:
-                irc.reply("There aren't any week scores for this channel yet.")
+                irc.reply("There aren't any week scores for this week yet.")
         else:
             irc.reply("Are you sure this is a channel?")
 
@@ -766,26 +554,14 @@ class DuckHunt(callbacks.Plugin):
         """
 
         if irc.isChannel(channel):
-            try:
-                self.channelscores[channel]
-            except:
-                self.channelscores[channel] = {}
-
-            self._read_scores(channel)
-
             # How many results do we display?
             if not size:
                 listsize = self.toplist
             else:
                 listsize = size
 
-            # Sort the scores (reversed: the higher the better)
-            scores = sorted(
-                iter(self.channelscores[channel].items()),
-                key=itemgetter(1),
-                reverse=True,
-            )
-            del scores[listsize:]
+            # Sorted by the database (the higher the better)
+            scores = self.store.top_scores(channel, listsize)
 
             msgstring = ""
             for item in scores:
@@ -814,12 +590,8 @@ class DuckHunt(callbacks.Plugin):
         """
 
         if irc.isChannel(channel):
-            self._read_scores(channel)
-            if self.channelscores.get(channel):
-                scores = self.channelscores[channel]
-                total = 0
-                for player, value in scores.items():
-                    total += value
+            total = self.store.total(channel)
+            if total is not None:
                 irc.reply(str(total) + " ducks have been shot in " + channel + "!")
             else:
                 irc.reply("There are no scores for this channel yet")
@@ -836,31 +608,14 @@ class DuckHunt(callbacks.Plugin):
         """
 
         if irc.isChannel(channel):
-            self._read_scores(channel)
-
-            try:
-                self.channeltimes[channel]
-            except:
-                self.channeltimes[channel] = {}
-
-            try:
-                self.channelworsttimes[channel]
-            except:
-                self.channelworsttimes[channel] = {}
-
             # How many results do we display?
             if not size:
                 listsize = self.toplist
             else:
                 listsize = size
 
-            # Sort the times (not reversed: the lower the better)
-            times = sorted(
-                iter(self.channeltimes[channel].items()),
-                key=itemgetter(1),
-                reverse=False,
-            )
-            del times[listsize:]
+            # Sorted by the database (the lower the better)
+            times = self.store.top_times(channel, listsize)
 
             msgstring = ""
             for item in times:
@@ -879,12 +634,7 @@ class DuckHunt(callbacks.Plugin):
             else:
                 irc.reply("There aren't any best times for this channel yet.")
 
-            times = sorted(
-                iter(self.channelworsttimes[channel].items()),
-                key=itemgetter(1),
-                reverse=True,
-            )
-            del times[listsize:]
+            times = self.store.top_worst_times(channel, listsize)
 
             msgstring = ""
             for item in times:
@@ -928,41 +678,28 @@ class DuckHunt(callbacks.Plugin):
         currentChannel = msg.args[0]
 
         if irc.isChannel(currentChannel):
-            if self.started.get(currentChannel) == True:
+            hunt = self.hunts.get((irc.network, currentChannel))
+            if hunt:
+                now = time.time()
 
                 # bangdelay: how much time between the duck was launched and this shot?
-                if self.times[currentChannel]:
-                    bangdelay = time.time() - self.times[currentChannel]
+                if hunt.times:
+                    bangdelay = now - hunt.times
                 else:
                     bangdelay = False
 
                 # Is the player reloading?
-                if (
-                    self.reloading[currentChannel].get(msg.nick)
-                    and time.time() - self.reloading[currentChannel][msg.nick]
-                    < self.reloadtime[currentChannel]
-                    and self.reloadcount[currentChannel][msg.nick] < 1
-                ):
-                    irc.reply(
-                        "You are reloading... (Reloading takes %i seconds)"
-                        % (self.reloadtime[currentChannel])
-                    )
-                    self.reloadcount[currentChannel][msg.nick] += 1
-                    return 0
-                if (
-                    self.reloading[currentChannel].get(msg.nick)
-                    and time.time() - self.reloading[currentChannel][msg.nick]
-                    < self.reloadtime[currentChannel]
-                    and self.reloadcount[currentChannel][msg.nick] > 0
-                ):
-                    try:
-                        self.scores[currentChannel][msg.nick] -= 1
-                    except:
-                        try:
-                            self.scores[currentChannel][msg.nick] = -1
-                        except:
-                            self.scores[currentChannel] = {}
-                            self.scores[currentChannel][msg.nick] = -1
+                reloading = hunt.reloading.get(msg.nick)
+                if reloading and now - reloading < hunt.reloadtime:
+                    if hunt.reloadcount[msg.nick] < 1:
+                        irc.reply(
+                            "You are reloading... (Reloading takes %i seconds)"
+                            % (hunt.reloadtime)
+                        )
+                        hunt.reloadcount[msg.nick] += 1
+                        return 0
+
+                    hunt.scores[msg.nick] = hunt.scores.get(msg.nick, 0) - 1
 
                     # Base message
                     message = "You shot yourself while trying to reload!"
@@ -972,16 +709,10 @@ class DuckHunt(callbacks.Plugin):
                         self.registryValue("kickMode", currentChannel)
                         and irc.nick in irc.state.channels[currentChannel].ops
                     ):
-                        message += (
-                            " Reloading takes %s seconds."
-                            % self.reloadtime[currentChannel]
-                        )
+                        message += " Reloading takes %s seconds." % hunt.reloadtime
 
                     # Adding nick and score
-                    message += " %s: %i" % (
-                        msg.nick,
-                        self.scores[currentChannel][msg.nick],
-                    )
+                    message += " %s: %i" % (msg.nick, hunt.scores[msg.nick])
 
                     # If we were able to have a bangdelay (ie: a duck was launched before someone did bang)
                     if bangdelay:
@@ -1000,54 +731,39 @@ class DuckHunt(callbacks.Plugin):
                     return 0
 
                 # This player is now reloading
-                self.reloading[currentChannel][msg.nick] = time.time()
-                self.reloadcount[currentChannel][msg.nick] = 0
+                hunt.reloading[msg.nick] = now
+                hunt.reloadcount[msg.nick] = 0
 
                 # There was a duck
-                if self.duck[currentChannel] == True:
+                if hunt.duck == True:
 
                     # Did the player missed it?
-                    if random.random() < self.missprobability[currentChannel]:
+                    if random.random() < hunt.missprobability:
                         irc.reply("You missed the duck!")
                     else:
 
                         # Adds one point for the nick that shot the duck
-                        try:
-                            self.scores[currentChannel][msg.nick] += 1
-                        except:
-                            try:
-                                self.scores[currentChannel][msg.nick] = 1
-                            except:
-                                self.scores[currentChannel] = {}
-                                self.scores[currentChannel][msg.nick] = 1
+                        hunt.scores[msg.nick] = hunt.scores.get(msg.nick, 0) + 1
 
                         irc.reply(
                             "\_x< | Score: %i (%.2f seconds)"
-                            % (self.scores[currentChannel][msg.nick], bangdelay)
+                            % (hunt.scores[msg.nick], bangdelay)
                         )
 
-                        self.averagetime[currentChannel] += bangdelay
+                        hunt.averagetime += bangdelay
 
                         # Now save the bang delay for the player (if it's quicker than it's previous bangdelay)
-                        try:
-                            previoustime = self.toptimes[currentChannel][msg.nick]
-                            if bangdelay < previoustime:
-                                self.toptimes[currentChannel][msg.nick] = bangdelay
-                        except:
-                            self.toptimes[currentChannel][msg.nick] = bangdelay
+                        if bangdelay < hunt.toptimes.get(msg.nick, bangdelay + 1):
+                            hunt.toptimes[msg.nick] = bangdelay
 
                         # Now save the bang delay for the player (if it's worst than it's previous bangdelay)
-                        try:
-                            previoustime = self.worsttimes[currentChannel][msg.nick]
-                            if bangdelay > previoustime:
-                                self.worsttimes[currentChannel][msg.nick] = bangdelay
-                        except:
-                            self.worsttimes[currentChannel][msg.nick] = bangdelay
+                        if bangdelay > hunt.worsttimes.get(msg.nick, bangdelay - 1):
+                            hunt.worsttimes[msg.nick] = bangdelay
 
-                        self.duck[currentChannel] = False
+                        hunt.duck = False
 
                         # Reset the basetime for the waiting time before the next duck
-                        self.lastSpoke[currentChannel] = time.time()
+                        hunt.lastSpoke = time.time()
 
                         if self.registryValue("ducks", currentChannel):
                             maxShoots = self.registryValue("ducks", currentChannel)
@@ -1055,33 +771,25 @@ class DuckHunt(callbacks.Plugin):
                             maxShoots = 10
 
                         # End of Hunt
-                        if self.shoots[currentChannel] == maxShoots:
+                        if hunt.shoots == maxShoots:
                             self._end(irc, msg, args)
 
                             # If autorestart is enabled, we restart a hunt automatically!
                             if self.registryValue("autoRestart", currentChannel):
-                                # This code shouldn't be here
-                                self.started[currentChannel] = True
-                                self._initthrottle(irc, msg, args, currentChannel)
-                                if self.scores.get(currentChannel):
-                                    self.scores[currentChannel] = {}
-                                if self.reloading.get(currentChannel):
-                                    self.reloading[currentChannel] = {}
-
-                                self.averagetime[currentChannel] = 0
+                                self._newhunt(irc, currentChannel)
+                            else:
+                                try:
+                                    schedule.removeEvent(
+                                        self._eventname(irc.network, currentChannel)
+                                    )
+                                except KeyError:
+                                    pass
 
                 # There was no duck or the duck has already been shot
                 else:
 
                     # Removes one point for the nick that shot
-                    try:
-                        self.scores[currentChannel][msg.nick] -= 1
-                    except:
-                        try:
-                            self.scores[currentChannel][msg.nick] = -1
-                        except:
-                            self.scores[currentChannel] = {}
-                            self.scores[currentChannel][msg.nick] = -1
+                    hunt.scores[msg.nick] = hunt.scores.get(msg.nick, 0) - 1
 
                     # Base message
                     message = "There was no duck!"
@@ -1094,10 +802,7 @@ class DuckHunt(callbacks.Plugin):
                         message += " You just shot yourself!"
 
                     # Adding nick and score
-                    message += " %s: %i" % (
-                        msg.nick,
-                        self.scores[currentChannel][msg.nick],
-                    )
+                    message += " %s: %i" % (msg.nick, hunt.scores[msg.nick])
 
                     # If we were able to have a bangdelay (ie: a duck was launched before someone did bang)
                     if bangdelay:
@@ -1145,24 +850,20 @@ class DuckHunt(callbacks.Plugin):
         """
 
         currentChannel = msg.args[0]
+        key = (irc.network, currentChannel)
 
         # End the hunt
-        self.started[currentChannel] = False
-
-        try:
-            self.channelscores[currentChannel]
-        except:
-            self.channelscores[currentChannel] = {}
+        hunt = self.hunts.pop(key)
 
         if not self.registryValue("autoRestart", currentChannel):
             irc.reply("The hunt stops now!", prefixNick=False)
 
         # Showing scores
-        if self.scores.get(currentChannel):
+        if hunt.scores:
 
             # Getting winner
             winnernick, winnerscore = max(
-                iter(self.scores.get(currentChannel).items()),
+                iter(hunt.scores.items()),
                 key=lambda k_v12: (k_v12[1], k_v12[0]),
             )
             if self.registryValue("ducks", currentChannel):
@@ -1177,14 +878,14 @@ class DuckHunt(callbacks.Plugin):
                     % (winnernick, winnerscore, maxShoots, self.perfectbonus),
                     prefixNick=False,
                 )
-                self.scores[currentChannel][winnernick] += self.perfectbonus
+                hunt.scores[winnernick] += self.perfectbonus
             else:
                 # Showing scores
                 # irc.reply("Winner: %s with %i points" % (winnernick, winnerscore))
-                # irc.reply(self.scores.get(currentChannel))
+                # irc.reply(hunt.scores)
                 reply = []
                 for nick, score in sorted(
-                    iter(self.scores.get(currentChannel).items()),
+                    iter(hunt.scores.items()),
                     key=itemgetter(1),
                     reverse=True,
                 ):
@@ -1202,18 +903,15 @@ class DuckHunt(callbacks.Plugin):
             # Getting channel best time (to see if the best time of this hunt is better)
             channelbestnick = None
             channelbesttime = None
-            if self.channeltimes.get(currentChannel):
-                channelbestnick, channelbesttime = min(
-                    iter(self.channeltimes.get(currentChannel).items()),
-                    key=lambda k_v5: (k_v5[1], k_v5[0]),
-                )
+            if self.store.best_time(currentChannel):
+                channelbestnick, channelbesttime = self.store.best_time(currentChannel)
 
             # Showing best time
             recordmsg = ""
             try:
-                if self.toptimes.get(currentChannel):
-                    key, value = min(
-                        iter(self.toptimes.get(currentChannel).items()),
+                if hunt.toptimes:
+                    nick, value = min(
+                        iter(hunt.toptimes.items()),
                         key=lambda k_v6: (k_v6[1], k_v6[0]),
                     )
                 if channelbesttime and value < channelbesttime:
@@ -1227,17 +925,16 @@ class DuckHunt(callbacks.Plugin):
                     )
                 else:
                     try:
-                        if value < self.channeltimes[currentChannel][key]:
+                        previous = self.store.get_times(currentChannel, nick)[0]
+                        if value < previous:
                             recordmsg = (
                                 " (this is your new record in this channel! Your"
-                                " previous record was "
-                                + str(round(self.channeltimes[currentChannel][key], 2))
-                                + ")"
+                                " previous record was " + str(round(previous, 2)) + ")"
                             )
                     except:
                         recordmsg = ""
                 irc.reply(
-                    "Best time: %s with %.2f seconds%s" % (key, value, recordmsg),
+                    "Best time: %s with %.2f seconds%s" % (nick, value, recordmsg),
                     prefixNick=False,
                 )
             except:
@@ -1246,18 +943,17 @@ class DuckHunt(callbacks.Plugin):
             # Getting channel worst time (to see if the worst time of this hunt is worst)
             channelworstnick = None
             channelworsttime = None
-            if self.channelworsttimes.get(currentChannel):
-                channelworstnick, channelworsttime = max(
-                    iter(self.channelworsttimes.get(currentChannel).items()),
-                    key=lambda k_v7: (k_v7[1], k_v7[0]),
+            if self.store.worst_time(currentChannel):
+                channelworstnick, channelworsttime = self.store.worst_time(
+                    currentChannel
                 )
 
             # Showing worst time
             recordmsg = ""
             try:
-                if self.worsttimes.get(currentChannel):
-                    key, value = max(
-                        iter(self.worsttimes.get(currentChannel).items()),
+                if hunt.worsttimes:
+                    nick, value = max(
+                        iter(hunt.worsttimes.items()),
                         key=lambda k_v8: (k_v8[1], k_v8[0]),
                     )
                 if channelworsttime and value > channelworsttime:
@@ -1271,15 +967,12 @@ class DuckHunt(callbacks.Plugin):
                     )
                 else:
                     try:
-                        if value > self.channelworsttimes[currentChannel][key]:
+                        previous = self.store.get_times(currentChannel, nick)[1]
+                        if value > previous:
                             recordmsg = (
                                 " (this is your new longest time in this channel! Your"
                                 " previous longest time was "
-                                + str(
-                                    round(
-                                        self.channelworsttimes[currentChannel][key], 2
-                                    )
-                                )
+                                + str(round(previous, 2))
                                 + ")"
                             )
                     except:
@@ -1290,102 +983,71 @@ class DuckHunt(callbacks.Plugin):
             # Only display worst time if something new
             if recordmsg != "":
                 irc.reply(
-                    "Longest time: %s with %.2f seconds%s" % (key, value, recordmsg),
+                    "Longest time: %s with %.2f seconds%s" % (nick, value, recordmsg),
                     prefixNick=False,
                 )
 
             # Showing average shooting time:
-            # if (self.shoots[currentChannel] > 1):
-            # irc.reply("Average shooting time: %.2f seconds" % ((self.averagetime[currentChannel] / self.shoots[currentChannel])))
+            # if (hunt.shoots > 1):
+            # irc.reply("Average shooting time: %.2f seconds" % ((hunt.averagetime / hunt.shoots)))
 
             # Write the scores and times to disk
-            self._calc_scores(currentChannel)
-            self._write_scores(currentChannel)
+            self._initdayweekyear(currentChannel)
+            self._save_scores(hunt)
 
             # Did someone took the lead?
             weekscores = {}
-            if self.channelweek.get(currentChannel):
-                if self.channelweek[currentChannel].get(self.woy):
-                    # for each day of week
-                    for i in (1, 2, 3, 4, 5, 6, 7):
-                        if self.channelweek[currentChannel][self.woy].get(i):
-                            # Getting all scores, to get the winner of the week
-                            for i, players in self.channelweek[currentChannel][
-                                self.woy
-                            ].items():
-                                for player, value in players.items():
-                                    weekscores.setdefault(player, 0)
-                                    weekscores[player] += value
-                            winnernick, winnerscore = max(
-                                iter(weekscores.items()),
-                                key=lambda k_v3: (k_v3[1], k_v3[0]),
-                            )
-                            if winnernick != self.leader[currentChannel]:
-                                if self.leader[currentChannel] != None:
-                                    irc.reply(
-                                        "%s took the lead for the week over %s with %i"
-                                        " points."
-                                        % (
-                                            winnernick,
-                                            self.leader[currentChannel],
-                                            winnerscore,
-                                        ),
-                                        prefixNick=False,
-                                    )
-                                else:
-                                    irc.reply(
-                                        "%s has the lead for the week with %i points."
-                                        % (winnernick, winnerscore),
-                                        prefixNick=False,
-                                    )
-                                self.leader[currentChannel] = winnernick
+            days = self.store.week_scores(currentChannel, self.year, self.woy)
+            for i, players in days.items():
+                # Getting all scores, to get the winner of the week
+                for player, value in players.items():
+                    weekscores.setdefault(player, 0)
+                    weekscores[player] += value
+            if weekscores:
+                winnernick, winnerscore = max(
+                    iter(weekscores.items()),
+                    key=lambda k_v3: (k_v3[1], k_v3[0]),
+                )
+                if winnernick != self.leader.get(key):
+                    if self.leader.get(key) != None:
+                        irc.reply(
+                            "%s took the lead for the week over %s with %i points."
+                            % (winnernick, self.leader[key], winnerscore),
+                            prefixNick=False,
+                        )
+                    else:
+                        irc.reply(
+                            "%s has the lead for the week with %i points."
+                            % (winnernick, winnerscore),
+                            prefixNick=False,
+                        )
+                    self.leader[key] = winnernick
         else:
             irc.reply("Not a single duck was shot during this hunt!", prefixNick=False)
 
-        # Reinit current hunt scores
-        if self.scores.get(currentChannel):
-            self.scores[currentChannel] = {}
-
-        # Reinit current hunt times
-        if self.toptimes.get(currentChannel):
-            self.toptimes[currentChannel] = {}
-        if self.worsttimes.get(currentChannel):
-            self.worsttimes[currentChannel] = {}
-
-        # No duck lauched
-        self.duck[currentChannel] = False
-
-        # Reinit number of shoots
-        self.shoots[currentChannel] = 0
-
     def _launch(self, irc, msg, args):
         """
         Launch a duck
         """
         currentChannel = msg.args[0]
         if irc.isChannel(currentChannel):
-            if self.started[currentChannel] == True:
-                if self.duck[currentChannel] == False:
+            hunt = self.hunts.get((irc.network, currentChannel))
+            if hunt:
+                if hunt.duck == False:
 
                     # Store the time when the duck has been launched
-                    self.times[currentChannel] = time.time()
+                    hunt.times = time.time()
 
                     # Store the fact that there's a duck now
-                    self.duck[currentChannel] = True
+                    hunt.duck = True
 
                     # Send message directly (instead of queuing it with irc.reply)
                     irc.sendMsg(ircmsgs.privmsg(currentChannel, "\_o< quack!"))
 
-                    # Define a new throttle[currentChannel] for the next launch
-                    self.throttle[currentChannel] = random.randint(
-                        self.minthrottle[currentChannel],
-                        self.maxthrottle[currentChannel],
-                    )
+                    # Define a new throttle for the next launch
+                    hunt.throttle = random.randint(hunt.minthrottle, hunt.maxthrottle)
 
-                    try:
-                        self.shoots[currentChannel] += 1
-                    except:
-                        self.shoots[currentChannel] = 1
+                    hunt.shoots += 1
                 else:
 
                     irc.reply("Already a duck")
@@ -0,0 +1,342 @@
+###
+# Copyright (c) 2012, Matthias Meusburger
+# Copyright (c) 2020, oddluck <oddluck@riseup.net>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+###
+
+import os
+import pickle
+import re
+import sqlite3
+import threading
+
+
+class ScoreStore(object):
+    """
+    Saved DuckHunt scores and times, in a SQLite database. Each hunt only
+    updates the rows of the players who took part in it.
+    """
+
+    def __init__(self, filename):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(filename, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.conn:
+            self.conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS scores (
+                    channel TEXT, nick TEXT, score INTEGER,
+                    PRIMARY KEY (channel, nick)) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS times (
+                    channel TEXT, nick TEXT, best REAL, worst REAL,
+                    PRIMARY KEY (channel, nick)) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS dayscores (
+                    channel TEXT, year INTEGER, week INTEGER, day INTEGER,
+                    nick TEXT, score INTEGER,
+                    PRIMARY KEY (channel, year, week, day, nick)) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY, value TEXT);
+                CREATE INDEX IF NOT EXISTS scores_rank
+                    ON scores (channel, score);
+                CREATE INDEX IF NOT EXISTS times_best ON times (channel, best);
+                CREATE INDEX IF NOT EXISTS times_worst ON times (channel, worst);
+                """
+            )
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def _query(self, sql, args=()):
+        with self.lock:
+            return self.conn.execute(sql, args).fetchall()
+
+    # Scores
+
+    def get_score(self, channel, nick):
+        rows = self._query(
+            "SELECT score FROM scores WHERE channel = ? AND nick = ?", (channel, nick)
+        )
+        return rows[0][0] if rows else None
+
+    def top_scores(self, channel, limit):
+        return self._query(
+            "SELECT nick, score FROM scores WHERE channel = ?"
+            " ORDER BY score DESC LIMIT ?",
+            (channel, limit),
+        )
+
+    def total(self, channel):
+        "Return the sum of all scores in channel, or None if there are none."
+        return self._query(
+            "SELECT SUM(score) FROM scores WHERE channel = ?", (channel,)
+        )[0][0]
+
+    def remove_score(self, channel, nick):
+        "Remove nick's score. Returns False if there was none."
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                "DELETE FROM scores WHERE channel = ? AND nick = ?", (channel, nick)
+            )
+            return cursor.rowcount > 0
+
+    # Times
+
+    def get_times(self, channel, nick):
+        "Return nick's (best, worst) times, or None."
+        rows = self._query(
+            "SELECT best, worst FROM times WHERE channel = ? AND nick = ?",
+            (channel, nick),
+        )
+        return rows[0] if rows else None
+
+    def best_time(self, channel):
+        "Return the (nick, time) holding the channel record, or None."
+        rows = self._query(
+            "SELECT nick, best FROM times WHERE channel = ? AND best IS NOT NULL"
+            " ORDER BY best, nick LIMIT 1",
+            (channel,),
+        )
+        return rows[0] if rows else None
+
+    def worst_time(self, channel):
+        "Return the (nick, time) holding the channel's longest time, or None."
+        rows = self._query(
+            "SELECT nick, worst FROM times WHERE channel = ? AND worst IS NOT NULL"
+            " ORDER BY worst DESC, nick DESC LIMIT 1",
+            (channel,),
+        )
+        return rows[0] if rows else None
+
+    def top_times(self, channel, limit):
+        return self._query(
+            "SELECT nick, best FROM times WHERE channel = ? AND best IS NOT NULL"
+            " ORDER BY best LIMIT ?",
+            (channel, limit),
+        )
+
+    def top_worst_times(self, channel, limit):
+        return self._query(
+            "SELECT nick, worst FROM times WHERE channel = ? AND worst IS NOT NULL"
+            " ORDER BY worst DESC LIMIT ?",
+            (channel, limit),
+        )
+
+    def remove_time(self, channel, nick):
+        "Remove nick's best time. Returns False if there was none."
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                "UPDATE times SET best = NULL WHERE channel = ? AND nick = ?"
+                " AND best IS NOT NULL",
+                (channel, nick),
+            )
+            return cursor.rowcount > 0
+
+    # Day and week scores
+
+    def day_scores(self, channel, year, week, day):
+        return self._query(
+            "SELECT nick, score FROM dayscores WHERE channel = ? AND year = ?"
+            " AND week = ? AND day = ? ORDER BY score DESC",
+            (channel, year, week, day),
+        )
+
+    def week_scores(self, channel, year, week):
+        "Return a {day: {nick: score}} dict for the week."
+        days = {}
+        for day, nick, score in self._query(
+            "SELECT day, nick, score FROM dayscores WHERE channel = ? AND year = ?"
+            " AND week = ?",
+            (channel, year, week),
+        ):
+            days.setdefault(day, {})[nick] = score
+        return days
+
+    # Updates
+
+    def add_hunt(self, channel, scores, toptimes, worsttimes, year, week, day):
+        """
+        Add the scores and times of a finished hunt, in a single transaction.
+        """
+        with self.lock, self.conn:
+            for nick, score in scores.items():
+                self.conn.execute(
+                    "INSERT INTO scores VALUES (?, ?, ?) ON CONFLICT (channel, nick)"
+                    " DO UPDATE SET score = score + excluded.score",
+                    (channel, nick, score),
+                )
+                self.conn.execute(
+                    "INSERT INTO dayscores VALUES (?, ?, ?, ?, ?, ?)"
+                    " ON CONFLICT (channel, year, week, day, nick)"
+                    " DO UPDATE SET score = score + excluded.score",
+                    (channel, year, week, day, nick, score),
+                )
+            for nick in set(toptimes) | set(worsttimes):
+                self.conn.execute(
+                    "INSERT INTO times VALUES (?, ?, ?, ?) ON CONFLICT (channel, nick)"
+                    " DO UPDATE SET"
+                    " best = MIN(COALESCE(best, excluded.best), excluded.best),"
+                    " worst = MAX(COALESCE(worst, excluded.worst), excluded.worst)",
+                    (channel, nick, toptimes.get(nick), worsttimes.get(nick)),
+                )
+
+    def merge_scores(self, channel, nickto, nickfrom):
+        "Give nickfrom's total score to nickto. Returns False if nickfrom has none."
+        with self.lock, self.conn:
+            rows = self.conn.execute(
+                "SELECT score FROM scores WHERE channel = ? AND nick = ?",
+                (channel, nickfrom),
+            ).fetchall()
+            if not rows:
+                return False
+            self.conn.execute(
+                "INSERT INTO scores VALUES (?, ?, ?) ON CONFLICT (channel, nick)"
+                " DO UPDATE SET score = score + excluded.score",
+                (channel, nickto, rows[0][0]),
+            )
+            self.conn.execute(
+                "DELETE FROM scores WHERE channel = ? AND nick = ?", (channel, nickfrom)
+            )
+            return True
+
+    def merge_day_scores(self, channel, nickto, nickfrom, year, week, day):
+        "Give nickfrom's score of the day to nickto. Returns False if it has none."
+        key = (channel, year, week, day)
+        with self.lock, self.conn:
+            rows = self.conn.execute(
+                "SELECT score FROM dayscores WHERE channel = ? AND year = ?"
+                " AND week = ? AND day = ? AND nick = ?",
+                key + (nickfrom,),
+            ).fetchall()
+            if not rows:
+                return False
+            self.conn.execute(
+                "INSERT INTO dayscores VALUES (?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (channel, year, week, day, nick)"
+                " DO UPDATE SET score = score + excluded.score",
+                key + (nickto, rows[0][0]),
+            )
+            self.conn.execute(
+                "DELETE FROM dayscores WHERE channel = ? AND year = ? AND week = ?"
+                " AND day = ? AND nick = ?",
+                key + (nickfrom,),
+            )
+            return True
+
+    def merge_times(self, channel, nickto, nickfrom):
+        """
+        Give nickfrom's best and worst times to nickto where they beat nickto's
+        own. Returns False if either nick has no times.
+        """
+        with self.lock, self.conn:
+            rows = self.conn.execute(
+                "SELECT nick FROM times WHERE channel = ? AND nick IN (?, ?)",
+                (channel, nickto, nickfrom),
+            ).fetchall()
+            if len(rows) != 2:
+                return False
+            self.conn.execute(
+                "UPDATE times SET"
+                " best = MIN(COALESCE(times.best, f.best),"
+                " COALESCE(f.best, times.best)),"
+                " worst = MAX(COALESCE(times.worst, f.worst),"
+                " COALESCE(f.worst, times.worst))"
+                " FROM (SELECT best, worst FROM times WHERE channel = ? AND nick = ?)"
+                " AS f WHERE times.channel = ? AND times.nick = ?",
+                (channel, nickfrom, channel, nickto),
+            )
+            self.conn.execute(
+                "DELETE FROM times WHERE channel = ? AND nick = ?", (channel, nickfrom)
+            )
+            return True
+
+    # Old pickle files
+
+    def import_pickles(self, directory, prefix):
+        """
+        Import the scores, times and week scores pickled by older versions of
+        the plugin. This only happens once; the old files are left in place.
+        """
+        with self.lock:
+            done = self.conn.execute(
+                "SELECT value FROM meta WHERE key = 'imported'"
+            ).fetchall()
+        if done or not os.path.isdir(directory):
+            return
+        pattern = re.compile(
+            r"^%s(.+?)(?:\.(scores|times|worsttimes)|(\d{4})\.weekscores)$"
+            % re.escape(prefix)
+        )
+        scores = {}
+        times = {}
+        worsttimes = {}
+        weeks = []
+        for name in os.listdir(directory):
+            match = pattern.match(name)
+            if not match:
+                continue
+            channel, kind, year = match.groups()
+            try:
+                with open(os.path.join(directory, name), "rb") as f:
+                    data = pickle.load(f)
+            except Exception:
+                continue
+            if kind == "scores":
+                scores[channel] = data
+            elif kind == "times":
+                times[channel] = data
+            elif kind == "worsttimes":
+                worsttimes[channel] = data
+            else:
+                weeks.append((channel, int(year), data))
+        with self.lock, self.conn:
+            for channel, players in scores.items():
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO scores VALUES (?, ?, ?)",
+                    [(channel, nick, score) for nick, score in players.items()],
+                )
+            for channel in set(times) | set(worsttimes):
+                best = times.get(channel, {})
+                worst = worsttimes.get(channel, {})
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO times VALUES (?, ?, ?, ?)",
+                    [
+                        (channel, nick, best.get(nick), worst.get(nick))
+                        for nick in set(best) | set(worst)
+                    ],
+                )
+            for channel, year, data in weeks:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO dayscores VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (channel, year, week, day, nick, score)
+                        for week, days in data.items()
+                        for day, players in days.items()
+                        for nick, score in players.items()
+                    ],
+                )
+            self.conn.execute("INSERT INTO meta VALUES ('imported', '1')")
@@ -63,9 +63,15 @@ __contributors__ = {
 __url__ = "https://github.com/oddluck/limnoria-plugins/"
 
 from . import config
+from . import store
+from . import prefetch
+from . import matching
 from . import plugin
 from imp import reload
 
+reload(store)
+reload(prefetch)
+reload(matching)
 reload(plugin)  # In case we're being reloaded.
 reload(config)
 # Add more reloads here if you add third-party modules and want them to be
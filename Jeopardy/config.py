@@ -153,6 +153,20 @@ conf.registerGlobalValue(
     ),
 )
 
+conf.registerGlobalValue(
+    Jeopardy,
+    "httpFallback",
+    registry.Boolean(
+        True,
+        _(
+            """
+            Fetch clues from jserviceUrl when the local clue database (filled with
+            the importclues command) is empty or has no matching clues.
+            """
+        ),
+    ),
+)
+
 conf.registerChannelValue(
     Jeopardy,
     "defaultRoundLength",
@@ -0,0 +1,119 @@
+###
+# Copyright (c) 2010, quantumlemur
+# Copyright (c) 2011, Valentin Lorentz
+# Copyright (c) 2020, oddluck <oddluck@riseup.net>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+###
+
+from unidecode import unidecode
+import collections
+import re
+import textdistance
+
+try:
+    from rapidfuzz.distance import JaroWinkler
+except ImportError:
+    JaroWinkler = None
+
+
+def clean(text):
+    text = unidecode(text)
+    if len(text) > 2:
+        text = re.sub("[^a-zA-Z0-9 ]+", "", text)
+        text = re.sub("^a |^an |^the |^or ", "", text).replace(" ", "")
+    else:
+        text = re.sub("[^a-zA-Z0-9]+", "", text)
+    return text
+
+
+def jaro_winkler(s1, s2, cutoff=0.0):
+    "Jaro-Winkler similarity; may return 0 if it is below cutoff."
+    if JaroWinkler is not None:
+        # rapidfuzz checks the cutoff against its own intermediate results,
+        # which can be a rounding error below the similarity it returns.
+        return JaroWinkler.similarity(s1, s2, score_cutoff=max(cutoff - 1e-5, 0))
+    return textdistance.jaro_winkler(s1, s2)
+
+
+def _upper_bound(common, len1, len2):
+    """
+    The best Jaro-Winkler similarity two strings of these lengths sharing at
+    most common characters can have.
+    """
+    jaro = (common / len1 + common / len2 + 1) / 3
+    if jaro > 0.7:
+        # At most four prefix characters, each closing a tenth of the gap.
+        jaro += 0.4 * (1 - jaro)
+    return jaro
+
+
+class AnswerMatcher(object):
+    """
+    The accepted answers to a clue, normalized and cleaned once when the clue
+    is asked, so checking a guess only has to clean the guess. Fuzzy matching
+    is skipped for answers whose length or characters rule out a match.
+    """
+
+    def __init__(self, answers):
+        plain = [" ".join(answer.split()).lower() for answer in answers]
+        self.plain = set(plain)
+        self.cleaned = [clean(answer) for answer in plain]
+        self.exact = set(self.cleaned)
+        self.counts = [collections.Counter(answer) for answer in self.cleaned]
+        self.jaccard = "," in answers[0] or "&" in answers[0]
+
+    def match(self, guess, flexibility):
+        guess = " ".join(guess.split()).lower()
+        if guess in self.plain:
+            return True
+        guess = clean(guess)
+        if guess in self.exact:
+            return True
+        if not 0.5 < flexibility < 1 or not guess:
+            return False
+        counts = None
+        for (answer, answer_counts) in zip(self.cleaned, self.counts):
+            if not answer:
+                continue
+            shortest = min(len(guess), len(answer))
+            longest = max(len(guess), len(answer))
+            if _upper_bound(shortest, len(guess), len(answer)) < flexibility and (
+                not self.jaccard or shortest / longest < flexibility
+            ):
+                continue
+            if counts is None:
+                counts = collections.Counter(guess)
+            common = sum((counts & answer_counts).values())
+            if _upper_bound(common, len(guess), len(answer)) >= flexibility:
+                if jaro_winkler(guess, answer, flexibility) >= flexibility:
+                    return True
+            # Character multiset Jaccard index, for "x, y" and "x & y" answers.
+            if self.jaccard:
+                union = len(guess) + len(answer) - common
+                if common / union >= flexibility:
+                    return True
+        return False
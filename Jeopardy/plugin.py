@@ -31,7 +31,6 @@
 
 
 from bs4 import BeautifulSoup
-from ftfy import fix_text
 from jinja2 import Template
 from supybot.commands import *
 import math
@@ -39,7 +38,6 @@ import os
 import random
 import re
 import requests
-from unidecode import unidecode
 import json
 import string
 import supybot.callbacks as callbacks
@@ -51,9 +49,11 @@ import supybot.log as log
 import supybot.plugins as plugins
 import supybot.schedule as schedule
 import supybot.utils as utils
-import textdistance
 import time
 
+from .matching import AnswerMatcher
+from .prefetch import Prefetcher
+from .store import ClueStore, ScoreStore, normalize, read_clues
 
 class Jeopardy(callbacks.Plugin):
     """Jeopardy! an IRC Trivia Game"""
@@ -65,7 +65,21 @@ class Jeopardy(callbacks.Plugin):
         self.__parent.__init__(irc)
         self.games = requests.structures.CaseInsensitiveDict()
         self.history = requests.structures.CaseInsensitiveDict()
+        self.prefetchers = requests.structures.CaseInsensitiveDict()
         self.jserviceUrl = self.registryValue("jserviceUrl").strip("/")
+        directory = conf.supybot.directories.data.dirize("jeopardy")
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.clues = ClueStore(os.path.join(directory, "clues.db"))
+        self.scores = ScoreStore(os.path.join(directory, "scores.db"))
+        self.scores.import_files(directory)
+
+    def die(self):
+        for prefetcher in self.prefetchers.values():
+            prefetcher.stop()
+        self.clues.close()
+        self.scores.close()
+        self.__parent.die()
 
     def doPrivmsg(self, irc, msg):
         channel = msg.channel
@@ -91,12 +105,12 @@ class Jeopardy(callbacks.Plugin):
             plugin,
         ):
             self.registryValue = plugin.registryValue
-            defaultPoints = self.registryValue("defaultPointValue")
             self.active = True
             self.answered = 0
             self.blankChar = self.registryValue("blankChar", channel)
             self.categories = categories
             self.channel = channel
+            self.clues = plugin.clues
             self.correct = True
             if restart:
                 self.correct_template = Template(
@@ -108,12 +122,11 @@ class Jeopardy(callbacks.Plugin):
                 )
             self.currentHint = ""
             self.delay = self.registryValue("delay", channel)
-            self.directory = conf.supybot.directories.data.dirize("jeopardy/")
             self.flexibility = self.registryValue("flexibility", channel)
             self.games = plugin.games
             self.hint_template = Template(self.registryValue("template.hint", channel))
             self.history = plugin.history
-            self.historyFile = "{0}/history_{1}.txt".format(self.directory, channel)
+            self.prefetchers = plugin.prefetchers
             self.irc = irc
             self.jserviceUrl = plugin.jserviceUrl
             self.num = num
@@ -129,13 +142,11 @@ class Jeopardy(callbacks.Plugin):
                 self.question_template = Template(
                     self.registryValue("template.question", channel)
                 )
-            self.questions = []
             self.points = 0
             self.reduction = self.registryValue("hintReduction", self.channel)
             self.restart = restart
             self.roundscores = requests.structures.CaseInsensitiveDict()
-            self.scoreFile = "{0}/scores_{1}.txt".format(self.directory, channel)
-            self.scores = requests.structures.CaseInsensitiveDict()
+            self.scores = plugin.scores
             self.showBlank = showBlank
             self.showHints = showHints
             self.showTime = showTime
@@ -151,36 +162,101 @@ class Jeopardy(callbacks.Plugin):
                 self.waitTime = timeout / (hints + 1)
             elif timeout > 0 and showTime:
                 self.waitTime = timeout / (self.timeReplies + 1)
-            if not os.path.exists(self.directory):
-                os.makedirs(self.directory)
             if self.registryValue("keepHistory", channel):
-                if not os.path.exists(self.historyFile):
-                    f = open(self.historyFile, "w")
-                    f.close()
-                if not self.history.get(channel):
-                    self.history[channel] = []
-                    f = open(self.historyFile, "r")
-                    lines = f.readlines()
-                    for line in lines:
-                        self.history[channel].append(int(line))
-                    f.close()
-            if not os.path.exists(self.scoreFile):
-                f = open(self.scoreFile, "w")
-                f.close()
-            if not self.scores:
-                f = open(self.scoreFile, "r")
-                lines = f.readlines()
-                for line in lines:
-                    (name, score) = line.split(" ")
-                    self.scores[name] = int(score)
-                f.close()
-            cluecount = self.num
-            asked = []
+                if channel not in self.history:
+                    self.history[channel] = self.scores.history(channel)
+            self.prefetcher = self.prefetchers.get(channel)
+            if self.prefetcher and self.prefetcher.key == categories == "random":
+                # Random rounds (and restarts) keep using the clues buffered
+                # while the last round was played.
+                self.prefetcher.resume()
+            else:
+                if self.prefetcher:
+                    self.prefetcher.stop()
+                self.fetched = {}
+                self.prefetcher = Prefetcher(self.fetch, num, num // 2, key=categories)
+                self.prefetchers[channel] = self.prefetcher
+            self.prefetcher.when_ready(self.begin)
+
+        def begin(self):
+            if not self.active:
+                return
+            available = self.prefetcher.available()
+            if self.prefetcher.exhausted and available < self.num:
+                self.total = self.num = available
+            if self.num == 0:
+                self.reply("Sorry, no questions available.")
+                self.stop()
+                return
+            self.newquestion()
+
+        def fetch(self, count, seen):
+            """
+            Return up to count new questions that haven't been asked in the
+            channel. Runs in the prefetcher's worker thread.
+            """
+            exclude = set(seen)
+            if self.registryValue("keepHistory", self.channel):
+                exclude.update(self.history[self.channel])
+            questions = []
+            if self.clues.has_clues():
+                questions = self.localQuestions(count, exclude)
+            if not questions and self.registryValue("httpFallback"):
+                questions = self.fetchQuestions(count, exclude)
+            if self.shuffled or self.registryValue("randomize", self.channel):
+                random.shuffle(questions)
+            return questions
+
+        def localQuestions(self, count, exclude):
+            defaultPoints = self.registryValue("defaultPointValue")
             if self.categories == "random":
-                n = 0
-                while n <= self.num:
-                    if n == self.num:
-                        break
+                clues = self.clues.random_clues(count, exclude)
+            else:
+                clues = self.clues.category_clues(
+                    self.categories, count, self.shuffled, exclude
+                )
+            return [
+                "{0}|{1}|{2}|{3}|{4}|{5}|local".format(
+                    id, airdate, points or defaultPoints, category, clue, answer
+                )
+                for (id, airdate, points, category, clue, answer) in clues
+            ]
+
+        def fetchQuestions(self, count, exclude):
+            defaultPoints = self.registryValue("defaultPointValue")
+            questions = []
+            asked = set(exclude)
+
+            def add(item):
+                id = item["id"]
+                clue = item["question"].strip()
+                airdate = item["airdate"].split("T")[0]
+                answer = item["answer"].strip()
+                category = string.capwords(item["category"]["title"])
+                invalid = item["invalid_count"]
+                points = defaultPoints
+                if item.get("value"):
+                    try:
+                        points = int(item["value"])
+                    except:
+                        pass
+                if (
+                    clue
+                    and airdate
+                    and answer
+                    and category
+                    and not invalid
+                    and id not in asked
+                    and answer != "="
+                ):
+                    q = "{0}|{1}|{2}|{3}|{4}|{5}".format(
+                        id, airdate, points, category, clue, answer
+                    )
+                    questions.append(normalize(q))
+                    asked.add(id)
+
+            if self.categories == "random":
+                while len(questions) < count:
                     try:
                         if self.jserviceUrl == "http://jservice.io":
                             data = requests.get(
@@ -190,232 +266,67 @@ class Jeopardy(callbacks.Plugin):
                         else:
                             data = requests.get(
                                 "{0}/api/random?count={1}".format(
-                                    self.jserviceUrl, self.num + 5
+                                    self.jserviceUrl, count + 5
                                 ),
                                 timeout=5,
                             )
                             data = json.loads(data.content.decode())
                             if not data:
-                                n += 1
                                 break
                         for item in data:
-                            if n == self.num:
+                            if len(questions) == count:
                                 break
-                            id = item["id"]
-                            clue = item["question"].strip()
-                            airdate = item["airdate"].split("T")[0]
-                            answer = item["answer"].strip()
-                            category = string.capwords(item["category"]["title"])
-                            invalid = item["invalid_count"]
-                            points = defaultPoints
-                            if item.get("value"):
-                                try:
-                                    points = int(item["value"])
-                                except:
-                                    pass
-                            if self.registryValue("keepHistory", channel):
-                                if (
-                                    clue
-                                    and airdate
-                                    and answer
-                                    and category
-                                    and not invalid
-                                    and id not in asked
-                                    and id not in self.history[channel]
-                                    and answer != "="
-                                ):
-                                    q = "{0}|{1}|{2}|{3}|{4}|{5}".format(
-                                        id, airdate, points, category, clue, answer
-                                    )
-                                    q = self.normalize(q)
-                                    self.questions.append(q)
-                                    asked.append(id)
-                                    n += 1
-                            else:
-                                if (
-                                    clue
-                                    and airdate
-                                    and answer
-                                    and category
-                                    and not invalid
-                                    and id not in asked
-                                    and answer != "="
-                                ):
-                                    q = "{0}|{1}|{2}|{3}|{4}|{5}".format(
-                                        id, airdate, points, category, clue, answer
-                                    )
-                                    q = self.normalize(q)
-                                    self.questions.append(q)
-                                    asked.append(id)
-                                    n += 1
+                            add(item)
                     except Exception as e:
                         log.error("Jeopardy: Error: {0}".format(e))
                         break
-            else:
-                n = 0
-                k = 0
-                while n <= self.num:
-                    if n == self.num or k > len(self.categories):
-                        break
-                    for category in self.categories:
-                        if n == self.num or k > len(self.categories):
+                return questions
+            pools = []
+            for category in self.categories:
+                try:
+                    pools.append(self.fetchCategory(int(category)))
+                except Exception as e:
+                    log.error("Jeopardy: Error: {0}".format(e))
+            # With --shuffle, spread the start of the round over all categories.
+            if self.shuffled:
+                for data in pools:
+                    start = len(questions)
+                    for item in data:
+                        if len(questions) == count:
                             break
-                        try:
-                            category = int(category)
-                            data = requests.get(
-                                "{0}/api/clues?category={1}".format(
-                                    self.jserviceUrl, category
-                                )
-                            )
-                            data = json.loads(data.content.decode())
-                            if not data:
-                                k += 1
-                                break
-                            cluecount = data[0]["category"]["clues_count"]
-                            if cluecount < self.num and len(self.categories) == 1:
-                                self.num = cluecount
-                            if cluecount > 100:
-                                data.extend(
-                                    json.loads(
-                                        requests.get(
-                                            "{0}/api/clues?&category={1}&offset=100"
-                                            .format(self.jserviceUrl, category),
-                                            timeout=5,
-                                        ).content.decode()
-                                    )
-                                )
-                            if cluecount > 200:
-                                data.extend(
-                                    json.loads(
-                                        requests.get(
-                                            "{0}/api/clues?&category={1}&offset=200"
-                                            .format(self.jserviceUrl, category),
-                                            timeout=5,
-                                        ).content.decode()
-                                    )
-                                )
-                            if cluecount > 300:
-                                data.extend(
-                                    json.loads(
-                                        requests.get(
-                                            "{0}/api/clues?&category={1}&offset=300"
-                                            .format(self.jserviceUrl, category),
-                                            timeout=5,
-                                        ).content.decode()
-                                    )
-                                )
-                            if cluecount > 400:
-                                data.extend(
-                                    json.loads(
-                                        requests.get(
-                                            "{0}/api/clues?&category={1}&offset=400"
-                                            .format(self.jserviceUrl, category),
-                                            timeout=5,
-                                        ).content.decode()
-                                    )
-                                )
-                            if cluecount > 500:
-                                data.extend(
-                                    json.loads(
-                                        requests.get(
-                                            "{0}/api/clues?&category={1}&offset=500"
-                                            .format(self.jserviceUrl, category),
-                                            timeout=5,
-                                        ).content.decode()
-                                    )
-                                )
-                            j = 0
-                            for item in data:
-                                if n == self.num or k > len(self.categories):
-                                    break
-                                elif shuffle and k == len(self.categories):
-                                    shuffle = False
-                                    k = 0
-                                    pass
-                                elif shuffle and j >= self.num * 0.2:
-                                    break
-                                id = item["id"]
-                                clue = item["question"].strip()
-                                airdate = item["airdate"].split("T")[0]
-                                answer = item["answer"].strip()
-                                category = string.capwords(item["category"]["title"])
-                                invalid = item["invalid_count"]
-                                points = defaultPoints
-                                if item.get("value"):
-                                    try:
-                                        points = int(item["value"])
-                                    except:
-                                        pass
-                                if self.registryValue("keepHistory", channel):
-                                    if (
-                                        clue
-                                        and airdate
-                                        and answer
-                                        and category
-                                        and not invalid
-                                        and id not in asked
-                                        and id not in self.history[channel]
-                                        and answer != "="
-                                    ):
-                                        q = "{0}|{1}|{2}|{3}|{4}|{5}".format(
-                                            id, airdate, points, category, clue, answer
-                                        )
-                                        q = self.normalize(q)
-                                        self.questions.append(q)
-                                        asked.append(id)
-                                        n += 1
-                                        j += 1
-                                else:
-                                    if (
-                                        clue
-                                        and airdate
-                                        and answer
-                                        and category
-                                        and not invalid
-                                        and id not in asked
-                                        and answer != "="
-                                    ):
-                                        q = "{0}|{1}|{2}|{3}|{4}|{5}".format(
-                                            id, airdate, points, category, clue, answer
-                                        )
-                                        q = self.normalize(q)
-                                        self.questions.append(q)
-                                        asked.append(id)
-                                        n += 1
-                                        j += 1
-                            k += 1
-                        except Exception as e:
-                            log.error("Jeopardy: Error: {0}".format(e))
-                            k += 1
+                        if len(questions) - start >= count * 0.2:
                             break
-            if self.shuffled or self.registryValue("randomize", channel):
-                random.shuffle(self.questions)
-            else:
-                self.questions = self.questions[::-1]
-            self.total = len(self.questions)
-            self.num = len(self.questions)
-            if self.num == 0:
-                self.reply("Sorry, no questions available.")
-                self.stop()
-                return
-            self.newquestion()
-
-        def normalize(self, q):
-            q = BeautifulSoup(q)
-            q = fix_text(q.text).replace(r"\'", "'").replace(r"\"", '"')
-            q = re.sub("([.!?])([A-Z(])(?![.'])", r"\g<1> \g<2>", q)
-            q = re.sub("([,;:)])([a-zA-Z(])", r"\g<1> \g<2>", q)
-            q = " ".join(q.split())
-            return q
+                        add(item)
+            for data in pools:
+                for item in data:
+                    if len(questions) == count:
+                        break
+                    add(item)
+            return questions
 
-        def clean(self, text):
-            text = unidecode(text)
-            if len(text) > 2:
-                text = re.sub("[^a-zA-Z0-9 ]+", "", text)
-                text = re.sub("^a |^an |^the |^or ", "", text).replace(" ", "")
-            else:
-                text = re.sub("[^a-zA-Z0-9]+", "", text)
-            return text
+        def fetchCategory(self, category):
+            if category in self.fetched:
+                return self.fetched[category]
+            data = requests.get(
+                "{0}/api/clues?category={1}".format(self.jserviceUrl, category),
+                timeout=5,
+            )
+            data = json.loads(data.content.decode())
+            if data:
+                cluecount = data[0]["category"]["clues_count"]
+                for offset in range(100, min(cluecount, 600), 100):
+                    data.extend(
+                        json.loads(
+                            requests.get(
+                                "{0}/api/clues?&category={1}&offset={2}".format(
+                                    self.jserviceUrl, category, offset
+                                ),
+                                timeout=5,
+                            ).content.decode()
+                        )
+                    )
+            self.fetched[category] = data
+            return data
 
         def newquestion(self):
             if not self.active:
@@ -435,20 +346,27 @@ class Jeopardy(callbacks.Plugin):
                 self.active = False
                 self.stop()
                 return
-            elif len(self.questions) == 0:
+            elif not self.prefetcher.ready():
+                self.prefetcher.when_ready(self.newquestion)
+                return
+            q = self.prefetcher.get()
+            if q is None:
                 self.reply("Oops! I ran out of questions!")
                 self.stop()
                 return
             self.show = {}
             self.revealed = {}
             self.id = None
+            self.local = False
             self.hints = 0
             self.shown = 0
             self.num -= 1
             self.numAsked += 1
-            q = self.questions.pop(len(self.questions) - 1).split("|")
+            q = q.split("|")
             question = {}
             self.id = q[0]
+            # Clues from the local store don't have jService ids.
+            self.local = q[6:] == ["local"]
             question["airdate"] = q[1]
             self.p = int(q[2])
             self.points = self.p
@@ -470,6 +388,7 @@ class Jeopardy(callbacks.Plugin):
                 a1, a2, a3 = re.match(r"(.*)\((.*)\)(.*)", self.a[0]).groups()
                 self.a.append(a1 + a3)
                 self.a.append(a2)
+            self.matcher = AnswerMatcher(self.a)
             if self.numAsked > 1 and self.delay > 0:
                 delayTime = time.time() + self.delay
 
@@ -484,7 +403,8 @@ class Jeopardy(callbacks.Plugin):
             self.clear()
             self.correct = False
             if self.registryValue("keepHistory", self.channel):
-                self.history[self.channel].append(int(self.id))
+                self.history[self.channel].add(int(self.id))
+                self.scores.add_history(self.channel, int(self.id))
             self.reply(self.question)
             if self.timeout > 0:
 
@@ -523,7 +443,6 @@ class Jeopardy(callbacks.Plugin):
                 pass
 
         def stop(self):
-            self.write()
             self.clear()
             if self.registryValue("showScores", self.channel):
                 scores = iter(self.roundscores.items())
@@ -564,6 +483,9 @@ class Jeopardy(callbacks.Plugin):
             else:
                 self.correct = True
                 self.active = False
+                self.prefetcher.stop()
+                if self.prefetchers.get(self.channel) is self.prefetcher:
+                    del self.prefetchers[self.channel]
 
         def timedEvent(self):
             if not self.active or self.timeout == 0 or self.correct:
@@ -665,63 +587,28 @@ class Jeopardy(callbacks.Plugin):
         def answer(self, msg):
             if not self.active or self.correct:
                 return
-            if not self.correct:
-                for ans in self.a:
-                    ans = " ".join(ans.split()).strip().lower()
-                    guess = " ".join(msg.args[1].split()).strip().lower()
-                    if guess == ans:
-                        self.correct = True
-                        break
-                    elif not self.correct:
-                        answer = self.clean(ans)
-                        guess = self.clean(guess)
-                    if not self.correct and guess == answer:
-                        self.correct = True
-                        break
-                    elif (
-                        not self.correct
-                        and self.flexibility < 1
-                        and self.flexibility > 0.5
-                    ):
-                        dist = textdistance.jaro_winkler(guess, answer)
-                        log.debug(
-                            "Jeopardy: guess: {0}, answer: {1}, length: {2}, "
-                            "distance: {3}, flexibility: {4}".format(
-                                guess, answer, len(answer), dist, self.flexibility
-                            )
-                        )
-                        if dist >= self.flexibility:
-                            self.correct = True
-                            break
-                        elif (
-                            dist < self.flexibility
-                            and "," in self.a[0]
-                            or "&" in self.a[0]
-                        ):
-                            dist = textdistance.jaccard(guess, answer)
-                            if dist >= self.flexibility:
-                                self.correct = True
-                                break
-                if self.correct:
-                    if not msg.nick in self.scores:
-                        self.scores[msg.nick] = 0
-                    self.scores[msg.nick] += self.p
-                    if not msg.nick in self.roundscores:
-                        self.roundscores[msg.nick] = 0
-                    self.roundscores[msg.nick] += self.p
-                    self.unanswered = 0
-                    reply = self.correct_template.render(
-                        nick=msg.nick,
-                        answer=self.a[0],
-                        points=self.p,
-                        round=self.roundscores[msg.nick],
-                        total=self.scores[msg.nick],
-                    )
-                    self.reply(reply)
-                    self.correct = True
-                    self.answered += 1
-                    self.clear()
-                    self.newquestion()
+            if not self.matcher.match(msg.args[1], self.flexibility):
+                return
+            # The round may have moved on while the guess was being checked.
+            if not self.active or self.correct:
+                return
+            self.correct = True
+            total = self.scores.add_score(self.channel, msg.nick, self.p)
+            if not msg.nick in self.roundscores:
+                self.roundscores[msg.nick] = 0
+            self.roundscores[msg.nick] += self.p
+            self.unanswered = 0
+            reply = self.correct_template.render(
+                nick=msg.nick,
+                answer=self.a[0],
+                points=self.p,
+                round=self.roundscores[msg.nick],
+                total=total,
+            )
+            self.reply(reply)
+            self.answered += 1
+            self.clear()
+            self.newquestion()
 
         def reply(self, s):
             if self.registryValue("useBold", self.channel):
@@ -729,17 +616,6 @@ class Jeopardy(callbacks.Plugin):
             else:
                 self.irc.queueMsg(ircmsgs.privmsg(self.channel, s))
 
-        def write(self):
-            f = open(self.scoreFile, "w")
-            for score in self.scores.items():
-                f.write("%s %s\n" % (score[0], score[1]))
-            f.close()
-            if self.registryValue("keepHistory", self.channel):
-                f = open(self.historyFile, "w")
-                for id in self.history[self.channel]:
-                    f.write("%s\n" % (id))
-                f.close()
-
     def start(self, irc, msg, args, channel, optlist, categories):
         """[--num <#>] [--no-hints] [--shuffle] [<category1>, <category2>, etc.]
         Play Jeopardy! with random questions or search/select categories by name.
@@ -804,7 +680,11 @@ class Jeopardy(callbacks.Plugin):
             restart = True
         else:
             restart = self.registryValue("autoRestart", channel)
-        if "random-category" in optlist:
+        if "random" in optlist and self.clues.has_clues():
+            results = self.clues.random_categories(100)
+            if not results:
+                results = "random"
+        elif "random" in optlist:
             if self.jserviceUrl == "http://jservice.io":
                 seed = random.randint(0, 184) * 100
             else:
@@ -830,7 +710,11 @@ class Jeopardy(callbacks.Plugin):
                 category = category.strip()
                 if category.isdigit():
                     results.append(category)
-                else:
+                    continue
+                found = []
+                if self.clues.has_clues():
+                    found = self.clues.search_categories(category)
+                if not found and self.registryValue("httpFallback"):
                     url = "{0}/search?query={1}".format(self.jserviceUrl, category)
                     data = requests.get(url, timeout=5)
                     soup = BeautifulSoup(data.content)
@@ -838,7 +722,8 @@ class Jeopardy(callbacks.Plugin):
                     for i in range(len(searches)):
                         search = searches[i].get("href").split("/")[-1]
                         if search.isdigit():
-                            results.append(search)
+                            found.append(search)
+                results.extend(found)
             if not results:
                 if self.registryValue("useBold", channel):
                     irc.reply(
@@ -959,101 +844,47 @@ class Jeopardy(callbacks.Plugin):
     categories = wrap(categories)
 
     def stats(self, irc, msg, args, channel, optlist, nick):
-        """[channel] [--top <int>] [<nick>]
+        """[channel] [--top <int>] [--global] [<nick>]
         Returns Jeopardy! player stats. Supply a nick to get stats for a specific
-        player. Use --top to set number of players to list.
+        player. Use --top to set number of players to list, and --global to get
+        scores from all channels.
         Defaults to current channel and top 5 players if no options given.
         """
         optlist = dict(optlist)
         if not channel:
             channel = msg.channel
-        if "top" in optlist:
-            top = optlist.get("top")
+        top = max(optlist.get("top", 5), 0)
+        if channel in self.games:
+            reply = self.games[channel].reply
         else:
-            top = 5
-        try:
-            if nick:
-                try:
-                    total = self.games[channel].scores[nick]
-                    self.games[channel].reply(
-                        "Total score for {0} in {1}: {2}".format(nick, channel, total)
-                    )
-                except KeyError:
-                    self.games[channel].reply(
-                        "No scores found for {0} in {1}".format(nick, channel)
-                    )
-            else:
-                sorted_x = []
-                sorted_x = sorted(
-                    self.games[channel].scores.items(),
-                    key=lambda kv: kv[1],
-                    reverse=True,
-                )
-                if len(sorted_x) < top:
-                    top = len(sorted_x)
-                if top > 0:
-                    totals = ""
-                    for i in range(0, top):
-                        item = sorted_x[i]
-                        totals += "#{0} ({1}: {2}), ".format(i + 1, item[0], item[1])
-                    self.games[channel].reply(
-                        "Top {0} Jeopardy! players for {1}:".format(top, channel)
-                    )
-                    self.games[channel].reply(totals.strip(", "))
-                else:
-                    return
-        except KeyError:
-            scores = requests.structures.CaseInsensitiveDict()
-            scoreFile = "{0}/jeopardy/scores_{1}.txt".format(
-                conf.supybot.directories.data, channel
-            )
-            if not os.path.exists(scoreFile):
-                return
-            if nick:
-                f = open(scoreFile, "r")
-                line = f.readline()
-                while line:
-                    (name, score) = line.split(" ")
-                    scores[name] = int(score.strip("\r\n"))
-                    line = f.readline()
-                f.close()
-                try:
-                    total = scores[nick]
-                    irc.reply(
-                        "Total score for {0} in {1}: {2}".format(nick, channel, total),
-                        prefixNick=False,
-                    )
-                except KeyError:
-                    irc.reply(
-                        "No scores found for {0} in {1}".format(nick, channel),
-                        prefixNick=False,
-                    )
-            else:
-                f = open(scoreFile, "r")
-                line = f.readline()
-                while line:
-                    (name, score) = line.split(" ")
-                    scores[name] = int(score.strip("\r\n"))
-                    line = f.readline()
-                f.close()
-                sorted_x = []
-                sorted_x = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
-                if len(sorted_x) < top:
-                    top = len(sorted_x)
-                if top > 0:
-                    totals = ""
-                    for i in range(0, top):
-                        item = sorted_x[i]
-                        totals += "#{0} ({1}: {2}), ".format(i + 1, item[0], item[1])
-                    irc.reply(
-                        "Top {0} Jeopardy! players for {1}:".format(top, channel),
-                        prefixNick=False,
-                    )
-                    irc.reply(totals.strip(", "), prefixNick=False)
-                else:
-                    return
 
-    stats = wrap(stats, ["channel", getopts({"top": "int"}), additional("text")])
+            def reply(s):
+                irc.reply(s, prefixNick=False)
+
+        if "global" in optlist:
+            scope, name = None, "all channels"
+        else:
+            scope, name = channel, channel
+        if nick:
+            total = self.scores.get_score(scope, nick)
+            if total is None:
+                reply("No scores found for {0} in {1}".format(nick, name))
+            else:
+                reply("Total score for {0} in {1}: {2}".format(nick, name, total))
+            return
+        scores = self.scores.top_scores(scope, top)
+        if not scores:
+            return
+        totals = [
+            "#{0} ({1}: {2})".format(i + 1, item[0], item[1])
+            for (i, item) in enumerate(scores)
+        ]
+        reply("Top {0} Jeopardy! players for {1}:".format(len(scores), name))
+        reply(", ".join(totals))
+
+    stats = wrap(
+        stats, ["channel", getopts({"top": "int", "global": ""}), additional("text")]
+    )
 
     def question(self, irc, msg, args):
         """
@@ -1098,14 +929,18 @@ class Jeopardy(callbacks.Plugin):
             return
         if channel in self.games:
             if self.games[channel].active:
-                r = requests.post(
-                    "{0}/api/invalid".format(self.jserviceUrl),
-                    data={"id": self.games[channel].id},
-                )
-                if r.status_code == 200:
+                if self.games[channel].local:
+                    self.clues.invalidate(int(self.games[channel].id))
                     self.games[channel].reply("Question successfully reported.")
                 else:
-                    self.games[channel].reply("Error. Question not reported.")
+                    r = requests.post(
+                        "{0}/api/invalid".format(self.jserviceUrl),
+                        data={"id": self.games[channel].id},
+                    )
+                    if r.status_code == 200:
+                        self.games[channel].reply("Question successfully reported.")
+                    else:
+                        self.games[channel].reply("Error. Question not reported.")
                 self.games[channel].end()
 
     report = wrap(report)
@@ -1128,5 +963,30 @@ class Jeopardy(callbacks.Plugin):
 
     skip = wrap(skip)
 
+    def importclues(self, irc, msg, args, source):
+        """<file|url>
+        Import clues into the local clue database from a JSON dump: a list of
+        jService clues (or the j-archive dump), or one clue per line. Games are
+        played from the local database once it has clues.
+        """
+        try:
+            if source.startswith(("http://", "https://")):
+                data = requests.get(source, timeout=60).content.decode()
+            else:
+                with open(os.path.expanduser(source)) as f:
+                    data = f.read()
+            added = self.clues.import_clues(read_clues(data))
+        except Exception as e:
+            log.error("Jeopardy: Error importing clues: {0}".format(e))
+            irc.error("Could not import clues from {0}: {1}".format(source, e))
+            return
+        irc.reply(
+            "Imported {0} clues. The local database now has {1} clues.".format(
+                added, self.clues.count()
+            )
+        )
+
+    importclues = wrap(importclues, ["owner", "text"])
+
 
 Class = Jeopardy
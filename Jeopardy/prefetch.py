@@ -0,0 +1,134 @@
+###
+# Copyright (c) 2010, quantumlemur
+# Copyright (c) 2011, Valentin Lorentz
+# Copyright (c) 2020, oddluck <oddluck@riseup.net>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+###
+
+import collections
+import threading
+
+import supybot.log as log
+
+
+class Prefetcher(object):
+    """
+    A bounded buffer of ready to ask questions for a game. A worker thread
+    calls fetch(count, seen) to top it back up to size whenever it drops below
+    low, so asking the next question never waits on the clue source.
+    Questions are "id|..." strings; ids in seen are never fetched twice.
+    """
+
+    def __init__(self, fetch, size, low, key=None):
+        self.fetch = fetch
+        self.size = max(size, 1)
+        self.low = min(max(low, 1), self.size)
+        self.key = key
+        self.buffer = collections.deque()
+        self.seen = set()
+        self.cond = threading.Condition()
+        self.exhausted = False
+        self.stopped = False
+        self.waiting = None
+        self.thread = threading.Thread(
+            target=self._run, name="Jeopardy prefetcher", daemon=True
+        )
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.stopped and (
+                    self.exhausted or len(self.buffer) >= self.low
+                ):
+                    self.cond.wait()
+                if self.stopped:
+                    return
+                wanted = self.size - len(self.buffer)
+                seen = set(self.seen)
+            try:
+                questions = self.fetch(wanted, seen)
+            except Exception as e:
+                log.error("Jeopardy: Error prefetching questions: {0}".format(e))
+                questions = []
+            with self.cond:
+                added = 0
+                for question in questions:
+                    id = int(question.split("|", 1)[0])
+                    if id not in self.seen:
+                        self.seen.add(id)
+                        self.buffer.append(question)
+                        added += 1
+                # A source that can't fill the request has run dry.
+                if added < wanted:
+                    self.exhausted = True
+                callback, self.waiting = self.waiting, None
+                self.cond.notify_all()
+            if callback:
+                callback()
+
+    def ready(self):
+        "Return True if get() won't have to wait for the worker."
+        with self.cond:
+            return bool(self.buffer) or self.exhausted or self.stopped
+
+    def available(self):
+        with self.cond:
+            return len(self.buffer)
+
+    def when_ready(self, callback):
+        """
+        Call callback once a question is available or the source has run dry;
+        right away if that's already the case, otherwise from the worker.
+        """
+        with self.cond:
+            if not (self.buffer or self.exhausted or self.stopped):
+                self.waiting = callback
+                return
+        callback()
+
+    def get(self):
+        "Return the next question without blocking, or None if there is none."
+        with self.cond:
+            if not self.buffer:
+                return None
+            question = self.buffer.popleft()
+            if len(self.buffer) < self.low:
+                self.cond.notify_all()
+            return question
+
+    def resume(self):
+        "Try the source again after it ran dry, e.g. for a new round."
+        with self.cond:
+            self.exhausted = False
+            self.cond.notify_all()
+
+    def stop(self):
+        with self.cond:
+            self.stopped = True
+            self.waiting = None
+            self.cond.notify_all()
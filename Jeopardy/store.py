@@ -0,0 +1,453 @@
+###
+# Copyright (c) 2010, quantumlemur
+# Copyright (c) 2011, Valentin Lorentz
+# Copyright (c) 2020, oddluck <oddluck@riseup.net>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+###
+
+from bs4 import BeautifulSoup
+from ftfy import fix_text
+import json
+import math
+import os
+import random
+import re
+import sqlite3
+import string
+import threading
+
+CLUE_COLUMNS = "id, airdate, value, category, clue, answer"
+
+
+def normalize(text):
+    if "<" in text or "&" in text:
+        text = BeautifulSoup(text).text
+    text = fix_text(text).replace(r"\'", "'").replace(r"\"", '"')
+    text = re.sub("([.!?])([A-Z(])(?![.'])", r"\g<1> \g<2>", text)
+    text = re.sub("([,;:)])([a-zA-Z(])", r"\g<1> \g<2>", text)
+    return " ".join(text.split())
+
+
+def read_clues(text):
+    """
+    Parse a clue dump: either a JSON list of clues or one JSON clue per line.
+    """
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    if isinstance(data, dict):
+        data = data.get("clues", [])
+    return data
+
+
+def _points(value):
+    if isinstance(value, int):
+        return value
+    value = re.sub("[^0-9]", "", str(value or ""))
+    return int(value) if value else None
+
+
+class ClueStore(object):
+    """
+    A local copy of the Jeopardy! clues, in a SQLite database. Clues are
+    normalized when they are imported so games can be started without
+    waiting on jService.
+    """
+
+    def __init__(self, filename):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(filename, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.conn:
+            self.conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS categories (
+                    id INTEGER PRIMARY KEY, title TEXT,
+                    clues_count INTEGER DEFAULT 0);
+                CREATE TABLE IF NOT EXISTS clues (
+                    id INTEGER PRIMARY KEY, category_id INTEGER, airdate TEXT,
+                    value INTEGER, category TEXT, clue TEXT, answer TEXT);
+                CREATE INDEX IF NOT EXISTS categories_title ON categories (title);
+                CREATE INDEX IF NOT EXISTS categories_count
+                    ON categories (clues_count);
+                CREATE INDEX IF NOT EXISTS clues_category ON clues (category_id);
+                CREATE INDEX IF NOT EXISTS clues_airdate ON clues (airdate);
+                CREATE INDEX IF NOT EXISTS clues_value ON clues (value);
+                CREATE UNIQUE INDEX IF NOT EXISTS clues_unique
+                    ON clues (category_id, clue);
+                """
+            )
+            try:
+                self.conn.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS category_search"
+                    " USING fts5(title)"
+                )
+                self.fts = True
+            except sqlite3.OperationalError:
+                self.fts = False
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def _query(self, sql, args=()):
+        with self.lock:
+            return self.conn.execute(sql, args).fetchall()
+
+    def has_clues(self):
+        return bool(self._query("SELECT EXISTS (SELECT 1 FROM clues)")[0][0])
+
+    def count(self):
+        return self._query("SELECT COUNT(*) FROM clues")[0][0]
+
+    # Reading
+
+    def random_clues(self, count, exclude=()):
+        """
+        Return up to count random clues that aren't in exclude, as
+        (id, airdate, value, category, clue, answer) rows.
+        """
+        low, high = self._query("SELECT MIN(id), MAX(id) FROM clues")[0]
+        if low is None:
+            return []
+        clues = {}
+        for attempt in range(5):
+            wanted = count - len(clues)
+            if wanted <= 0:
+                break
+            # Probing random ids is much cheaper than ORDER BY RANDOM() over the
+            # whole table; ids are dense enough that a few rounds are plenty.
+            ids = list({random.randint(low, high) for i in range(wanted * 2 + 10)})
+            for i in range(0, len(ids), 500):
+                chunk = ids[i : i + 500]
+                rows = self._query(
+                    "SELECT {0} FROM clues WHERE id IN ({1})".format(
+                        CLUE_COLUMNS, ",".join("?" * len(chunk))
+                    ),
+                    chunk,
+                )
+                for row in rows:
+                    if row[0] not in exclude:
+                        clues[row[0]] = row
+        if len(clues) < count:
+            rows = self._query(
+                "SELECT {0} FROM clues ORDER BY RANDOM() LIMIT ?".format(CLUE_COLUMNS),
+                (count * 2 + len(exclude),),
+            )
+            for row in rows:
+                if row[0] not in exclude:
+                    clues[row[0]] = row
+        clues = list(clues.values())
+        random.shuffle(clues)
+        return clues[:count]
+
+    def category_clues(self, categories, count, shuffle=False, exclude=()):
+        """
+        Return up to count clues from the given category ids, in order. With
+        shuffle, the first fifth of the round is spread over all categories.
+        """
+        pools = []
+        for category in categories:
+            try:
+                category = int(category)
+            except ValueError:
+                continue
+            pools.append(
+                self._query(
+                    "SELECT {0} FROM clues WHERE category_id = ?"
+                    " ORDER BY airdate, value".format(CLUE_COLUMNS),
+                    (category,),
+                )
+            )
+        clues = []
+        seen = set()
+
+        def take(pool, limit):
+            taken = 0
+            for row in pool:
+                if len(clues) == count or taken == limit:
+                    break
+                if row[0] in seen or row[0] in exclude:
+                    continue
+                seen.add(row[0])
+                clues.append(row)
+                taken += 1
+
+        if shuffle:
+            for pool in pools:
+                take(pool, max(1, math.ceil(count * 0.2)))
+        for pool in pools:
+            take(pool, None)
+        return clues
+
+    def random_categories(self, count, min_clues=10):
+        rows = self._query(
+            "SELECT id FROM categories WHERE clues_count >= ?"
+            " ORDER BY RANDOM() LIMIT ?",
+            (min_clues, count),
+        )
+        return [row[0] for row in rows]
+
+    def search_categories(self, query, limit=100):
+        "Return the ids of the categories whose title matches query."
+        words = query.split()
+        if not words:
+            return []
+        if self.fts:
+            match = " ".join('"{0}"'.format(word.replace('"', '""')) for word in words)
+            rows = self._query(
+                "SELECT rowid FROM category_search WHERE category_search MATCH ?"
+                " ORDER BY rank LIMIT ?",
+                (match, limit),
+            )
+        else:
+            rows = self._query(
+                "SELECT id FROM categories WHERE {0} LIMIT ?".format(
+                    " AND ".join(["title LIKE ?"] * len(words))
+                ),
+                ["%{0}%".format(word) for word in words] + [limit],
+            )
+        return [row[0] for row in rows]
+
+    # Importing
+
+    def import_clues(self, items):
+        """
+        Import jService-style clues (or the j-archive JSON dump, which has no
+        ids). Invalid clues are skipped; returns the number of clues added.
+        """
+        with self.lock, self.conn:
+            titles = {
+                title: id
+                for (id, title) in self.conn.execute("SELECT id, title FROM categories")
+            }
+            before = self.conn.execute("SELECT COUNT(*) FROM clues").fetchone()[0]
+            for item in items:
+                category = item.get("category")
+                if isinstance(category, dict):
+                    category_id = category.get("id")
+                    title = category.get("title")
+                else:
+                    category_id = item.get("category_id")
+                    title = category
+                clue = (item.get("question") or "").strip()
+                answer = (item.get("answer") or "").strip()
+                airdate = (item.get("airdate") or item.get("air_date") or "").split(
+                    "T"
+                )[0]
+                if (
+                    not (clue and airdate and answer and title)
+                    or item.get("invalid_count")
+                    or answer == "="
+                ):
+                    continue
+                title = normalize(string.capwords(title))
+                clue = normalize(clue)
+                answer = normalize(answer)
+                if category_id is None:
+                    category_id = titles.get(title)
+                if category_id is None:
+                    category_id = self.conn.execute(
+                        "INSERT INTO categories (title) VALUES (?)", (title,)
+                    ).lastrowid
+                elif titles.get(title) != category_id:
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO categories (id, title) VALUES (?, ?)",
+                        (category_id, title),
+                    )
+                titles[title] = category_id
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO clues"
+                    " (id, category_id, airdate, value, category, clue, answer)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        item.get("id"),
+                        category_id,
+                        airdate,
+                        _points(item.get("value")),
+                        title,
+                        clue,
+                        answer,
+                    ),
+                )
+            self.conn.execute(
+                "UPDATE categories SET clues_count ="
+                " (SELECT COUNT(*) FROM clues WHERE category_id = categories.id)"
+            )
+            if self.fts:
+                self.conn.execute("DELETE FROM category_search")
+                self.conn.execute(
+                    "INSERT INTO category_search (rowid, title)"
+                    " SELECT id, title FROM categories"
+                )
+        return self.count() - before
+
+    def invalidate(self, id):
+        "Delete a clue reported as invalid, so it isn't asked again."
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "SELECT category_id FROM clues WHERE id = ?", (id,)
+            ).fetchone()
+            if row is None:
+                return
+            self.conn.execute("DELETE FROM clues WHERE id = ?", (id,))
+            self.conn.execute(
+                "UPDATE categories SET clues_count = clues_count - 1 WHERE id = ?",
+                row,
+            )
+
+
+class ScoreStore(object):
+    """
+    Jeopardy! scores and asked clue history, in a SQLite database. Scores are
+    updated as they are won; the global totals are kept alongside the per
+    channel scores so neither needs to be summed up when asked for.
+    """
+
+    def __init__(self, filename):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(filename, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.conn:
+            self.conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS scores (
+                    channel TEXT COLLATE NOCASE, nick TEXT COLLATE NOCASE,
+                    score INTEGER, PRIMARY KEY (channel, nick)) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS totals (
+                    nick TEXT COLLATE NOCASE PRIMARY KEY, score INTEGER)
+                    WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS history (
+                    channel TEXT COLLATE NOCASE, id INTEGER,
+                    PRIMARY KEY (channel, id)) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY, value TEXT);
+                CREATE INDEX IF NOT EXISTS scores_rank
+                    ON scores (channel, score);
+                CREATE INDEX IF NOT EXISTS totals_rank ON totals (score);
+                """
+            )
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def _query(self, sql, args=()):
+        with self.lock:
+            return self.conn.execute(sql, args).fetchall()
+
+    # Scores
+
+    def add_score(self, channel, nick, points):
+        "Add points to nick's score in channel, and return the new score."
+        with self.lock, self.conn:
+            self._add(channel, nick, points)
+            return self.conn.execute(
+                "SELECT score FROM scores WHERE channel = ? AND nick = ?",
+                (channel, nick),
+            ).fetchone()[0]
+
+    def _add(self, channel, nick, points):
+        self.conn.execute(
+            "INSERT INTO scores (channel, nick, score) VALUES (?, ?, ?)"
+            " ON CONFLICT (channel, nick) DO UPDATE SET score = score + ?",
+            (channel, nick, points, points),
+        )
+        self.conn.execute(
+            "INSERT INTO totals (nick, score) VALUES (?, ?)"
+            " ON CONFLICT (nick) DO UPDATE SET score = score + ?",
+            (nick, points, points),
+        )
+
+    def get_score(self, channel, nick):
+        "Return nick's score in channel, or their total if channel is None."
+        if channel is None:
+            rows = self._query("SELECT score FROM totals WHERE nick = ?", (nick,))
+        else:
+            rows = self._query(
+                "SELECT score FROM scores WHERE channel = ? AND nick = ?",
+                (channel, nick),
+            )
+        return rows[0][0] if rows else None
+
+    def top_scores(self, channel, limit):
+        "Return the best (nick, score) in channel, or overall if channel is None."
+        if channel is None:
+            return self._query(
+                "SELECT nick, score FROM totals ORDER BY score DESC LIMIT ?",
+                (limit,),
+            )
+        return self._query(
+            "SELECT nick, score FROM scores WHERE channel = ?"
+            " ORDER BY score DESC LIMIT ?",
+            (channel, limit),
+        )
+
+    # History
+
+    def history(self, channel):
+        "Return the set of clue ids already asked in channel."
+        rows = self._query("SELECT id FROM history WHERE channel = ?", (channel,))
+        return set(row[0] for row in rows)
+
+    def add_history(self, channel, id):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO history VALUES (?, ?)", (channel, id)
+            )
+
+    def import_files(self, directory):
+        """
+        Import the scores_<channel>.txt and history_<channel>.txt files written
+        by older versions of the plugin. This only happens once; the old files
+        are left in place.
+        """
+        with self.lock:
+            done = self.conn.execute(
+                "SELECT value FROM meta WHERE key = 'imported'"
+            ).fetchall()
+        if done or not os.path.isdir(directory):
+            return
+        pattern = re.compile(r"^(scores|history)_(.+)\.txt$")
+        with self.lock, self.conn:
+            for name in os.listdir(directory):
+                match = pattern.match(name)
+                if not match:
+                    continue
+                kind, channel = match.groups()
+                with open(os.path.join(directory, name)) as f:
+                    lines = f.read().split()
+                if kind == "history":
+                    self.conn.executemany(
+                        "INSERT OR IGNORE INTO history VALUES (?, ?)",
+                        [(channel, int(id)) for id in lines if id.isdigit()],
+                    )
+                else:
+                    for nick, score in zip(lines[::2], lines[1::2]):
+                        self._add(channel, nick, int(score))
+            self.conn.execute("INSERT INTO meta VALUES ('imported', '1')")
@@ -55,10 +55,14 @@ __contributors__ = {}
 __url__ = "https://github.com/oddluck/limnoria-plugins/"
 
 from . import config
+from . import cache
+from . import title
 from . import plugin
 from imp import reload
 
 # In case we're being reloaded.
+reload(cache)
+reload(title)
 reload(plugin)
 reload(config)
 # Add more reloads here if you add third-party modules and want them to be
@@ -0,0 +1,238 @@
+###
+# Copyright (c) 2015, butterscotchstallion
+# Copyright (c) 2020, oddluck <oddluck@riseup.net>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+###
+
+"""
+Link title caches: a bounded in-memory LRU and an optional SQLite tier that
+survives restarts.
+"""
+
+import collections
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+
+def normalize_url(url):
+    """
+    Returns the cache key for a URL: lowercase scheme and host, no default
+    port and no fragment, so trivially different spellings share an entry.
+    """
+    try:
+        parts = urlsplit(url.strip())
+        netloc = parts.netloc.lower()
+        scheme = parts.scheme.lower()
+        if (scheme, parts.port) in (("http", 80), ("https", 443)):
+            netloc = netloc.rsplit(":", 1)[0]
+    except ValueError:
+        return url
+    path = parts.path or "/"
+    return urlunsplit((scheme, netloc, path, parts.query, ""))
+
+
+class LinkCache(object):
+    """
+    LRU cache of link titles keyed by (channel, normalized URL). Entries
+    expire after the cache lifetime, and the least recently used ones are
+    evicted once the entry or byte limits are reached.
+    """
+
+    def __init__(self, max_entries=1000, max_bytes=1048576):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def entry_size(self, key, entry):
+        return len(key[0]) + len(key[1]) + len(entry["title"])
+
+    def get(self, url, channel, lifetime):
+        """
+        Returns the cached entry for a URL, or None if it is missing or older
+        than lifetime seconds.
+        """
+        key = (channel, normalize_url(url))
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if time.time() - entry["timestamp"] >= lifetime:
+                self.expirations += 1
+                self.misses += 1
+                self.remove(key)
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, url, channel, title, origin_nick=None):
+        key = (channel, normalize_url(url))
+        entry = {
+            "url": url,
+            "timestamp": time.time(),
+            "title": title,
+            "from": origin_nick,
+            "channel": channel,
+        }
+        with self.lock:
+            if key in self.entries:
+                self.remove(key)
+            if self.entry_size(key, entry) > self.max_bytes:
+                return
+            self.entries[key] = entry
+            self.size += self.entry_size(key, entry)
+            while self.entries and (
+                len(self.entries) > self.max_entries or self.size > self.max_bytes
+            ):
+                self.remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def remove(self, key):
+        entry = self.entries.pop(key)
+        self.size -= self.entry_size(key, entry)
+
+    def resize(self, max_entries, max_bytes):
+        with self.lock:
+            self.max_entries = max_entries
+            self.max_bytes = max_bytes
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class DiskLinkCache(object):
+    """
+    SQLite-backed second tier of the link cache, so titles survive a restart.
+    The database is only opened on first use; expired rows are removed by
+    compact().
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.conn = None
+        self.lock = threading.Lock()
+
+    def connect(self):
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.filename, check_same_thread=False)
+            self.conn.row_factory = sqlite3.Row
+            self.conn.execute("""PRAGMA journal_mode=WAL""")
+            self.conn.execute(
+                """CREATE TABLE IF NOT EXISTS links (
+                        channel TEXT,
+                        url TEXT,
+                        title TEXT,
+                        handler TEXT,
+                        origin_nick TEXT,
+                        created REAL,
+                        expires REAL,
+                        PRIMARY KEY(channel, url))"""
+            )
+            self.conn.commit()
+        return self.conn
+
+    def get(self, url, channel):
+        with self.lock:
+            row = (
+                self.connect()
+                .execute(
+                    """SELECT * FROM links
+                       WHERE channel=? AND url=? AND expires>?""",
+                    (channel, normalize_url(url), time.time()),
+                )
+                .fetchone()
+            )
+        if row is None:
+            return None
+        return {
+            "url": url,
+            "timestamp": row["created"],
+            "title": row["title"],
+            "handler": row["handler"],
+            "from": row["origin_nick"],
+            "channel": channel,
+        }
+
+    def set(self, url, channel, title, handler, lifetime, origin_nick=None):
+        now = time.time()
+        with self.lock:
+            conn = self.connect()
+            conn.execute(
+                """INSERT OR REPLACE INTO links VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (
+                    channel,
+                    normalize_url(url),
+                    title,
+                    handler,
+                    origin_nick,
+                    now,
+                    now + lifetime,
+                ),
+            )
+            conn.commit()
+
+    def compact(self):
+        """
+        Drops expired links and gives the space back to the filesystem.
+        """
+        with self.lock:
+            if self.conn is None:
+                return
+            cursor = self.conn.execute(
+                """DELETE FROM links WHERE expires<=?""", (time.time(),)
+            )
+            self.conn.commit()
+            if cursor.rowcount:
+                self.conn.execute("""VACUUM""")
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
@@ -65,6 +65,26 @@ conf.registerGlobalValue(
     registry.Integer(10, _("""Maximum time in seconds to try and retrieve a link""")),
 )
 
+conf.registerGlobalValue(
+    SpiffyTitles,
+    "messageTimeout",
+    registry.PositiveInteger(
+        20,
+        _(
+            """Maximum time in seconds to wait for the titles of all links in a
+            message"""
+        ),
+    ),
+)
+
+conf.registerGlobalValue(
+    SpiffyTitles,
+    "maxThreads",
+    registry.PositiveInteger(
+        8, _("""Number of links that can be fetched at the same time""")
+    ),
+)
+
 # URL regex
 conf.registerChannelValue(
     SpiffyTitles,
@@ -142,6 +162,46 @@ conf.registerGlobalValue(
     ),
 )
 
+# Link cache size
+conf.registerGlobalValue(
+    SpiffyTitles,
+    "cacheMaxEntries",
+    registry.PositiveInteger(
+        1000, _("""Maximum number of links kept in the link cache""")
+    ),
+)
+
+conf.registerGlobalValue(
+    SpiffyTitles,
+    "cacheMaxBytes",
+    registry.PositiveInteger(
+        1048576, _("""Maximum size in bytes of the titles kept in the link cache""")
+    ),
+)
+
+# Disk cache
+conf.registerGlobalValue(
+    SpiffyTitles,
+    "diskCache",
+    registry.Boolean(
+        False,
+        _(
+            """
+            Also keep link titles in a database in the data directory, so they
+            survive restarts.
+            """
+        ),
+    ),
+)
+
+conf.registerGlobalValue(
+    SpiffyTitles,
+    "diskCacheLifetime",
+    registry.PositiveInteger(
+        86400, _("""Disk cache lifetime in seconds""")
+    ),
+)
+
 conf.registerChannelValue(
     SpiffyTitles,
     "ignoredMessagePattern",
@@ -208,6 +268,18 @@ conf.registerChannelValue(
     ),
 )
 
+conf.registerChannelValue(
+    SpiffyTitles.default,
+    "maxBytes",
+    registry.PositiveInteger(
+        524288,
+        _(
+            """Maximum number of bytes read from a page while looking for its
+            title. Reading stops as soon as the title is found."""
+        ),
+    ),
+)
+
 conf.registerChannelValue(
     SpiffyTitles.default,
     "language",
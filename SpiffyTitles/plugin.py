@@ -35,12 +35,18 @@ import supybot.utils as utils
 import supybot.ircdb as ircdb
 import supybot.log as log
 import supybot.conf as conf
-import re, sys, random, time, json, unicodedata, datetime
+import supybot.schedule as schedule
+import re, sys, random, time, json, unicodedata, datetime, threading
 from urllib.parse import urlparse, parse_qsl
+from http.cookiejar import DefaultCookiePolicy
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
 from bs4 import BeautifulSoup
 from jinja2 import Template
 import requests
 
+from .cache import LinkCache, DiskLinkCache, normalize_url
+from .title import read_title
+
 try:
     from supybot.i18n import PluginInternationalization
 
@@ -60,7 +66,24 @@ class SpiffyTitles(callbacks.Plugin):
     def __init__(self, irc):
         self.__parent = super(SpiffyTitles, self)
         self.__parent.__init__(irc)
-        self.link_cache = {}
+        self.link_cache = LinkCache(
+            self.registryValue("cacheMaxEntries"), self.registryValue("cacheMaxBytes")
+        )
+        self.disk_cache = DiskLinkCache(
+            conf.supybot.directories.data.dirize("SpiffyTitles.db")
+        )
+        schedule.addPeriodicEvent(
+            self.compact_disk_cache, 3600, name="SpiffyTitles_compact", now=False
+        )
+        self.pool = ThreadPoolExecutor(
+            max_workers=self.registryValue("maxThreads"),
+            thread_name_prefix="SpiffyTitles",
+        )
+        self.in_flight = {}
+        self.in_flight_lock = threading.RLock()
+        self.session = self.get_session()
+        self.twitch_games = {}
+        self.twitch_users = {}
         self.handlers = {}
         self.timeout = self.registryValue("timeout")
         self.add_handlers()
@@ -72,6 +95,40 @@ class SpiffyTitles(callbacks.Plugin):
             self.proxies["http"] = proxy
             self.proxies["https"] = proxy
 
+    def die(self):
+        try:
+            schedule.removeEvent("SpiffyTitles_compact")
+        except KeyError:
+            pass
+        self.pool.shutdown(wait=False)
+        self.session.close()
+        self.disk_cache.close()
+        self.__parent.die()
+
+    def get_session(self):
+        """
+        Returns a requests session shared by all handlers, keeping connections
+        alive per host. Retries are left to get_source_by_url, and cookies are
+        refused so one site's cookies are never sent along with another link.
+        """
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=20, pool_maxsize=self.registryValue("maxThreads")
+        )
+        session = requests.Session()
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def compact_disk_cache(self):
+        """
+        Removes expired links from the disk cache without blocking the bot
+        """
+        if self.registryValue("diskCache"):
+            threading.Thread(
+                target=self.disk_cache.compact, name="SpiffyTitles compact"
+            ).start()
+
     def add_handlers(self):
         """
         Adds all handlers
@@ -182,6 +239,7 @@ class SpiffyTitles(callbacks.Plugin):
         urls = self.get_urls_from_message(message, channel)
         if not urls:
             return
+        lookups = []
         for url in urls:
             if url.strip():
                 url = self.remove_control_characters(url)
@@ -194,7 +252,7 @@ class SpiffyTitles(callbacks.Plugin):
                         "SpiffyTitles: URL ignored due to domain blacklist match: %s"
                         % url
                     )
-                    return
+                    break
                 is_whitelisted_domain = self.is_whitelisted_domain(domain, channel)
                 whitelist_pattern = self.registryValue(
                     "whitelistDomainPattern", channel=channel
@@ -204,23 +262,62 @@ class SpiffyTitles(callbacks.Plugin):
                         "SpiffyTitles: URL ignored due to domain whitelist mismatch: %s"
                         % url
                     )
+                    break
+                lookups.append((url, self.resolve_title(url, channel, msg.nick)))
+        """
+        All links are fetched at once, titles are still sent in the order the
+        links appeared. Links that miss the deadline are skipped, but still
+        end up in the cache once they resolve.
+        """
+        deadline = time.time() + self.registryValue("messageTimeout")
+        for (url, lookup) in lookups:
+            try:
+                title = lookup.result(timeout=max(0, deadline - time.time()))
+            except TimeoutError:
+                log.debug("SpiffyTitles: gave up waiting for a title for %s" % (url))
+                continue
+            except Exception as e:
+                log.error("SpiffyTitles: error retrieving %s: %s" % (url, str(e)))
+                continue
+            if title:
+                ignore_match = self.title_matches_ignore_pattern(title, channel)
+                if ignore_match:
                     return
-                title = self.get_title_by_url(url, channel, msg.nick)
-                if title:
-                    ignore_match = self.title_matches_ignore_pattern(title, channel)
-                    if ignore_match:
-                        return
-                    elif not is_ignored:
-                        irc.reply(title, prefixNick=False)
                 else:
-                    if self.registryValue("default.enabled", channel):
-                        log.debug("SpiffyTitles: could not get a title for %s" % (url))
-                    else:
-                        log.debug(
-                            "SpiffyTitles: could not get a title for %s but default    "
-                            "                                handler is disabled"
-                            % (url)
-                        )
+                    irc.reply(title, prefixNick=False)
+            else:
+                if self.registryValue("default.enabled", channel):
+                    log.debug("SpiffyTitles: could not get a title for %s" % (url))
+                else:
+                    log.debug(
+                        "SpiffyTitles: could not get a title for %s but default    "
+                        "                                handler is disabled"
+                        % (url)
+                    )
+
+    def resolve_title(self, url, channel, origin_nick=None):
+        """
+        Looks up a title on the worker pool. Identical lookups already in
+        flight are shared instead of fetching the link again.
+        """
+        scope = channel
+        if self.registryValue("cacheGlobal"):
+            scope = "global"
+        key = (scope, normalize_url(url))
+        with self.in_flight_lock:
+            lookup = self.in_flight.get(key)
+            if lookup is None:
+                lookup = self.pool.submit(
+                    self.get_title_by_url, url, channel, origin_nick
+                )
+                self.in_flight[key] = lookup
+                lookup.add_done_callback(lambda f: self.forget_lookup(key, f))
+        return lookup
+
+    def forget_lookup(self, key, lookup):
+        with self.in_flight_lock:
+            if self.in_flight.get(key) is lookup:
+                del self.in_flight[key]
 
     def handler_default(self, url, channel):
         """
@@ -258,38 +355,39 @@ class SpiffyTitles(callbacks.Plugin):
         if self.registryValue("cacheGlobal"):
             channel = "global"
         cached_link = self.get_link_from_cache(url, channel)
+        handler_name = None
         if cached_link:
             title = cached_link["title"]
         else:
             if domain in self.handlers:
                 handler = self.handlers[domain]
+                handler_name = handler.__name__
                 title = handler(url, info, channel)
             else:
                 base_domain = self.get_base_domain("http://" + domain)
                 if base_domain in self.handlers:
                     handler = self.handlers[base_domain]
+                    handler_name = handler.__name__
                     title = handler(url, info, channel)
                 else:
                     if self.registryValue("default.enabled", channel):
+                        handler_name = "handler_default"
                         title = self.handler_default(url, channel)
         if title and not cached_link:
             title = self.get_formatted_title(title, channel)
             # Update link cache
             log.debug("SpiffyTitles: caching %s" % (url))
-            now = datetime.datetime.now()
-            if channel not in self.link_cache:
-                self.link_cache[channel] = []
-            self.link_cache[channel].append(
-                {
-                    "url": url,
-                    "timestamp": now,
-                    "title": title,
-                    "from": origin_nick,
-                    "channel": channel,
-                }
-            )
+            self.link_cache.set(url, channel, title, origin_nick)
+            if self.registryValue("diskCache") and self.registryValue("cacheLifetime"):
+                self.disk_cache.set(
+                    url,
+                    channel,
+                    title,
+                    handler_name,
+                    self.registryValue("diskCacheLifetime"),
+                    origin_nick,
+                )
         elif title and cached_link:
-            self.link_cache[channel].append(cached_link)
             log.debug("SpiffyTitles: serving link from cache: %s" % (url))
         return title
 
@@ -302,27 +400,20 @@ class SpiffyTitles(callbacks.Plugin):
         cache_lifetime_in_seconds = int(self.registryValue("cacheLifetime"))
         if cache_lifetime_in_seconds == 0:
             return
-        # No cache yet
-        if len(self.link_cache) == 0:
-            return
-        cached_link = None
-        now = datetime.datetime.now()
-        stale = False
-        seconds = 0
-        if channel in self.link_cache:
-            for i in range(len(self.link_cache[channel])):
-                if self.link_cache[channel][i]["url"] == url:
-                    cached_link = self.link_cache[channel].pop(i)
-                    break
-        # Found link, check timestamp
-        if cached_link:
-            seconds = (now - cached_link["timestamp"]).total_seconds()
-            if seconds >= cache_lifetime_in_seconds:
-                stale = True
-        if stale:
-            log.debug("SpiffyTitles: %s was sent %s seconds ago" % (url, seconds))
-        else:
-            return cached_link
+        self.link_cache.resize(
+            self.registryValue("cacheMaxEntries"), self.registryValue("cacheMaxBytes")
+        )
+        cached_link = self.link_cache.get(url, channel, cache_lifetime_in_seconds)
+        if not cached_link and self.registryValue("diskCache"):
+            cached_link = self.disk_cache.get(url, channel)
+            if cached_link:
+                log.debug("SpiffyTitles: %s found in disk cache" % (url))
+                self.link_cache.set(
+                    url, channel, cached_link["title"], cached_link["from"]
+                )
+        if not cached_link:
+            log.debug("SpiffyTitles: %s is not cached or is stale" % (url))
+        return cached_link
 
     def is_channel_allowed(self, channel):
         """
@@ -393,17 +484,18 @@ class SpiffyTitles(callbacks.Plugin):
             title = ircutils.bold(title).strip()
         return title
 
-    def get_title_from_html(self, html, channel):
+    def get_title_from_response(self, request, channel):
         """
-        Retrieves value of <title> tag from HTML
+        Retrieves value of <title> tag, or og:title, from a streamed response
+        without downloading the rest of the page
         """
-        title = None
-        soup = BeautifulSoup(html)
-        if soup:
-            try:
-                title = soup.title.string.strip()
-            except:
-                title = self.registryValue("badLinkText", channel=channel)
+        max_bytes = self.registryValue("default.maxBytes", channel=channel)
+        (title, bytes_read) = read_title(request, max_bytes)
+        log.debug("SpiffyTitles: read %s bytes from %s" % (bytes_read, request.url))
+        if not bytes_read:
+            return None
+        if not title:
+            title = self.registryValue("badLinkText", channel=channel)
         return title
 
     def get_source_by_url(self, url, channel, retries=1):
@@ -419,7 +511,7 @@ class SpiffyTitles(callbacks.Plugin):
         try:
             headers = self.get_headers(channel)
             log.debug("SpiffyTitles: requesting %s" % (url))
-            with requests.get(
+            with self.session.get(
                 url,
                 headers=headers,
                 timeout=self.timeout,
@@ -471,9 +563,9 @@ class SpiffyTitles(callbacks.Plugin):
                 acceptable_types = self.registryValue("default.mimeTypes")
                 log.debug("SpiffyTitles: content type %s" % (content_type))
                 if content_type in acceptable_types:
-                    text = request.content
+                    text = self.get_title_from_response(request, channel)
                     if text:
-                        return (self.get_title_from_html(text, channel), is_redirect)
+                        return (text, is_redirect)
                     else:
                         log.debug("SpiffyTitles: empty content from %s" % (url))
                 else:
@@ -501,10 +593,10 @@ class SpiffyTitles(callbacks.Plugin):
                 return self.get_source_by_url(url_wschema, channel)
         except requests.exceptions.Timeout as e:
             log.error("SpiffyTitles Timeout: %s" % (str(e)))
-            self.get_source_by_url(url, channel, retries + 1)
+            return self.get_source_by_url(url, channel, retries + 1)
         except requests.exceptions.ConnectionError as e:
             log.error("SpiffyTitles ConnectionError: %s" % (str(e)))
-            self.get_source_by_url(url, channel, retries + 1)
+            return self.get_source_by_url(url, channel, retries + 1)
         except requests.exceptions.HTTPError as e:
             log.error("SpiffyTitles HTTPError: %s" % (str(e)))
             text = self.registryValue("badLinkText", channel=channel)
@@ -638,7 +730,7 @@ class SpiffyTitles(callbacks.Plugin):
         api_url = "https://api.dailymotion.com/video/%s?fields=%s" % (video_id, fields,)
         log.debug("SpiffyTitles: looking up dailymotion info: %s", api_url)
         try:
-            request = requests.get(api_url, timeout=self.timeout, proxies=self.proxies)
+            request = self.session.get(api_url, timeout=self.timeout, proxies=self.proxies)
             request.raise_for_status()
         except (
             requests.exceptions.RequestException,
@@ -686,7 +778,7 @@ class SpiffyTitles(callbacks.Plugin):
         api_url = "https://vimeo.com/api/v2/video/%s.json" % video_id
         log.debug("SpiffyTitles: looking up vimeo info: %s", api_url)
         try:
-            request = requests.get(api_url, timeout=self.timeout, proxies=self.proxies)
+            request = self.session.get(api_url, timeout=self.timeout, proxies=self.proxies)
             request.raise_for_status()
         except (
             requests.exceptions.RequestException,
@@ -746,7 +838,7 @@ class SpiffyTitles(callbacks.Plugin):
             return self.handler_default(url, channel)
         api_url = "http://coub.com/api/v2/coubs/%s" % video_id
         try:
-            request = requests.get(api_url, timeout=self.timeout, proxies=self.proxies)
+            request = self.session.get(api_url, timeout=self.timeout, proxies=self.proxies)
             request.raise_for_status()
         except (
             requests.exceptions.RequestException,
@@ -825,7 +917,7 @@ class SpiffyTitles(callbacks.Plugin):
         api_url = "https://www.googleapis.com/youtube/v3/videos"
         log.debug("SpiffyTitles: requesting %s" % (api_url))
         try:
-            request = requests.get(
+            request = self.session.get(
                 api_url, params=options, timeout=self.timeout, proxies=self.proxies
             )
             request.raise_for_status()
@@ -1011,7 +1103,7 @@ class SpiffyTitles(callbacks.Plugin):
         headers = {"Client-ID": twitch_client_id, "Authorization": bearer}
         self.log.debug("SpiffyTitles: twitch - requesting %s" % (data_url))
         try:
-            request = requests.get(
+            request = self.session.get(
                 data_url, timeout=self.timeout, headers=headers, proxies=self.proxies
             )
             request.raise_for_status()
@@ -1041,30 +1133,15 @@ class SpiffyTitles(callbacks.Plugin):
                 link_type = "stream"
             else:
                 self.log.debug("SpiffyTitles: Twitch: No data[0]")
-            data_url = "https://api.twitch.tv/helix/users?login={channel_name}".format(
-                **link_info
-            )
-            try:
-                request = requests.get(
-                    data_url,
-                    timeout=self.timeout,
-                    headers=headers,
-                    proxies=self.proxies,
-                )
-                request.raise_for_status()
-            except (
-                requests.exceptions.RequestException,
-                requests.exceptions.HTTPError,
-            ) as e:
-                log.error("SpiffyTitles: Twitch Error: {0}".format(e))
-                return self.handler_default(url, channel)
             user_data = {}
             try:
-                response = json.loads(request.content.decode())
-                user_data = response["data"][0]
+                user_data = self.get_twitch_user(link_info["channel_name"], headers)
                 display_name = user_data["display_name"]
                 description = user_data["description"]
                 view_count = user_data["view_count"]
+            except requests.exceptions.RequestException as e:
+                log.error("SpiffyTitles: Twitch Error: {0}".format(e))
+                return self.handler_default(url, channel)
             except Exception as e:
                 log.error(
                     "SpiffyTitles: KeyError parsing Twitch.TV JSON response: %s"
@@ -1094,14 +1171,7 @@ class SpiffyTitles(callbacks.Plugin):
             view_count = data["viewer_count"]
             created_at = self._time_created_at(data["started_at"])
             if game_id:
-                get_game = requests.get(
-                    "https://api.twitch.tv/helix/games?id={}".format(game_id),
-                    timeout=self.timeout,
-                    headers=headers,
-                    proxies=self.proxies,
-                )
-                game_data = json.loads(get_game.content.decode())
-                game_name = game_data["data"][0]["name"]
+                game_name = self.get_twitch_game_name(game_id, headers)
             template_vars = {
                 "display_name": display_name,
                 "game_name": game_name,
@@ -1115,25 +1185,9 @@ class SpiffyTitles(callbacks.Plugin):
         elif link_type == "clip":
             data = response["data"][0]
             display_name = data["broadcaster_name"]
-            data_url = "https://api.twitch.tv/helix/users?login={}".format(display_name)
-            try:
-                request = requests.get(
-                    data_url,
-                    timeout=self.timeout,
-                    headers=headers,
-                    proxies=self.proxies,
-                )
-                request.raise_for_status()
-            except (
-                requests.exceptions.RequestException,
-                requests.exceptions.HTTPError,
-            ) as e:
-                log.error("SpiffyTitles: Twitch Error: {0}".format(e))
-                return self.handler_default(url, channel)
             user_data = {}
             try:
-                response = json.loads(request.content.decode())
-                user_data = response["data"][0]
+                user_data = self.get_twitch_user(display_name, headers)
                 description = user_data["description"]
                 game_id = data["game_id"]
                 game_name = game_id
@@ -1141,14 +1195,7 @@ class SpiffyTitles(callbacks.Plugin):
                 view_count = data["view_count"]
                 created_at = self._time_created_at(data["created_at"])
                 if game_id:
-                    get_game = requests.get(
-                        "https://api.twitch.tv/helix/games?id={}".format(game_id),
-                        timeout=self.timeout,
-                        headers=headers,
-                        proxies=self.proxies,
-                    )
-                    game_data = json.loads(get_game.content.decode())
-                    game_name = game_data["data"][0]["name"]
+                    game_name = self.get_twitch_game_name(game_id, headers)
                 template_vars = {
                     "display_name": display_name,
                     "game_name": game_name,
@@ -1159,6 +1206,9 @@ class SpiffyTitles(callbacks.Plugin):
                     "twitch_logo": twitch_logo,
                 }
                 reply = twitch_template.render(template_vars)
+            except requests.exceptions.RequestException as e:
+                log.error("SpiffyTitles: Twitch Error: {0}".format(e))
+                return self.handler_default(url, channel)
             except Exception as e:
                 self.log.error(
                     "SpiffyTitles: Error parsing Twitch.TV JSON response: %s" % (str(e))
@@ -1166,24 +1216,9 @@ class SpiffyTitles(callbacks.Plugin):
         elif link_type == "video":
             data = response["data"][0]
             display_name = data["user_name"]
-            data_url = "https://api.twitch.tv/helix/users?login={}".format(display_name)
-            try:
-                request = requests.get(
-                    data_url,
-                    timeout=self.timeout,
-                    headers=headers,
-                    proxies=self.proxies,
-                )
-            except (
-                requests.exceptions.RequestException,
-                requests.exceptions.HTTPError,
-            ) as e:
-                log.error("SpiffyTitles: Twitch Error: {0}".format(e))
-                return self.handler_default(url, channel)
             user_data = {}
             try:
-                response = json.loads(request.content.decode())
-                user_data = response["data"][0]
+                user_data = self.get_twitch_user(display_name, headers)
                 description = user_data["description"]
                 title = data["title"]
                 view_count = data["view_count"]
@@ -1199,6 +1234,9 @@ class SpiffyTitles(callbacks.Plugin):
                     "twitch_logo": twitch_logo,
                 }
                 reply = twitch_template.render(template_vars)
+            except requests.exceptions.RequestException as e:
+                log.error("SpiffyTitles: Twitch Error: {0}".format(e))
+                return self.handler_default(url, channel)
             except Exception as e:
                 self.log.error(
                     "SpiffyTitles: Error parsing Twitch.TV JSON response: %s" % (str(e))
@@ -1218,6 +1256,45 @@ class SpiffyTitles(callbacks.Plugin):
                 )
         return reply
 
+    def get_twitch_user(self, login, headers):
+        """
+        Returns the Twitch API record for a user login. Records are kept for
+        an hour so repeated links to a channel skip the lookup.
+        """
+        key = login.lower()
+        cached = self.twitch_users.get(key)
+        if cached and time.time() - cached[0] < 3600:
+            return cached[1]
+        request = self.session.get(
+            "https://api.twitch.tv/helix/users?login={}".format(login),
+            timeout=self.timeout,
+            headers=headers,
+            proxies=self.proxies,
+        )
+        request.raise_for_status()
+        response = json.loads(request.content.decode())
+        user_data = response["data"][0]
+        if len(self.twitch_users) >= 1000:
+            self.twitch_users.clear()
+        self.twitch_users[key] = (time.time(), user_data)
+        return user_data
+
+    def get_twitch_game_name(self, game_id, headers):
+        """
+        Returns the name of a Twitch game. Game names don't change, so they
+        are kept for the life of the plugin.
+        """
+        if game_id not in self.twitch_games:
+            get_game = self.session.get(
+                "https://api.twitch.tv/helix/games?id={}".format(game_id),
+                timeout=self.timeout,
+                headers=headers,
+                proxies=self.proxies,
+            )
+            game_data = json.loads(get_game.content.decode())
+            self.twitch_games[game_id] = game_data["data"][0]["name"]
+        return self.twitch_games[game_id]
+
     def _time_created_at(self, s):
         """
         Return relative time delta between now and s (dt string).
@@ -1280,7 +1357,7 @@ class SpiffyTitles(callbacks.Plugin):
         omdb_url = "http://www.omdbapi.com/"
         options = {"apikey": apikey, "i": imdb_id, "r": "json", "plot": "short"}
         try:
-            request = requests.get(
+            request = self.session.get(
                 omdb_url, params=options, timeout=self.timeout, proxies=self.proxies
             )
             request.raise_for_status()
@@ -1394,7 +1471,7 @@ class SpiffyTitles(callbacks.Plugin):
         extract = ""
         self.log.debug("SpiffyTitles: requesting %s" % (api_url))
         try:
-            request = requests.get(
+            request = self.session.get(
                 api_url, params=api_params, timeout=self.timeout, proxies=self.proxies
             )
             request.raise_for_status()
@@ -1472,7 +1549,7 @@ class SpiffyTitles(callbacks.Plugin):
         self.log.debug("SpiffyTitles: requesting %s" % (data_url))
         headers = {"User-Agent": self.get_user_agent()}
         try:
-            request = requests.get(
+            request = self.session.get(
                 data_url, headers=headers, timeout=self.timeout, proxies=self.proxies
             )
             request.raise_for_status()
@@ -1610,7 +1687,7 @@ class SpiffyTitles(callbacks.Plugin):
         headers = {"Authorization": "Client-ID {0}".format(client_id)}
         api_url = "https://api.imgur.com/3/album/{0}".format(album_id)
         try:
-            request = requests.get(
+            request = self.session.get(
                 api_url, headers=headers, timeout=self.timeout, proxies=self.proxies
             )
             request.raise_for_status()
@@ -1670,7 +1747,7 @@ class SpiffyTitles(callbacks.Plugin):
         headers = {"Authorization": "Client-ID {0}".format(client_id)}
         api_url = "https://api.imgur.com/3/image/{0}".format(image_id)
         try:
-            request = requests.get(
+            request = self.session.get(
                 api_url, headers=headers, timeout=self.timeout, proxies=self.proxies
             )
             request.raise_for_status()
@@ -1720,7 +1797,7 @@ class SpiffyTitles(callbacks.Plugin):
             url
         )
         try:
-            request = requests.get(api_url, timeout=self.timeout, proxies=self.proxies)
+            request = self.session.get(api_url, timeout=self.timeout, proxies=self.proxies)
             request.raise_for_status()
         except (
             requests.exceptions.RequestException,
@@ -1761,5 +1838,25 @@ class SpiffyTitles(callbacks.Plugin):
 
     t = wrap(t, ["text"])
 
+    def cachestats(self, irc, msg, args):
+        """takes no arguments
+
+        Shows link cache usage and hit/miss/eviction counters.
+        """
+        stats = self.link_cache.stats()
+        irc.reply(
+            "Link cache: {0} entries ({1}), {2} hits, {3} misses, "
+            "{4} evictions, {5} expired".format(
+                stats["entries"],
+                self.get_readable_file_size(stats["bytes"]),
+                stats["hits"],
+                stats["misses"],
+                stats["evictions"],
+                stats["expirations"],
+            )
+        )
+
+    cachestats = wrap(cachestats)
+
 
 Class = SpiffyTitles
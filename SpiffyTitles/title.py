@@ -0,0 +1,145 @@
+###
+# Copyright (c) 2015, butterscotchstallion
+# Copyright (c) 2020, oddluck <oddluck@riseup.net>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import codecs
+import re
+from html.parser import HTMLParser
+
+CHUNK_SIZE = 8192
+META_CHARSET = re.compile(
+    rb"""<meta[^>]+charset\s*=\s*["']?\s*([a-zA-Z0-9_:.-]+)""", re.I
+)
+
+
+class TitleFound(Exception):
+    pass
+
+
+class TitleParser(HTMLParser):
+    """
+    Collects the <title> and og:title of a page as it is fed. Raises
+    TitleFound once there is nothing more worth reading.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.title = None
+        self.og_title = None
+        self.in_title = False
+        self.parts = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "title" and self.title is None:
+            self.in_title = True
+        elif tag == "meta":
+            attrs = dict(attrs)
+            if attrs.get("property") == "og:title" and attrs.get("content"):
+                self.og_title = attrs["content"]
+        elif tag == "body" and (self.title or self.og_title):
+            raise TitleFound()
+
+    def handle_endtag(self, tag):
+        if tag == "title" and self.in_title:
+            self.in_title = False
+            self.title = "".join(self.parts)
+            if self.title.strip():
+                raise TitleFound()
+        elif tag == "head" and (self.title or self.og_title):
+            raise TitleFound()
+
+    def handle_data(self, data):
+        if self.in_title:
+            self.parts.append(data)
+
+    def result(self):
+        title = self.title
+        if not title and self.in_title:
+            title = "".join(self.parts)
+        if title and title.strip():
+            return title.strip()
+        if self.og_title and self.og_title.strip():
+            return self.og_title.strip()
+        return title.strip() if title is not None else None
+
+
+def get_charset(response, head):
+    """
+    Returns the character set of a response, from the Content-Type header,
+    a byte order mark or a <meta> tag in the first chunk, in that order
+    """
+    candidates = []
+    content_type = response.headers.get("content-type", "")
+    if "charset=" in content_type:
+        candidates.append(content_type.split("charset=")[-1].split(";")[0])
+    for bom, charset in (
+        (codecs.BOM_UTF8, "utf-8-sig"),
+        (codecs.BOM_UTF16_LE, "utf-16"),
+        (codecs.BOM_UTF16_BE, "utf-16"),
+    ):
+        if head.startswith(bom):
+            candidates.append(charset)
+    match = META_CHARSET.search(head[:4096])
+    if match:
+        candidates.append(match.group(1).decode("ascii"))
+    for charset in candidates:
+        charset = charset.strip("\"' ")
+        try:
+            return codecs.lookup(charset).name
+        except LookupError:
+            continue
+    return "utf-8"
+
+
+def read_title(response, max_bytes):
+    """
+    Reads a streamed response until its title is known or max_bytes have
+    been read. Returns (title, bytes_read); title is None if the page has
+    no <title> or og:title.
+    """
+    parser = TitleParser()
+    decoder = None
+    bytes_read = 0
+    try:
+        for chunk in response.iter_content(CHUNK_SIZE):
+            if not chunk:
+                continue
+            if decoder is None:
+                charset = get_charset(response, chunk)
+                decoder = codecs.getincrementaldecoder(charset)(errors="replace")
+            bytes_read += len(chunk)
+            parser.feed(decoder.decode(chunk))
+            if bytes_read >= max_bytes:
+                break
+        else:
+            if decoder is not None:
+                parser.feed(decoder.decode(b"", final=True))
+                parser.close()
+    except TitleFound:
+        pass
+    return (parser.result(), bytes_read)
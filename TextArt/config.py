@@ -67,7 +67,28 @@ conf.registerChannelValue(
 )
 
 conf.registerGlobalValue(
-    TextArt, "cacheColors", registry.Boolean(False, _("""Cache color calculations.""")),
+    TextArt,
+    "cacheColors",
+    registry.Boolean(
+        False,
+        _(
+            """Cache color calculations. Deprecated: colors are now matched
+            once per unique color of each image, see colorTables instead."""
+        ),
+    ),
+)
+
+conf.registerGlobalValue(
+    TextArt,
+    "colorTables",
+    registry.Boolean(
+        False,
+        _(
+            """Match colors through lookup tables of the RGB cube saved in the
+            data directory, built on first use of each palette and speed. Much
+            faster, at the cost of a little color accuracy."""
+        ),
+    ),
 )
 
 conf.registerChannelValue(
@@ -0,0 +1,194 @@
+###
+# Copyright (c) 2020, oddluck <oddluck@riseup.net>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+###
+
+"""
+Encoding of IRC colour formatted lines.
+
+Lines are built from cells: (fg, bg, char) tuples where fg and bg are IRC
+colours (99 being the client's default colour) or None when the cell looks
+the same whatever that colour is, like the foreground of a space. Colour codes
+are only emitted where the colours change, with as few digits as possible.
+"""
+
+DEFAULT = 99
+
+COLOR = "\x03"
+RESET = "\x0f"
+HEX_COLOR = "\x04"
+# Formatting that makes the foreground colour of spaces visible
+# (underline, reverse, strikethrough).
+SHOWS_FG = frozenset("\x1f\x16\x1e")
+
+
+def _number(color, char):
+    # A digit right after the code would be read as part of the colour.
+    if char.isdigit() and char.isascii():
+        return "%02d" % color
+    return str(color)
+
+
+def _code(fg, bg, wantfg, wantbg, char):
+    """
+    Return the colour code to emit before char to go from the fg and bg
+    colours to the wanted ones, and the resulting colours.
+    """
+    setfg = wantfg is not None and wantfg != fg
+    setbg = wantbg is not None and wantbg != bg
+    if not setbg:
+        if not setfg:
+            return "", fg, bg
+        if char != ",":
+            return COLOR + _number(wantfg, char), wantfg, bg
+        # A comma would be read as the start of a background colour
+        wantbg = bg
+    if wantfg is None:
+        wantfg = fg if fg != DEFAULT else 1
+    if wantfg == DEFAULT and wantbg == DEFAULT and not char.isdigit() and char != ",":
+        return COLOR, DEFAULT, DEFAULT
+    return "%s%d,%s" % (COLOR, wantfg, _number(wantbg, char)), wantfg, wantbg
+
+
+class LineEncoder(object):
+    """
+    Builds one IRC line. Each cell can be given as several equivalent
+    choices; the line is encoded with the choices (and the colours of don't
+    care foregrounds) that make it the shortest in bytes, keeping the best
+    BEAM colour states at each cell.
+    """
+
+    BEAM = 4
+
+    def __init__(self):
+        self.items = []
+
+    def add(self, *choices):
+        """Add a cell, given as one or more (fg, bg, char) tuples."""
+        self.items.append(choices)
+
+    def raw(self, text):
+        """Add formatting codes other than colours."""
+        self.items.append(text)
+
+    def line(self):
+        items = self.items
+        hints = [None] * (len(items) + 1)
+        for i in range(len(items) - 1, -1, -1):
+            item = items[i]
+            if isinstance(item, str) or item[0][0] is None:
+                hints[i] = hints[i + 1]
+            else:
+                hints[i] = item[0][0]
+        # (fg, bg) -> (bytes so far, (previous node, text))
+        states = {(DEFAULT, DEFAULT): (0, None)}
+        for i, item in enumerate(items):
+            if isinstance(item, str):
+                size = len(item.encode())
+                states = {
+                    ((DEFAULT, DEFAULT) if RESET in item else state): (
+                        cost + size,
+                        (node, item),
+                    )
+                    for state, (cost, node) in states.items()
+                }
+                continue
+            choices = []
+            for wantfg, wantbg, char in item:
+                size = len(char.encode())
+                choices.append((wantfg, wantbg, char, size))
+                if wantfg is None and wantbg is not None and hints[i + 1] is not None:
+                    choices.append((hints[i + 1], wantbg, char, size))
+            new = {}
+            for (fg, bg), (cost, node) in states.items():
+                for wantfg, wantbg, char, size in choices:
+                    code, newfg, newbg = _code(fg, bg, wantfg, wantbg, char)
+                    total = cost + len(code) + size
+                    state = (newfg, newbg)
+                    if state not in new or total < new[state][0]:
+                        new[state] = (total, (node, code + char))
+            if len(new) > self.BEAM:
+                new = dict(sorted(new.items(), key=lambda s: s[1][0])[: self.BEAM])
+            states = new
+        parts = []
+        node = min(states.values(), key=lambda s: s[0])[1]
+        while node is not None:
+            node, text = node
+            parts.append(text)
+        parts.reverse()
+        return "".join(parts)
+
+
+def decode(line):
+    """
+    Yield the cells of an IRC formatted line, and its formatting codes other
+    than colours as strings. Like a2m's output, a colour code with only a
+    background ("\\x03,5") keeps the foreground.
+    """
+    fg = bg = DEFAULT
+    shows_fg = set()
+    i, length = 0, len(line)
+    while i < length:
+        char = line[i]
+        i += 1
+        if char == COLOR:
+            digits = 0
+            while digits < 2 and i + digits < length and line[i + digits].isdigit():
+                digits += 1
+            if digits:
+                fg = int(line[i : i + digits])
+                i += digits
+            if i + 1 < length and line[i] == "," and line[i + 1].isdigit():
+                digits = 2 if i + 2 < length and line[i + 2].isdigit() else 1
+                bg = int(line[i + 1 : i + 1 + digits])
+                i += 1 + digits
+            elif not digits:
+                fg = bg = DEFAULT
+        elif char < " ":
+            if char == RESET:
+                fg = bg = DEFAULT
+                shows_fg.clear()
+            elif char in SHOWS_FG:
+                shows_fg ^= {char}
+            yield char
+        elif char in " \xa0" and not shows_fg:
+            yield (None, bg, char)
+        else:
+            yield (fg, bg, char)
+
+
+def reencode(line):
+    """Rewrite an IRC formatted line with as few colour codes as possible."""
+    if HEX_COLOR in line:
+        return line
+    encoder = LineEncoder()
+    for cell in decode(line):
+        if isinstance(cell, str):
+            encoder.raw(cell)
+        else:
+            encoder.add(cell)
+    return encoder.line()
@@ -28,6 +28,7 @@
 ###
 
 import supybot.ansi as ansi
+import supybot.conf as conf
 import supybot.utils as utils
 from supybot.commands import *
 import supybot.plugins as plugins
@@ -40,7 +41,7 @@ import os
 import requests
 from PIL import Image, ImageOps, ImageFont, ImageDraw, ImageEnhance
 import numpy as np
-import sys, math
+import sys
 import re
 import asyncio
 import pexpect
@@ -59,6 +60,8 @@ from .colors import (
     ansi99,
     x16colors,
 )
+from .encoder import LineEncoder, reencode
+from .quantize import ColorTables, image_colors
 
 try:
     from supybot.i18n import PluginInternationalization
@@ -83,7 +86,7 @@ class TextArt(callbacks.Plugin):
         self.old_color = None
         self.source_colors = 0
         self.agents = self.registryValue("userAgents")
-        self.matches = {}
+        self.tables = ColorTables(conf.supybot.directories.data.dirize("TextArt"))
 
     def doPrivmsg(self, irc, msg):
         channel = msg.args[0]
@@ -171,137 +174,21 @@ class TextArt(callbacks.Plugin):
             fg, bg, x = defaultFg, defaultBg, 0
         return image
 
-    def getColor(self, pixel, speed):
-        pixel = tuple(pixel)
-        try:
-            return self.matches[pixel]
-        except KeyError:
-            if self.colors == 16:
-                colors = list(colors16.keys())
-            elif self.colors == 99:
-                colors = list(colors99.keys())
-            else:
-                colors = list(colors83.keys())
-            closest_colors = sorted(
-                colors,
-                key=lambda color: self.distance(color, self.rgb2lab(pixel), speed),
-            )
-            closest_color = closest_colors[0]
-            if self.colors == 16:
-                self.matches[pixel] = colors16[closest_color]
-            elif self.colors == 99:
-                self.matches[pixel] = colors99[closest_color]
-            else:
-                self.matches[pixel] = colors83[closest_color]
-            self.source_colors += 1
-            return self.matches[pixel]
-
-    def rgb2lab(self, inputColor):
-        try:
-            return self.labmatches[inputColor]
-        except:
-            num = 0
-            RGB = [0, 0, 0]
-            for value in inputColor:
-                value = float(value) / 255
-                if value > 0.04045:
-                    value = ((value + 0.055) / 1.055) ** 2.4
-                else:
-                    value = value / 12.92
-                RGB[num] = value * 100
-                num = num + 1
-            XYZ = [
-                0,
-                0,
-                0,
-            ]
-            X = RGB[0] * 0.4124 + RGB[1] * 0.3576 + RGB[2] * 0.1805
-            Y = RGB[0] * 0.2126 + RGB[1] * 0.7152 + RGB[2] * 0.0722
-            Z = RGB[0] * 0.0193 + RGB[1] * 0.1192 + RGB[2] * 0.9505
-            XYZ[0] = round(X, 4)
-            XYZ[1] = round(Y, 4)
-            XYZ[2] = round(Z, 4)
-            XYZ[0] = (
-                float(XYZ[0]) / 95.047
-            )  # ref_X =  95.047   Observer= 2°, Illuminant= D65
-            XYZ[1] = float(XYZ[1]) / 100.0  # ref_Y = 100.000
-            XYZ[2] = float(XYZ[2]) / 108.883  # ref_Z = 108.883
-            num = 0
-            for value in XYZ:
-                if value > 0.008856:
-                    value = value ** (0.3333333333333333)
-                else:
-                    value = (7.787 * value) + (16 / 116)
-                XYZ[num] = value
-                num = num + 1
-            Lab = [0, 0, 0]
-            L = (116 * XYZ[1]) - 16
-            a = 500 * (XYZ[0] - XYZ[1])
-            b = 200 * (XYZ[1] - XYZ[2])
-            Lab[0] = round(L, 4)
-            Lab[1] = round(a, 4)
-            Lab[2] = round(b, 4)
-            self.labmatches[inputColor] = Lab
-            return self.labmatches[inputColor]
-
-    def ciede2000(self, lab1, lab2):
-        """ CIEDE2000 color difference formula. https://peteroupc.github.io/colorgen.html"""
-        dl = lab2[0] - lab1[0]
-        hl = lab1[0] + dl * 0.5
-        sqb1 = lab1[2] * lab1[2]
-        sqb2 = lab2[2] * lab2[2]
-        c1 = math.sqrt(lab1[1] * lab1[1] + sqb1)
-        c2 = math.sqrt(lab2[1] * lab2[1] + sqb2)
-        hc7 = math.pow((c1 + c2) * 0.5, 7)
-        trc = math.sqrt(hc7 / (hc7 + 6103515625))
-        t2 = 1.5 - trc * 0.5
-        ap1 = lab1[1] * t2
-        ap2 = lab2[1] * t2
-        c1 = math.sqrt(ap1 * ap1 + sqb1)
-        c2 = math.sqrt(ap2 * ap2 + sqb2)
-        dc = c2 - c1
-        hc = c1 + dc * 0.5
-        hc7 = math.pow(hc, 7)
-        trc = math.sqrt(hc7 / (hc7 + 6103515625))
-        h1 = math.atan2(lab1[2], ap1)
-        if h1 < 0:
-            h1 = h1 + math.pi * 2
-        h2 = math.atan2(lab2[2], ap2)
-        if h2 < 0:
-            h2 = h2 + math.pi * 2
-        hdiff = h2 - h1
-        hh = h1 + h2
-        if abs(hdiff) > math.pi:
-            hh = hh + math.pi * 2
-            if h2 <= h1:
-                hdiff = hdiff + math.pi * 2
-            else:
-                hdiff = hdiff - math.pi * 2
-        hh = hh * 0.5
-        t2 = 1 - 0.17 * math.cos(hh - math.pi / 6) + 0.24 * math.cos(hh * 2)
-        t2 = t2 + 0.32 * math.cos(hh * 3 + math.pi / 30)
-        t2 = t2 - 0.2 * math.cos(hh * 4 - math.pi * 63 / 180)
-        dh = 2 * math.sqrt(c1 * c2) * math.sin(hdiff * 0.5)
-        sqhl = (hl - 50) * (hl - 50)
-        fl = dl / (1 + (0.015 * sqhl / math.sqrt(20 + sqhl)))
-        fc = dc / (hc * 0.045 + 1)
-        fh = dh / (t2 * hc * 0.015 + 1)
-        dt = 30 * math.exp(
-            -math.pow(36 * hh - 55 * math.pi, 2) / (25 * math.pi * math.pi)
-        )
-        r = -2 * trc * math.sin(2 * dt * math.pi / 180)
-        de =  math.sqrt(fl * fl + fc * fc + fh * fh + r * fc * fh)
-        dep = 1.43 * de ** 0.70
-        return dep
-
-    def distance(self, c1, c2, speed):
-        if speed == "fast":
-            delta_e = math.sqrt(
-                (c1[0] - c2[0]) ** 2 + (c1[1] - c2[1]) ** 2 + (c1[2] - c2[2]) ** 2
+    def getColors(self, image, speed):
+        """Returns the IRC colour of every pixel of an RGB image array."""
+        if self.colors == 16:
+            colors = colors16
+        elif self.colors == 99:
+            colors = colors99
+        else:
+            colors = colors83
+        if self.registryValue("colorTables"):
+            colormap, self.source_colors = self.tables.image_colors(
+                image, colors, speed
             )
-        elif speed == "slow":
-            delta_e = self.ciede2000(c1, c2)
-        return delta_e
+        else:
+            colormap, self.source_colors = image_colors(image, colors, speed)
+        return colormap.tolist()
 
     def process_ansi(self, ansi):
         if self.colors == 16:
@@ -802,167 +689,25 @@ class TextArt(callbacks.Plugin):
             if quantize:
                 image2 = image2.quantize(dither=None)
                 image2 = image2.convert("RGB")
-            colormap = np.array(image2)
-            self.labmatches = {}
-            if not self.registryValue("cacheColors"):
-                self.matches = {}
+            colormap = self.getColors(np.array(image2), speed)
         # ascii image is a list of character strings
         aimg = []
         if type == "1/2":
-            k = 0
             for j in range(0, rows - 1, 2):
-                # append an empty string
-                aimg.append("")
-                old_color1 = "99"
-                old_color2 = "99"
-                old_char = None
+                line = LineEncoder()
                 for i in range(cols):
-                    color1 = "%02d" % self.getColor(colormap[j][i].tolist(), speed)
-                    color2 = "%02d" % self.getColor(colormap[j + 1][i].tolist(), speed)
-                    if color1 == color2:
-                        gsval = " "
-                    else:
-                        gsval = "▀"
-                    if color1 == old_color1 and color2 == old_color2:
-                        aimg[k] += gsval
-                        old_char = gsval
-                    elif gsval == " " and color1 == old_color2:
-                        aimg[k] += " "
-                        old_char = gsval
-                    elif gsval == " " and color1 == old_color1 and old_char == "█":
-                        aimg[k] = aimg[k][:-1]
-                        aimg[k] += "\x0301,{0}  ".format(color1)
-                        old_color1 = "01"
-                        old_color2 = color1
-                        old_char = gsval
-                    elif gsval == " " and color1 == old_color1 and old_char == "^█":
-                        aimg[k] = aimg[k][:-4]
-                        aimg[k] += "\x0301,{0}  ".format(color1)
-                        old_color1 = "01"
-                        old_color2 = color1
-                        old_char = gsval
-                    elif (
-                        gsval == " "
-                        and color1 == old_color1
-                        and old_char == "^^▀"
-                        and "tops" not in optlist
-                    ):
-                        aimg[k] = aimg[k][:-7]
-                        aimg[k] += "\x03{0},{1}▄ ".format(old_color2, color1)
-                        old_color1 = old_color2
-                        old_color2 = color1
-                        old_char = gsval
-                    elif (
-                        gsval == " "
-                        and color1 == old_color1
-                        and old_char != "█"
-                        and "tops" not in optlist
-                    ):
-                        aimg[k] += "█"
-                        old_char = "█"
-                    elif gsval == " " and "tops" not in optlist:
-                        aimg[k] += "\x03{0}█".format(color1)
-                        old_color1 = color1
-                        old_char = "^█"
-                    elif (
-                        gsval != " "
-                        and color1 == old_color1
-                        and old_char == "^█"
-                        and "tops" not in optlist
-                    ):
-                        aimg[k] = aimg[k][:-4]
-                        aimg[k] += "\x03{0},{1} ▄".format(color2, color1)
-                        old_color1 = color2
-                        old_color2 = color1
-                        old_char = "▄"
-                    elif gsval != " " and color2 == old_color1 and old_char == "^█":
-                        aimg[k] = aimg[k][:-4]
-                        aimg[k] += "\x03{0},{1} ▀".format(color1, color2)
-                        old_color1 = color1
-                        old_color2 = color2
-                        old_char = gsval
-                    elif (
-                        gsval != " "
-                        and color1 == old_color2
-                        and color2 == old_color1
-                        and old_char == "^^▀"
-                        and "tops" not in optlist
-                    ):
-                        aimg[k] = aimg[k][:-7]
-                        aimg[k] += "\x03{0},{1}▄▀".format(color1, color2)
-                        old_color1 = color1
-                        old_color2 = color2
-                        old_char = gsval
-                    elif (
-                        gsval != " "
-                        and color1 == old_color1
-                        and color2 != old_color2
-                        and old_char == "^^▀"
-                        and "tops" not in optlist
-                    ):
-                        aimg[k] = aimg[k][:-7]
-                        aimg[k] += "\x03{0},{1}▄\x03{2}▄".format(
-                            old_color2, color1, color2
-                        )
-                        old_color1 = color2
-                        old_color2 = color1
-                        old_char = "▄"
-                    elif (
-                        gsval != " "
-                        and color1 == old_color1
-                        and color2 != old_color2
-                        and old_char == "^▀"
-                        and "tops" not in optlist
-                    ):
-                        aimg[k] = aimg[k][:-4]
-                        aimg[k] += "\x03{0},{1}▄\x03{2}▄".format(
-                            old_color2, color1, color2
-                        )
-                        old_color1 = color2
-                        old_color2 = color1
-                        old_char = "▄"
-                    elif (
-                        gsval != " "
-                        and color1 == old_color2
-                        and color2 == old_color1
-                        and "tops" not in optlist
-                    ):
-                        aimg[k] += "▄"
-                        old_char = "▄"
-                    elif (
-                        gsval != " " and color1 == old_color2 and "tops" not in optlist
-                    ):
-                        aimg[k] += "\x03{0}▄".format(color2)
-                        old_color1 = color2
-                        old_char = "▄"
-                    elif color1 != old_color1 and color2 == old_color2:
-                        aimg[k] += "\x03{0}{1}".format(color1, gsval)
-                        old_color1 = color1
-                        if gsval == " ":
-                            old_char = gsval
+                    top = colormap[j][i]
+                    bottom = colormap[j + 1][i]
+                    if "tops" in optlist:
+                        if top == bottom:
+                            line.add((None, top, " "))
                         else:
-                            old_char = "^▀"
+                            line.add((top, bottom, "▀"))
+                    elif top == bottom:
+                        line.add((None, top, " "), (top, None, "█"))
                     else:
-                        aimg[k] += "\x03{0},{1}{2}".format(color1, color2, gsval)
-                        old_color1 = color1
-                        old_color2 = color2
-                        if gsval == " ":
-                            old_char = gsval
-                        else:
-                            old_char = "^^▀"
-                if "tops" in optlist:
-                    aimg[k] = re.sub("\x03\d\d,(\d\d\s+\x03)", "\x0301,\g<1>", aimg[k])
-                    aimg[k] = re.sub("\x03\d\d,(\d\d\s+$)", "\x0301,\g<1>", aimg[k])
-                    aimg[k] = re.sub("\x03\d\d,(\d\d\s\x03)", "\x0301,\g<1>", aimg[k])
-                aimg[k] = re.sub(
-                    "\x0301,(\d\d)(\s+)\x03(\d\d)([^,])",
-                    "\x03\g<3>,\g<1>\g<2>\g<4>",
-                    aimg[k],
-                )
-                for i in range(0, 98):
-                    i = "%02d" % i
-                    aimg[k] = aimg[k].replace("{0}".format(i), "{0}".format(int(i)))
-                k += 1
+                        line.add((top, bottom, "▀"), (bottom, top, "▄"))
+                aimg.append(line.line())
         else:
             if "chars" not in optlist and gscale != "\xa0":
                 image = image.resize((cols, rows), resize)
@@ -971,9 +716,7 @@ class TextArt(callbacks.Plugin):
             # generate list of dimensions
             char = 0
             for j in range(rows):
-                # append an empty string
-                aimg.append("")
-                old_color = None
+                line = LineEncoder()
                 for i in range(cols):
                     if "chars" not in optlist and gscale != "\xa0":
                         # get average luminance
@@ -991,49 +734,18 @@ class TextArt(callbacks.Plugin):
                     else:
                         gsval = "\xa0"
                     # get color value
-                    if type != "no-color" and gscale != "\xa0" and i == 0:
-                        color = self.getColor(colormap[j][i].tolist(), speed)
-                        old_color = color
-                        if bg != 99:
-                            color = "{0},{1}".format(color, "{:02d}".format(int(bg)))
-                        if gsval != "\xa0":
-                            aimg[j] += "\x03{0}{1}".format(color, gsval)
-                        else:
-                            aimg[j] += "\x030,{0} ".format(int(color))
-                    elif type == "no-color" and i == 0:
-                        if bg != 99 and fg != 99:
-                            aimg[j] += "\x03{0},{1}{2}".format(
-                                "{:02d}".format(int(fg)),
-                                "{:02d}".format(int(bg)),
-                                gsval,
-                            )
-                        elif fg != 99:
-                            aimg[j] += "\x03{0}{1}".format(
-                                "{:02d}".format(int(fg)), gsval
-                            )
-                        elif bg != 99:
-                            aimg[j] += "\x03{0},{1}{2}".format(
-                                "{:02d}".format(int(fg)),
-                                "{:02d}".format(int(bg)),
-                                gsval,
-                            )
-                    elif type != "no-color" and gsval != " ":
-                        color = self.getColor(colormap[j][i].tolist(), speed)
-                        if color != old_color:
-                            old_color = color
-                            # append ascii char to string
-                            if gsval != "\xa0":
-                                if gsval.isdigit():
-                                    color = "{:02d}".format(int(color))
-                                    aimg[j] += "\x03{0}{1}".format(color, gsval)
-                                else:
-                                    aimg[j] += "\x03{0}{1}".format(int(color), gsval)
-                            else:
-                                aimg[j] += "\x030,{0} ".format(int(color))
-                        else:
-                            aimg[j] += "{0}".format(gsval)
+                    if type == "no-color":
+                        color = fg
+                    elif gsval == "\xa0":
+                        line.add((None, colormap[j][i], " "))
+                        continue
+                    else:
+                        color = colormap[j][i]
+                    if gsval == " ":
+                        line.add((None, bg, gsval))
                     else:
-                        aimg[j] += "{0}".format(gsval)
+                        line.add((color, bg, gsval))
+                aimg.append(line.line())
         output = aimg
         self.stopped[channel] = False
         end_time = time.time()
@@ -1128,7 +840,7 @@ class TextArt(callbacks.Plugin):
         else:
             irc.reply("Invalid file type.", private=False, notice=False)
             return
-        output = file.splitlines()
+        output = [reencode(line) for line in file.splitlines()]
         asyncio.run(self.reply(irc, output, channel, delay))
 
     scroll = wrap(scroll, [optional("channel"), getopts({"delay": "float"}), "text"])
@@ -1212,8 +924,7 @@ class TextArt(callbacks.Plugin):
             irc.reply("Invalid file type.")
             return
         self.stopped[channel] = False
-        output = re.sub("(\x03(\d+).*)\x03,", "\g<1>\x03\g<2>,", output.decode())
-        output = output.splitlines()
+        output = [reencode(line) for line in output.decode().splitlines()]
         asyncio.run(self.reply(irc, output, channel, delay))
         if self.registryValue("pasteEnable", msg.args[0]):
             paste = ""
@@ -1321,8 +1032,7 @@ class TextArt(callbacks.Plugin):
             irc.reply("Invalid file type.", private=False, notice=False)
             return
         self.stopped[channel] = False
-        output = output.decode().splitlines()
-        output = [re.sub("^\x03 ", " ", line) for line in output]
+        output = [reencode(line) for line in output.decode().splitlines()]
         asyncio.run(self.reply(irc, output, channel, delay))
         if self.registryValue("pasteEnable", msg.args[0]):
             paste = ""
@@ -0,0 +1,212 @@
+###
+# Copyright (c) 2020, oddluck <oddluck@riseup.net>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+###
+
+"""
+Vectorized matching of RGB pixels to the nearest IRC colour.
+
+The maths follow the scalar versions the plugin used to run pixel by pixel:
+sRGB to CIE Lab (D65, 2° observer) and either the Euclidean distance in Lab
+("fast") or CIEDE2000 ("slow").
+"""
+
+import os
+import threading
+import zlib
+
+import numpy as np
+
+# Pixels are matched in chunks to bound the size of the distance matrices.
+CHUNK = 4096
+
+# Bits kept per channel in the lookup tables: 2 ** 18 cells, 256KB a table.
+BITS = 6
+
+
+def rgb2lab(rgb):
+    """Convert an (..., 3) array of RGB values to CIE Lab."""
+    rgb = np.asarray(rgb, dtype=np.float64) / 255
+    rgb = np.where(rgb > 0.04045, ((rgb + 0.055) / 1.055) ** 2.4, rgb / 12.92) * 100
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    x = np.round(r * 0.4124 + g * 0.3576 + b * 0.1805, 4) / 95.047
+    y = np.round(r * 0.2126 + g * 0.7152 + b * 0.0722, 4) / 100.0
+    z = np.round(r * 0.0193 + g * 0.1192 + b * 0.9505, 4) / 108.883
+    x, y, z = (
+        np.where(v > 0.008856, v ** 0.3333333333333333, 7.787 * v + 16 / 116)
+        for v in (x, y, z)
+    )
+    lab = np.stack((116 * y - 16, 500 * (x - y), 200 * (y - z)), axis=-1)
+    return np.round(lab, 4)
+
+
+def ciede2000(lab1, lab2):
+    """
+    CIEDE2000 colour difference between two broadcastable arrays of Lab
+    colours. https://peteroupc.github.io/colorgen.html
+    """
+    l1, a1, b1 = lab1[..., 0], lab1[..., 1], lab1[..., 2]
+    l2, a2, b2 = lab2[..., 0], lab2[..., 1], lab2[..., 2]
+    dl = l2 - l1
+    hl = l1 + dl * 0.5
+    sqb1 = b1 * b1
+    sqb2 = b2 * b2
+    c1 = np.sqrt(a1 * a1 + sqb1)
+    c2 = np.sqrt(a2 * a2 + sqb2)
+    hc7 = ((c1 + c2) * 0.5) ** 7
+    trc = np.sqrt(hc7 / (hc7 + 6103515625))
+    t2 = 1.5 - trc * 0.5
+    ap1 = a1 * t2
+    ap2 = a2 * t2
+    c1 = np.sqrt(ap1 * ap1 + sqb1)
+    c2 = np.sqrt(ap2 * ap2 + sqb2)
+    dc = c2 - c1
+    hc = c1 + dc * 0.5
+    hc7 = hc ** 7
+    trc = np.sqrt(hc7 / (hc7 + 6103515625))
+    h1 = np.arctan2(b1, ap1)
+    h1 = np.where(h1 < 0, h1 + np.pi * 2, h1)
+    h2 = np.arctan2(b2, ap2)
+    h2 = np.where(h2 < 0, h2 + np.pi * 2, h2)
+    hdiff = h2 - h1
+    hh = h1 + h2
+    wrap = np.abs(hdiff) > np.pi
+    hh = np.where(wrap, hh + np.pi * 2, hh)
+    hdiff = np.where(
+        wrap, np.where(h2 <= h1, hdiff + np.pi * 2, hdiff - np.pi * 2), hdiff
+    )
+    hh = hh * 0.5
+    t2 = 1 - 0.17 * np.cos(hh - np.pi / 6) + 0.24 * np.cos(hh * 2)
+    t2 = t2 + 0.32 * np.cos(hh * 3 + np.pi / 30)
+    t2 = t2 - 0.2 * np.cos(hh * 4 - np.pi * 63 / 180)
+    dh = 2 * np.sqrt(c1 * c2) * np.sin(hdiff * 0.5)
+    sqhl = (hl - 50) * (hl - 50)
+    fl = dl / (1 + (0.015 * sqhl / np.sqrt(20 + sqhl)))
+    fc = dc / (hc * 0.045 + 1)
+    fh = dh / (t2 * hc * 0.015 + 1)
+    dt = 30 * np.exp(-((36 * hh - 55 * np.pi) ** 2) / (25 * np.pi * np.pi))
+    r = -2 * trc * np.sin(2 * dt * np.pi / 180)
+    de = np.sqrt(fl * fl + fc * fc + fh * fh + r * fc * fh)
+    return 1.43 * de ** 0.70
+
+
+def nearest(rgb, colors, speed):
+    """
+    Return the IRC colour closest to each row of an (n, 3) RGB array.
+    colors is one of the Lab to IRC colour palettes from colors.py, speed is
+    "fast" (Euclidean distance in Lab) or "slow" (CIEDE2000).
+    """
+    palette = np.array(list(colors.keys()))
+    codes = np.array(list(colors.values()))
+    lab = rgb2lab(rgb)
+    matches = np.empty(len(lab), dtype=np.intp)
+    for start in range(0, len(lab), CHUNK):
+        chunk = lab[start : start + CHUNK, np.newaxis, :]
+        if speed == "slow":
+            distances = ciede2000(palette[np.newaxis, :, :], chunk)
+        else:
+            distances = ((chunk - palette[np.newaxis, :, :]) ** 2).sum(axis=-1)
+        matches[start : start + CHUNK] = distances.argmin(axis=1)
+    return codes[matches]
+
+
+def image_colors(image, colors, speed):
+    """
+    Match every pixel of an (h, w, 3) RGB image array to an IRC colour.
+    Returns the (h, w) array of IRC colours and the number of unique colours
+    in the image; each unique colour is only matched once.
+    """
+    pixels, inverse = np.unique(
+        np.asarray(image).reshape(-1, 3), axis=0, return_inverse=True
+    )
+    codes = nearest(pixels, colors, speed)
+    return codes[inverse.reshape(-1)].reshape(image.shape[:2]), len(pixels)
+
+
+def table_index(image, bits=BITS):
+    """Return the cell of the quantized RGB cube of each pixel of an image."""
+    image = np.asarray(image, dtype=np.intp) >> (8 - bits)
+    return (image[..., 0] << (2 * bits)) | (image[..., 1] << bits) | image[..., 2]
+
+
+def build_table(colors, speed, bits=BITS):
+    """Match the centre of every cell of the quantized RGB cube."""
+    levels = (np.arange(1 << bits) << (8 - bits)) | (1 << (7 - bits))
+    rgb = np.stack(np.meshgrid(levels, levels, levels, indexing="ij"), axis=-1)
+    return nearest(rgb.reshape(-1, 3), colors, speed).astype(np.uint8)
+
+
+class ColorTables(object):
+    """
+    Lookup tables from the quantized RGB cube to IRC colours, one for each
+    palette and speed. A table is built the first time it is needed and saved
+    in directory, later uses (and restarts) memory-map the saved file.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.tables = {}
+
+    def get(self, colors, speed):
+        # The palette is part of the file name so that edits to colors.py
+        # don't pick up stale tables.
+        palette = zlib.crc32(repr(sorted(colors.items())).encode())
+        key = (palette, speed)
+        with self.lock:
+            table = self.tables.get(key)
+            if table is not None:
+                return table
+            filename = os.path.join(
+                self.directory, "colors-%08x-%s-%d.npy" % (palette, speed, BITS)
+            )
+            try:
+                table = np.load(filename, mmap_mode="r")
+                if table.shape != (1 << (3 * BITS),):
+                    table = None
+            except (OSError, ValueError):
+                table = None
+            if table is None:
+                table = build_table(colors, speed)
+                try:
+                    os.makedirs(self.directory, exist_ok=True)
+                    with open(filename + ".tmp", "wb") as fd:
+                        np.save(fd, table)
+                    os.replace(filename + ".tmp", filename)
+                except OSError:
+                    pass
+            self.tables[key] = table
+            return table
+
+    def image_colors(self, image, colors, speed):
+        """
+        Match every pixel of an (h, w, 3) RGB image array to an IRC colour
+        using the lookup table. Returns the same as image_colors().
+        """
+        cells = table_index(image)
+        table = self.get(colors, speed)
+        return table[cells], len(np.unique(cells))
@@ -0,0 +1,106 @@
+###
+# Copyright (c) 2020, oddluck <oddluck@riseup.net>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+###
+
+import random
+
+from supybot.test import *
+
+from .encoder import LineEncoder, decode, reencode
+
+
+def encode(*cells):
+    encoder = LineEncoder()
+    for cell in cells:
+        if isinstance(cell, str):
+            encoder.raw(cell)
+        elif isinstance(cell, list):
+            encoder.add(*cell)
+        else:
+            encoder.add(cell)
+    return encoder.line()
+
+
+class EncoderTestCase(SupyTestCase):
+    def assertCells(self, decoded, cells):
+        # None in a cell means that colour doesn't matter
+        self.assertEqual(len(decoded), len(cells))
+        for got, want in zip(decoded, cells):
+            for a, b in zip(got, want):
+                if a is not None and b is not None:
+                    self.assertEqual(a, b)
+
+    def testRuns(self):
+        self.assertEqual(encode(*[(4, 1, "a")] * 3), "\x034,1aaa")
+        self.assertEqual(encode((4, 1, "a"), (5, 1, "b")), "\x034,1a\x035b")
+        self.assertEqual(encode((4, 1, "a"), (99, 99, "b")), "\x034,1a\x03b")
+
+    def testMinimalDigits(self):
+        self.assertEqual(encode((4, 1, "a"), (5, 1, "1")), "\x034,1a\x03051")
+        self.assertEqual(encode((4, 1, "a"), (5, 1, ",")), "\x034,1a\x035,1,")
+
+    def testDontCare(self):
+        self.assertEqual(encode((4, 2, "a"), (None, 2, " ")), "\x034,2a ")
+        self.assertEqual(encode((None, 2, " "), (4, 2, "a")), "\x034,2 a")
+        self.assertEqual(
+            encode([(3, 5, "▀"), (5, 3, "▄")], [(None, 5, " "), (5, None, "█")]),
+            "\x033,5▀ ",
+        )
+
+    def testRaw(self):
+        self.assertEqual(
+            encode("\x02", (4, 1, "a"), "\x02", (4, 1, "b")), "\x02\x034,1a\x02b"
+        )
+
+    def testReencode(self):
+        self.assertEqual(reencode("\x0304,01a\x0304,01b"), "\x034,1ab")
+        # a2m: a background only code keeps the foreground
+        self.assertEqual(
+            list(decode("\x034,1ab\x03,2c")), [(4, 1, "a"), (4, 1, "b"), (4, 2, "c")]
+        )
+        self.assertEqual(reencode("\x034,1ab\x03,2c"), "\x034,1ab\x034,2c")
+        # p2u: a bare colour code at the start of the line
+        self.assertEqual(reencode("\x03 abc"), " abc")
+        # hex colours are left alone
+        self.assertEqual(reencode("\x04ff0000a"), "\x04ff0000a")
+
+    def testRoundTrip(self):
+        rng = random.Random(0)
+        chars = ["a", "1", ",", "▀", " "]
+        for n in range(200):
+            cells = []
+            for i in range(rng.randint(1, 30)):
+                char = rng.choice(chars)
+                fg = None if char == " " else rng.choice([rng.randrange(99), 99])
+                cells.append((fg, rng.choice([rng.randrange(99), 99]), char))
+            line = encode(*cells)
+            self.assertCells(list(decode(line)), cells)
+            self.assertEqual(reencode(line), line)
+
+
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
@@ -46,6 +46,9 @@ import time
 import datetime
 import unicodedata
 import hashlib
+import functools
+import threading
+import queue
 
 # A list with items that are removed when timeout is reached, values must be unique
 class TimeoutList:
@@ -115,9 +118,13 @@ class Game:
         self.questionType = ""
         self.question = ""
         self.answers = []
+        self.answerKeys = []
+        self.answerLookup = {}
+        self.answerFirstChars = set()
+        self.answerMinLength = 0
         self.questionPoints = -1
         self.correctPlayers = {}
-        self.guessedAnswers = []
+        self.guessedAnswers = set()
         self.skipList = []
         self.streak = 0
         self.lastWinner = ""
@@ -139,34 +146,38 @@ class Game:
         Check users input to see if answer was given.
         """
         channel = msg.args[0]
-        # is it a user?
-        username = self.base.getUsername(msg.nick, msg.prefix)
-        usernameCanonical = ircutils.toLower(username)
-        correctAnswerFound = False
-        correctAnswer = ""
+        text = msg.args[1]
 
-        attempt = self.normalizeString(msg.args[1])
+        # Most lines are chat, throw them out before doing any Unicode work.
+        # Normalizing ASCII never grows it or changes the first character.
+        if text.isascii():
+            if (
+                len(text) < self.answerMinLength
+                or text[:1].lower() not in self.answerFirstChars
+            ):
+                return
+            attempt = self.removeExtraSpaces(text).lower()
+        else:
+            attempt = self.normalizeString(text)
 
         # Check for a correct answer that hasn't already been guessed
-        for ans in self.answers:
-            normalizedAns = self.normalizeString(ans)
-            if normalizedAns == attempt and normalizedAns not in self.guessedAnswers:
-                correctAnswerFound = True
-                correctAnswer = ans
+        correctAnswer = self.answerLookup.get(attempt)
 
         # Immediately return if not a correct answer
-        if not correctAnswerFound:
+        if correctAnswer is None or attempt in self.guessedAnswers:
             return
 
-        dbLocation = self.registryValue("admin.db")
-        threadStorage = Storage(dbLocation)
+        # is it a user?
+        username = self.base.getUsername(msg.nick, msg.prefix)
+        usernameCanonical = ircutils.toLower(username)
+
+        threadStorage = self.storage
 
         timeElapsed = float(time.time() - self.askedAt)
         points = self.questionPoints
 
         # Add answer to list so we can cross it out
-        if self.guessedAnswers.count(attempt) == 0:
-            self.guessedAnswers.append(attempt)
+        self.guessedAnswers.add(attempt)
 
         # Past first hint? deduct points
         if self.hintsCounter > 1:
@@ -193,7 +204,7 @@ class Game:
             self.shownHint = False
 
             # Check if all answers have been answered
-            if len(self.guessedAnswers) == len(self.answers):
+            if len(self.guessedAnswers) == len(self.answerLookup):
                 self.state = "post-question"
                 self.removeEvent()
 
@@ -260,6 +271,7 @@ class Game:
             )
 
             if self.registryValue("general.showStats", self.channel):
+                threadStorage.flush()
                 if self.registryValue("general.globalStats"):
                     stat = threadStorage.getUserStat(username, None)
                 else:
@@ -317,8 +329,8 @@ class Game:
 
         # create a string with hints for all of the answers
         if self.questionType == "kaos":
-            for ans in self.answers:
-                if ircutils.toLower(ans) not in self.guessedAnswers:
+            for ans, key in zip(self.answers, self.answerKeys):
+                if key not in self.guessedAnswers:
                     ans = str(ans)
                     hintStr = ""
                     if hintNum == 0:
@@ -496,8 +508,8 @@ class Game:
             if self.questionType == "kaos":
                 # Create a string to show answers missed
                 missedAnswers = ""
-                for ans in self.answers:
-                    if ircutils.toLower(ans) not in self.guessedAnswers:
+                for ans, key in zip(self.answers, self.answerKeys):
+                    if key not in self.guessedAnswers:
                         missedAnswers += " [{0}]".format(ans)
                 self.sendMessage(
                     """Time's up! No one got \x02%s\x02""" % missedAnswers.strip()
@@ -573,43 +585,38 @@ class Game:
         # Reset and increment question properties
         self.state = "pre-question"
         del self.skipList[:]
-        del self.guessedAnswers[:]
+        self.guessedAnswers.clear()
         self.totalAmountWon = 0
         self.correctPlayers.clear()
         self.hintsCounter = 0
         self.numAsked += 1
 
-        # grab the next question
-        numQuestion = self.storage.getNumQuestions()
-        if numQuestion == 0:
-            self.sendMessage(
-                "There are no questions. Stopping. If you are an admin, use the addfile"
-                " command to add questions to the database."
-            )
-            self.stop()
-            return
-
         # Check if we've asked all questions
         numQuestionsLeftInRound = self.storage.getNumQuestionsNotAsked(
             self.channel, self.roundStartedAt
         )
         if numQuestionsLeftInRound == 0:
-            self.numAsked = 1
-            self.roundStartedAt = time.mktime(time.localtime())
-            self.storage.updateGameRoundStarted(self.channel, self.roundStartedAt)
-            self.sendMessage(
-                "All of the questions have been asked, shuffling and starting over"
-            )
+            # grab the next question
+            numQuestion = self.storage.getNumQuestions()
+            if numQuestion == 0:
+                self.stopNoQuestions()
+                return
+
+            self.newRound()
 
         # Update DB with new round number
         self.storage.updateGame(self.channel, self.numAsked)
 
         # Retrieve new question from DB
         retrievedQuestion = self.retrieveQuestion()
+        if retrievedQuestion is None:
+            self.stopNoQuestions()
+            return
         self.questionID = retrievedQuestion["id"]
         self.questionType = retrievedQuestion["type"]
         self.question = retrievedQuestion["question"]
         self.answers = retrievedQuestion["answers"]
+        self.loadAnswers()
         self.questionPoints = retrievedQuestion["points"]
 
         # Store the question and round number so it can be reported
@@ -629,6 +636,34 @@ class Game:
         # Start hint loop
         self.loopEvent()
 
+    def newRound(self):
+        """
+        Starts a new round with a freshly shuffled deck.
+        """
+        self.numAsked = 1
+        self.roundStartedAt = time.mktime(time.localtime())
+        self.storage.updateGameRoundStarted(self.channel, self.roundStartedAt)
+        self.storage.shuffleDeck(self.channel, self.roundStartedAt)
+        self.sendMessage(
+            "All of the questions have been asked, shuffling and starting over"
+        )
+
+    def stopNoQuestions(self):
+        self.sendMessage(
+            "There are no questions. Stopping. If you are an admin, use the"
+            " addfile command to add questions to the database."
+        )
+        self.stop()
+
+    def loadAnswers(self):
+        """
+        Normalizes the answers once per question for checkAnswer.
+        """
+        self.answerKeys = [self.normalizeString(ans) for ans in self.answers]
+        self.answerLookup = dict(zip(self.answerKeys, self.answers))
+        self.answerFirstChars = set(key[:1] for key in self.answerKeys)
+        self.answerMinLength = min([len(key) for key in self.answerKeys] or [0])
+
     def normalizeString(self, s):
         return str.lower(self.removeExtraSpaces(self.removeAccents(s)))
 
@@ -675,6 +710,16 @@ class Game:
         rawData = self.storage.getRandomQuestionNotAsked(
             self.channel, self.roundStartedAt
         )
+        if rawData is None:
+            # The rest of the deck was deleted from the website, so the round
+            # is over early
+            self.newRound()
+            self.storage.updateGame(self.channel, self.numAsked)
+            rawData = self.storage.getRandomQuestionNotAsked(
+                self.channel, self.roundStartedAt
+            )
+            if rawData is None:
+                return None
         rawQuestion = rawData["question"]
         netTimesAnswered = rawData["num_answered"] - rawData["num_missed"]
         questionParts = rawQuestion.split("*")
@@ -789,18 +834,67 @@ class Game:
                 del self.games[self.network][channelCanonical]
 
 
+def queued(f):
+    """
+    Hands a Storage write over to the database's writer thread, if one is
+    running, instead of running it and committing straight away.
+    """
+
+    @functools.wraps(f)
+    def newf(self, *args, **kwargs):
+        writer = StorageWriter.writers.get(self.loc)
+        if writer is None or self.batching:
+            return f(self, *args, **kwargs)
+        writer.put(f.__name__, args, kwargs)
+
+    return newf
+
+
 # Storage for users and points using sqlite3
 class Storage:
     """
     Storage class
     """
 
+    # one connection per thread and database file
+    local = threading.local()
+    busyTimeout = 30
+
     def __init__(self, loc):
         self.loc = loc
-        self.conn = sqlite3.connect(loc, check_same_thread=False)  # dont check threads
-        # otherwise errors
-        self.conn.text_factory = str
-        self.conn.row_factory = sqlite3.Row
+        self.batching = False
+
+    @property
+    def conn(self):
+        conns = getattr(self.local, "conns", None)
+        if conns is None:
+            conns = self.local.conns = {}
+        conn = conns.get(self.loc)
+        if conn is None:
+            # Writes made outside the writer thread wait for its batch to be
+            # committed instead of failing with "database is locked"
+            conn = sqlite3.connect(self.loc, timeout=self.busyTimeout)
+            conn.text_factory = str
+            conn.row_factory = sqlite3.Row
+            # WAL lets readers carry on while the writer commits, and only
+            # syncs to disk on checkpoints
+            conn.execute("""PRAGMA journal_mode=WAL""")
+            conn.execute("""PRAGMA synchronous=NORMAL""")
+            conns[self.loc] = conn
+        return conn
+
+    def commit(self):
+        # The writer thread commits once per batch
+        if not self.batching:
+            self.conn.commit()
+
+    def flush(self):
+        """
+        Waits until every queued write has been committed.
+        """
+        writer = StorageWriter.writers.get(self.loc)
+        if writer is not None and not self.batching:
+            writer.flush()
 
     def chunk(self, qs, rows=10000):
         """ Divides the data into 10000 rows each """
@@ -929,7 +1023,8 @@ class Storage:
                             WHERE id=?""",
             (questionId,),
         )
-        self.conn.commit()
+        self.removeFromDecks(questionId, c)
+        self.commit()
         c.close()
 
     def dropActivityTable(self):
@@ -972,6 +1067,23 @@ class Storage:
             pass
         c.close()
 
+    def dropDeckTable(self):
+        c = self.conn.cursor()
+        try:
+            c.execute("""DROP TABLE triviadeck""")
+            c.execute("""DROP TABLE triviadeckinfo""")
+        except:
+            pass
+        c.close()
+
+    def dropUserScoreTable(self):
+        c = self.conn.cursor()
+        try:
+            c.execute("""DROP TABLE triviauserscore""")
+        except:
+            pass
+        c.close()
+
     def dropGameTable(self):
         c = self.conn.cursor()
         try:
@@ -1030,22 +1142,82 @@ class Storage:
             pass
         c.close()
 
-    def getRandomQuestionNotAsked(self, channel, roundStart):
+    def getDeckInfo(self, channel, roundStart):
+        """
+        Returns the deck info row for the channel, rebuilding the deck when it
+        does not belong to the round started at roundStart.
+        """
+        channelCanonical = ircutils.toLower(channel)
         c = self.conn.cursor()
         c.execute(
             """SELECT * 
-                     FROM triviaquestion
-                     WHERE deleted=0 AND 
-                           id NOT IN 
-                               (SELECT tl.line_num 
-                                FROM triviagameslog tl 
-                                WHERE tl.channel_canonical=? AND 
-                                      tl.asked_at>=?)
-                     ORDER BY random() LIMIT 1""",
-            (ircutils.toLower(channel), roundStart),
+                     FROM triviadeckinfo
+                     WHERE channel_canonical=?""",
+            (channelCanonical,),
         )
         row = c.fetchone()
         c.close()
+        if row is None or row["round_started"] != roundStart:
+            # Deck is missing or stale (new database, or round changed
+            # elsewhere), leave out what was already asked this round
+            row = self.shuffleDeck(channel, roundStart, True)
+        else:
+            # Deal in questions added from the website since the last draw
+            c = self.conn.cursor()
+            if self.insertIntoDecks([], c, channelCanonical):
+                self.commit()
+                c.execute(
+                    """SELECT * 
+                             FROM triviadeckinfo
+                             WHERE channel_canonical=?""",
+                    (channelCanonical,),
+                )
+                row = c.fetchone()
+            c.close()
+        return row
+
+    def getRandomQuestionNotAsked(self, channel, roundStart):
+        """
+        Pops the next question from the channel's shuffled deck.
+        """
+        channelCanonical = ircutils.toLower(channel)
+        self.getDeckInfo(channel, roundStart)
+        c = self.conn.cursor()
+        row = None
+        while row is None:
+            c.execute(
+                """SELECT position, question_id 
+                         FROM triviadeck
+                         WHERE channel_canonical=?
+                         ORDER BY position LIMIT 1""",
+                (channelCanonical,),
+            )
+            card = c.fetchone()
+            if card is None:
+                break
+            c.execute(
+                """DELETE FROM triviadeck
+                         WHERE channel_canonical=? AND 
+                               position=?""",
+                (channelCanonical, card["position"]),
+            )
+            c.execute(
+                """UPDATE triviadeckinfo 
+                         SET remaining=remaining-1
+                         WHERE channel_canonical=?""",
+                (channelCanonical,),
+            )
+            # Questions can be deleted behind our back by the website
+            c.execute(
+                """SELECT * 
+                         FROM triviaquestion
+                         WHERE deleted=0 AND 
+                               id=?""",
+                (card["question_id"],),
+            )
+            row = c.fetchone()
+        self.commit()
+        c.close()
         return row
 
     def getQuestionById(self, id):
@@ -1078,320 +1250,66 @@ class Storage:
         return row
 
     def getNumQuestionsNotAsked(self, channel, roundStart):
-        c = self.conn.cursor()
-        c.execute(
-            """SELECT count(id) 
-                     FROM triviaquestion
-                     WHERE deleted=0 AND 
-                           id NOT IN 
-                                (SELECT tl.line_num 
-                                 FROM triviagameslog tl 
-                                 WHERE tl.channel=? AND 
-                                       tl.asked_at>=?)""",
-            (channel, roundStart),
-        )
-        row = c.fetchone()
-        c.close()
-        return row[0]
+        return self.getDeckInfo(channel, roundStart)["remaining"]
+
+    def getPeriodKeys(self, day=None, month=None, year=None):
+        """
+        Returns the (period, period_key) pairs a day's points count towards.
+        """
+        if day is None or month is None or year is None:
+            d = datetime.date.today()
+        else:
+            d = datetime.date(year, month, day)
+        weekStart = d - datetime.timedelta(d.weekday())
+        return [
+            ("day", d.strftime("%Y-%m-%d")),
+            ("week", weekStart.strftime("%Y-%m-%d")),
+            ("month", d.strftime("%Y-%m")),
+            ("year", d.strftime("%Y")),
+            ("total", ""),
+        ]
 
     def getUserRank(self, username, channel):
         usernameCanonical = ircutils.toLower(username)
-        channelCanonical = None
+        channelCanonical = ""
         if channel is not None:
             channelCanonical = ircutils.toLower(channel)
-        dateObject = datetime.date.today()
-        day = dateObject.day
-        month = dateObject.month
-        year = dateObject.year
         data = {}
 
-        # Retrieve total rank
-        query = """SELECT tr.rank
-                   FROM (SELECT COUNT(tu2.id)+1 AS rank
-                         FROM (SELECT id, 
-                                      username, 
-                                      sum(points_made) AS totalscore
-                               FROM triviauserlog"""
-        arguments = []
-
-        if channel is not None:
-            query = """%s WHERE channel_canonical=?""" % (query)
-            arguments.append(channelCanonical)
-
-        query = """%s GROUP BY username_canonical) AS tu2
-                        WHERE tu2.totalscore > (
-                            SELECT SUM(points_made)
-                            FROM triviauserlog
-                            WHERE username_canonical=?""" % (
-            query
-        )
-        arguments.append(usernameCanonical)
-
-        if channel is not None:
-            query = """%s AND channel_canonical=?""" % (query)
-            arguments.append(channelCanonical)
-
-        query = """%s )) AS tr
-                    WHERE EXISTS(
-                            SELECT *
-                            FROM triviauserlog
-                            WHERE username_canonical=?""" % (
-            query
-        )
-        arguments.append(usernameCanonical)
-
-        if channel is not None:
-            query = """%s AND channel_canonical=?""" % (query)
-            arguments.append(channelCanonical)
-
-        query = """%s ) LIMIT 1""" % (query)
-
         c = self.conn.cursor()
-        c.execute(query, tuple(arguments))
-        row = c.fetchone()
-        data["total"] = row[0] if row else 0
-
-        # Retrieve year rank
-        query = """SELECT tr.rank
-                   FROM (SELECT COUNT(tu2.id)+1 AS rank
-                         FROM (SELECT id, 
-                                      username, 
-                                      SUM(points_made) AS totalscore
-                               FROM triviauserlog
-                               WHERE year=?"""
-        arguments = [year]
-
-        if channel is not None:
-            query = """%s AND channel_canonical=?""" % (query)
-            arguments.append(channelCanonical)
-
-        query = """%s GROUP BY username_canonical) AS tu2
-                        WHERE tu2.totalscore > (
-                            SELECT sum(points_made)
-                            FROM triviauserlog
-                            WHERE year=? AND 
-                                  username_canonical=?""" % (
-            query
-        )
-        arguments.append(year)
-        arguments.append(usernameCanonical)
-
-        if channel is not None:
-            query = """%s AND channel_canonical=?""" % (query)
-            arguments.append(channelCanonical)
-
-        query = """%s )) AS tr
-                    WHERE EXISTS(
-                            SELECT *
-                            FROM triviauserlog
-                            WHERE year=? AND 
-                                  username_canonical=?""" % (
-            query
-        )
-        arguments.append(year)
-        arguments.append(usernameCanonical)
-
-        if channel is not None:
-            query = """%s AND channel_canonical=?""" % (query)
-            arguments.append(channelCanonical)
-
-        query = """%s ) LIMIT 1""" % (query)
-
-        c.execute(query, tuple(arguments))
-        row = c.fetchone()
-        data["year"] = row[0] if row else 0
-
-        # Retrieve month rank
-        query = """SELECT tr.rank
-                   FROM (SELECT COUNT(tu2.id)+1 AS rank
-                         FROM (SELECT id, 
-                                      username, 
-                                      SUM(points_made) AS totalscore
-                               FROM triviauserlog
-                               WHERE month=? AND 
-                                     year=?"""
-        arguments = [month, year]
-
-        if channel is not None:
-            query = """%s AND channel_canonical=?""" % (query)
-            arguments.append(channelCanonical)
-
-        query = """%s GROUP BY username_canonical) AS tu2
-                        WHERE tu2.totalscore > (
-                            SELECT SUM(points_made)
-                            FROM triviauserlog
-                            WHERE month=? AND 
-                                  year=? AND 
-                                  username_canonical=?""" % (
-            query
-        )
-        arguments.append(month)
-        arguments.append(year)
-        arguments.append(usernameCanonical)
-
-        if channel is not None:
-            query = """%s AND channel_canonical=?""" % (query)
-            arguments.append(channelCanonical)
-
-        query = """%s )) AS tr
-                    WHERE EXISTS(
-                            SELECT *
-                            FROM triviauserlog
-                            WHERE month=? AND 
-                                  year=? AND 
-                                  username_canonical=?""" % (
-            query
-        )
-        arguments.append(month)
-        arguments.append(year)
-        arguments.append(usernameCanonical)
-
-        if channel is not None:
-            query = """%s AND channel_canonical=?""" % (query)
-            arguments.append(channelCanonical)
-
-        query = """%s ) LIMIT 1""" % (query)
-
-        c.execute(query, tuple(arguments))
-        row = c.fetchone()
-        data["month"] = row[0] if row else 0
-
-        # Retrieve week rank
-        weekSqlClause = ""
-        d = datetime.date.today()
-        weekday = d.weekday()
-        d -= datetime.timedelta(weekday)
-        for i in range(7):
-            if i > 0:
-                weekSqlClause += " or "
-            weekSqlClause += """(year=%d AND 
-                                 month=%d AND 
-                                 day=%d)""" % (
-                d.year,
-                d.month,
-                d.day,
+        for period, periodKey in self.getPeriodKeys():
+            data[period] = 0
+            c.execute(
+                """SELECT points
+                         FROM triviauserscore
+                         WHERE period=? AND 
+                               period_key=? AND 
+                               channel_canonical=? AND 
+                               username_canonical=?""",
+                (period, periodKey, channelCanonical, usernameCanonical),
             )
-            d += datetime.timedelta(1)
-
-        weekSql = """SELECT tr.rank
-                     FROM (SELECT count(tu2.id)+1 AS rank
-                           FROM (SELECT id, 
-                                        username, 
-                                        SUM(points_made) AS totalscore
-                                 FROM triviauserlog
-                                 WHERE ("""
-        weekSql += weekSqlClause
-        weekSql += """)"""
-        arguments = []
-
-        if channel is not None:
-            weekSql = """%s AND channel_canonical=?""" % (weekSql)
-            arguments.append(channelCanonical)
-
-        weekSql += """GROUP BY username_canonical) AS tu2
-                        WHERE tu2.totalscore > (
-                            SELECT SUM(points_made)
-                            FROM triviauserlog
-                            WHERE username_canonical=?"""
-        arguments.append(usernameCanonical)
-
-        if channel is not None:
-            weekSql = """%s AND channel_canonical=?""" % (weekSql)
-            arguments.append(channelCanonical)
-
-        weekSql += """ AND ("""
-        weekSql += weekSqlClause
-        weekSql += """))) AS tr
-                    WHERE EXISTS(
-                            SELECT *
-                            FROM triviauserlog
-                            WHERE username_canonical=?"""
-        arguments.append(usernameCanonical)
-
-        if channel is not None:
-            weekSql = """%s AND channel_canonical=?""" % (weekSql)
-            arguments.append(channelCanonical)
-
-        weekSql += """ AND ("""
-        weekSql += weekSqlClause
-        weekSql += """)) LIMIT 1"""
-
-        c.execute(weekSql, tuple(arguments))
-        row = c.fetchone()
-        data["week"] = row[0] if row else 0
-
-        # Retrieve day rank
-        query = """SELECT tr.rank
-                   FROM (SELECT COUNT(tu2.id)+1 AS rank
-                         FROM (SELECT id, 
-                                      username, 
-                                      SUM(points_made) AS totalscore
-                               FROM triviauserlog
-                               WHERE day=? AND 
-                                     month=? AND 
-                                     year=?"""
-        arguments = [day, month, year]
-
-        if channel is not None:
-            query = """%s AND channel_canonical=?""" % (query)
-            arguments.append(channelCanonical)
-
-        query = """%s GROUP BY username_canonical) AS tu2
-                        WHERE tu2.totalscore > (
-                            SELECT SUM(points_made)
-                            FROM triviauserlog
-                            WHERE day=? AND 
-                                  month=? AND 
-                                  year=? AND 
-                                  username_canonical=?""" % (
-            query
-        )
-        arguments.append(day)
-        arguments.append(month)
-        arguments.append(year)
-        arguments.append(usernameCanonical)
-
-        if channel is not None:
-            query = """%s and channel_canonical=?""" % (query)
-            arguments.append(channelCanonical)
-
-        query = """%s )) AS tr
-                    WHERE EXISTS(
-                            SELECT *
-                            FROM triviauserlog
-                            WHERE day=? AND 
-                                  month=? AND 
-                                  year=? AND 
-                                  username_canonical=?""" % (
-            query
-        )
-        arguments.append(day)
-        arguments.append(month)
-        arguments.append(year)
-        arguments.append(usernameCanonical)
-
-        if channel is not None:
-            query = """%s AND channel_canonical=?""" % (query)
-            arguments.append(channelCanonical)
-
-        query = """%s ) LIMIT 1""" % (query)
-
-        c.execute(query, tuple(arguments))
-        row = c.fetchone()
-        data["day"] = row[0] if row else 0
+            row = c.fetchone()
+            if row is None:
+                continue
+            c.execute(
+                """SELECT COUNT(*)+1
+                         FROM triviauserscore
+                         WHERE period=? AND 
+                               period_key=? AND 
+                               channel_canonical=? AND 
+                               points>?""",
+                (period, periodKey, channelCanonical, row[0]),
+            )
+            data[period] = c.fetchone()[0]
 
         c.close()
         return data
 
     def getUserStat(self, username, channel):
         usernameCanonical = ircutils.toLower(username)
-        channelCanonical = None
+        channelCanonical = ""
         if channel is not None:
             channelCanonical = ircutils.toLower(channel)
-        dateObject = datetime.date.today()
-        day = dateObject.day
-        month = dateObject.month
-        year = dateObject.year
 
         c = self.conn.cursor()
 
@@ -1399,124 +1317,20 @@ class Storage:
         data["username"] = username
         data["username_canonical"] = usernameCanonical
 
-        # Retrieve total points and answered
-        query = """SELECT SUM(tl.points_made) AS points,
-                          SUM(tl.num_answered) AS answered
-                   FROM triviauserlog tl
-                   WHERE tl.username_canonical=?"""
-        arguments = [usernameCanonical]
-
-        if channel is not None:
-            query = """%s AND tl.channel_canonical=?""" % (query)
-            arguments.append(channelCanonical)
-
-        query = """%s LIMIT 1""" % (query)
-
-        c.execute(query, tuple(arguments))
-        row = c.fetchone()
-        if row:
-            data["points_total"] = row[0]
-            data["answer_total"] = row[1]
-
-        # Retrieve year points and answered
-        query = """SELECT SUM(tl.points_made) AS yearPoints,
-                          SUM(tl.num_answered) AS yearAnswered
-                   FROM triviauserlog tl
-                   WHERE tl.username_canonical=? AND 
-                         tl.year=?"""
-        arguments = [usernameCanonical, year]
-
-        if channel is not None:
-            query = """%s AND tl.channel_canonical=?""" % (query)
-            arguments.append(channelCanonical)
-
-        query = """%s LIMIT 1""" % (query)
-
-        c.execute(query, tuple(arguments))
-        row = c.fetchone()
-        if row:
-            data["points_year"] = row[0]
-            data["answer_year"] = row[1]
-
-        # Retrieve month points and answered
-        query = """SELECT SUM(tl.points_made) AS yearPoints,
-                          SUM(tl.num_answered) AS yearAnswered
-                   FROM triviauserlog tl
-                   WHERE tl.username_canonical=? AND 
-                         tl.year=? AND 
-                         tl.month=?"""
-        arguments = [usernameCanonical, year, month]
-
-        if channel is not None:
-            query = """%s AND tl.channel_canonical=?""" % (query)
-            arguments.append(channelCanonical)
-
-        query = """%s LIMIT 1""" % (query)
-
-        c.execute(query, tuple(arguments))
-        row = c.fetchone()
-        if row:
-            data["points_month"] = row[0]
-            data["answer_month"] = row[1]
-
-        # Retrieve week points and answered
-        query = """SELECT SUM(tl.points_made) AS yearPoints,
-                          SUM(tl.num_answered) AS yearAnswered
-                   FROM triviauserlog tl
-                   WHERE tl.username_canonical=? AND ("""
-
-        d = datetime.date.today()
-        weekday = d.weekday()
-        d -= datetime.timedelta(weekday)
-        for i in range(7):
-            if i > 0:
-                query += " or "
-            query += """
-                        (tl.year=%d
-                        AND tl.month=%d
-                        AND tl.day=%d)""" % (
-                d.year,
-                d.month,
-                d.day,
+        for period, periodKey in self.getPeriodKeys():
+            c.execute(
+                """SELECT points,
+                                 num_answered
+                         FROM triviauserscore
+                         WHERE period=? AND 
+                               period_key=? AND 
+                               channel_canonical=? AND 
+                               username_canonical=?""",
+                (period, periodKey, channelCanonical, usernameCanonical),
             )
-            d += datetime.timedelta(1)
-
-        query += ")"
-        arguments = [usernameCanonical]
-
-        if channel is not None:
-            query = """%s AND tl.channel_canonical=?""" % (query)
-            arguments.append(channelCanonical)
-
-        query = """%s LIMIT 1""" % (query)
-
-        c.execute(query, tuple(arguments))
-        row = c.fetchone()
-        if row:
-            data["points_week"] = row[0]
-            data["answer_week"] = row[1]
-
-        # Retrieve day points and answered
-        query = """SELECT SUM(tl.points_made) AS yearPoints,
-                          SUM(tl.num_answered) AS yearAnswered
-                   FROM triviauserlog tl
-                   WHERE tl.username_canonical=? AND 
-                         tl.year=? AND 
-                         tl.month=? AND 
-                         tl.day=?"""
-        arguments = [usernameCanonical, year, month, day]
-
-        if channel is not None:
-            query = """%s AND tl.channel_canonical=?""" % (query)
-            arguments.append(channelCanonical)
-
-        query = """%s LIMIT 1""" % (query)
-
-        c.execute(query, tuple(arguments))
-        row = c.fetchone()
-        if row:
-            data["points_day"] = row[0]
-            data["answer_day"] = row[1]
+            row = c.fetchone()
+            data["points_%s" % period] = row[0] if row else None
+            data["answer_%s" % period] = row[1] if row else None
 
         c.close()
         return data
@@ -1931,6 +1745,7 @@ class Storage:
         c.close()
         return row[0] > 0
 
+    @queued
     def insertActivity(self, aType, activity, channel, network, timestamp=None):
         if timestamp is None:
             timestamp = int(time.mktime(time.localtime()))
@@ -1941,7 +1756,7 @@ class Storage:
                      VALUES (NULL, ?, ?, ?, ?, ?, ?)""",
             (aType, activity, channel, channelCanonical, network, timestamp),
         )
-        self.conn.commit()
+        self.commit()
 
     def insertDelete(self, username, channel, lineNumber, reason):
         usernameCanonical = ircutils.toLower(username)
@@ -1959,7 +1774,7 @@ class Storage:
                 reason,
             ),
         )
-        self.conn.commit()
+        self.commit()
 
     def insertLogin(self, username, salt, isHashed, password, capability):
         usernameCanonical = ircutils.toLower(username)
@@ -1975,7 +1790,7 @@ class Storage:
                      VALUES (NULL, ?, ?, ?, ?, ?, ?)""",
             (username, usernameCanonical, salt, isHashed, password, capability),
         )
-        self.conn.commit()
+        self.commit()
 
     def insertUserLog(
         self,
@@ -2033,7 +1848,10 @@ class Storage:
                 channelCanonical,
             ),
         )
-        self.conn.commit()
+        self.updateUserScores(
+            c, username, channel, score, numAnswered, day, month, year
+        )
+        self.commit()
         c.close()
 
     def insertUser(
@@ -2069,7 +1887,7 @@ class Storage:
                 numQuestionsAccepted,
             ),
         )
-        self.conn.commit()
+        self.commit()
         c.close()
 
     def insertUserLevel(self, username, channel, level):
@@ -2085,7 +1903,7 @@ class Storage:
                      VALUES (?, ?, ?, ?, ?)""",
             (username, usernameCanonical, channel, channelCanonical, level),
         )
-        self.conn.commit()
+        self.commit()
         c.close()
 
     def insertGame(self, channel, numAsked=0, epoch=None):
@@ -2100,9 +1918,10 @@ class Storage:
                      VALUES (NULL, ?, ?, ?, 0, 0, ?, 0, "", "")""",
             (channel, numAsked, epoch, channelCanonical),
         )
-        self.conn.commit()
+        self.commit()
         c.close()
 
+    @queued
     def insertGameLog(
         self, channel, roundNumber, lineNumber, questionText, askedAt=None
     ):
@@ -2115,7 +1934,7 @@ class Storage:
                      VALUES (NULL, ?, ?, ?, ?, ?, ?)""",
             (channel, roundNumber, lineNumber, questionText, askedAt, channelCanonical),
         )
-        self.conn.commit()
+        self.commit()
         c.close()
 
     def insertReport(self, channel, username, reportText, questionNum, reportedAt=None):
@@ -2137,7 +1956,7 @@ class Storage:
                 channelCanonical,
             ),
         )
-        self.conn.commit()
+        self.commit()
         c.close()
 
     def insertQuestionsBulk(self, questions):
@@ -2150,11 +1969,99 @@ class Storage:
                              VALUES (NULL, ?, ?, 0, 0, 0)""",
                 chunk,
             )
-        self.conn.commit()
+        self.commit()
         skipped = self.removeDuplicateQuestions()
+        # Deal the questions that survived deduplication into running decks
+        self.insertIntoDecks([], c)
+        self.commit()
         c.close()
         return ((len(questions) - skipped), skipped)
 
+    def insertIntoDecks(self, questionIds, c, channel=None):
+        """
+        Shuffles questions into the unasked part of every channel's deck, or
+        only the deck of the given canonical channel. Questions added since a
+        deck last saw triviaquestion, by the bot or by the website, are dealt
+        in along with questionIds. Returns the number of cards dealt.
+        """
+        if channel is None:
+            c.execute(
+                """SELECT channel_canonical, next_position, last_question_id 
+                         FROM triviadeckinfo"""
+            )
+        else:
+            c.execute(
+                """SELECT channel_canonical, next_position, last_question_id 
+                         FROM triviadeckinfo
+                         WHERE channel_canonical=?""",
+                (channel,),
+            )
+        dealt = 0
+        for channelCanonical, nextPosition, lastId in c.fetchall():
+            c.execute(
+                """SELECT id 
+                         FROM triviaquestion
+                         WHERE deleted=0 AND 
+                               id>?""",
+                (lastId,),
+            )
+            newIds = [row[0] for row in c.fetchall()]
+            if not newIds and not questionIds:
+                continue
+            # Ids above lastId only come from newIds, so a question that a
+            # draw has already dealt in is not dealt again
+            deckIds = [id for id in questionIds if id <= lastId] + newIds
+            lastId = max([lastId] + newIds)
+            c.execute(
+                """SELECT MIN(position) 
+                         FROM triviadeck
+                         WHERE channel_canonical=?""",
+                (channelCanonical,),
+            )
+            firstPosition = c.fetchone()[0]
+            if firstPosition is None:
+                firstPosition = nextPosition
+            for questionId in deckIds:
+                # Swap a random unasked card to the bottom and put the new
+                # question in its place
+                position = random.randint(firstPosition, nextPosition)
+                c.execute(
+                    """SELECT position 
+                             FROM triviadeck
+                             WHERE channel_canonical=? AND 
+                                   position>=?
+                             ORDER BY position LIMIT 1""",
+                    (channelCanonical, position),
+                )
+                card = c.fetchone()
+                if card is None:
+                    position = nextPosition
+                else:
+                    position = card[0]
+                    c.execute(
+                        """UPDATE triviadeck 
+                                 SET position=?
+                                 WHERE channel_canonical=? AND 
+                                       position=?""",
+                        (nextPosition, channelCanonical, position),
+                    )
+                c.execute(
+                    """INSERT INTO triviadeck 
+                             VALUES (?, ?, ?)""",
+                    (channelCanonical, position, questionId),
+                )
+                nextPosition += 1
+            c.execute(
+                """UPDATE triviadeckinfo 
+                         SET remaining=remaining+?,
+                             next_position=?,
+                             last_question_id=?
+                         WHERE channel_canonical=?""",
+                (len(deckIds), nextPosition, lastId, channelCanonical),
+            )
+            dealt += len(deckIds)
+        return dealt
+
     def insertEdit(self, questionId, questionText, username, channel, createdAt=None):
         c = self.conn.cursor()
         channelCanonical = ircutils.toLower(channel)
@@ -2174,7 +2081,7 @@ class Storage:
                 channelCanonical,
             ),
         )
-        self.conn.commit()
+        self.commit()
         c.close()
 
     def insertTemporaryQuestion(self, username, channel, question):
@@ -2186,7 +2093,7 @@ class Storage:
                      VALUES (NULL, ?, ?, ?, ?, ?)""",
             (username, channel, question, usernameCanonical, channelCanonical),
         )
-        self.conn.commit()
+        self.commit()
         c.close()
 
     def isQuestionDeleted(self, id):
@@ -2229,7 +2136,7 @@ class Storage:
             )
         except:
             pass
-        self.conn.commit()
+        self.commit()
         c.close()
 
     def makeDeleteTable(self):
@@ -2247,7 +2154,7 @@ class Storage:
             )
         except:
             pass
-        self.conn.commit()
+        self.commit()
         c.close()
 
     def makeLevelTable(self):
@@ -2280,7 +2187,7 @@ class Storage:
             )
         except:
             pass
-        self.conn.commit()
+        self.commit()
         c.close()
 
     def makeUserTable(self):
@@ -2300,7 +2207,7 @@ class Storage:
             )
         except:
             pass
-        self.conn.commit()
+        self.commit()
         c.close()
 
     def makeUserLogTable(self):
@@ -2326,7 +2233,45 @@ class Storage:
             )
         except:
             pass
-        self.conn.commit()
+        self.commit()
+        c.close()
+
+    def makeUserScoreTable(self):
+        c = self.conn.cursor()
+        c.execute(
+            """CREATE INDEX IF NOT EXISTS userlogdateindex
+                     ON triviauserlog (channel_canonical, year, month, day, 
+                                       username_canonical)"""
+        )
+        c.execute(
+            """CREATE INDEX IF NOT EXISTS userloguserindex
+                     ON triviauserlog (username_canonical, channel_canonical)"""
+        )
+        try:
+            c.execute(
+                """CREATE TABLE triviauserscore (
+                            id INTEGER PRIMARY KEY AUTOINCREMENT,
+                            period TEXT,
+                            period_key TEXT,
+                            channel_canonical TEXT,
+                            username TEXT,
+                            username_canonical TEXT,
+                            points INTEGER,
+                            num_answered INTEGER,
+                            UNIQUE(period, period_key, channel_canonical, 
+                                   username_canonical))"""
+            )
+            c.execute(
+                """CREATE INDEX userscorerankindex
+                         ON triviauserscore (period, period_key, 
+                                             channel_canonical, points)"""
+            )
+        except:
+            pass
+        else:
+            # Fill the new table from the points already logged
+            self.rebuildUserScores(None, c)
+        self.commit()
         c.close()
 
     def makeGameTable(self):
@@ -2347,7 +2292,7 @@ class Storage:
             )
         except:
             pass
-        self.conn.commit()
+        self.commit()
         c.close()
 
     def makeGameLogTable(self):
@@ -2369,7 +2314,7 @@ class Storage:
             )
         except:
             pass
-        self.conn.commit()
+        self.commit()
         c.close()
 
     def makeInfoTable(self):
@@ -2397,7 +2342,7 @@ class Storage:
             )
         except:
             pass
-        self.conn.commit()
+        self.commit()
         c.close()
 
     def makeTemporaryQuestionTable(self):
@@ -2414,7 +2359,7 @@ class Storage:
             )
         except:
             pass
-        self.conn.commit()
+        self.commit()
         c.close()
 
     def makeQuestionTable(self):
@@ -2435,7 +2380,51 @@ class Storage:
             )
         except:
             pass
-        self.conn.commit()
+        self.commit()
+        c.close()
+
+    def makeDeckTable(self):
+        c = self.conn.cursor()
+        try:
+            c.execute(
+                """CREATE TABLE triviadeck (
+                            channel_canonical TEXT,
+                            position INTEGER,
+                            question_id INTEGER,
+                            PRIMARY KEY(channel_canonical, position))
+                            WITHOUT ROWID"""
+            )
+            c.execute(
+                """CREATE INDEX deckquestionindex
+                         ON triviadeck (question_id)"""
+            )
+        except:
+            pass
+        try:
+            c.execute(
+                """CREATE TABLE triviadeckinfo (
+                            channel_canonical TEXT PRIMARY KEY,
+                            round_started INTEGER,
+                            remaining INTEGER,
+                            next_position INTEGER,
+                            last_question_id INTEGER)"""
+            )
+        except:
+            pass
+        try:
+            # Decks made before questions added from the website were dealt in
+            c.execute(
+                """ALTER TABLE triviadeckinfo
+                         ADD COLUMN last_question_id INTEGER"""
+            )
+            c.execute(
+                """UPDATE triviadeckinfo
+                         SET last_question_id=(
+                            SELECT IFNULL(MAX(id), 0) FROM triviaquestion)"""
+            )
+        except:
+            pass
+        self.commit()
         c.close()
 
     def makeEditTable(self):
@@ -2455,7 +2444,7 @@ class Storage:
             )
         except:
             pass
-        self.conn.commit()
+        self.commit()
         c.close()
 
     def questionExists(self, question):
@@ -2493,9 +2482,51 @@ class Storage:
                         ORDER BY id DESC LIMIT ?)""",
             (count,),
         )
-        self.conn.commit()
+        self.commit()
         c.close()
 
+    def rebuildUserScores(self, usernames=None, c=None):
+        """
+        Recomputes the leaderboard aggregates from triviauserlog, for every
+        user or only the given ones.
+        """
+        cursor = c
+        if cursor is None:
+            cursor = self.conn.cursor()
+        userClause = ""
+        arguments = []
+        if usernames is not None:
+            arguments = [ircutils.toLower(username) for username in usernames]
+            userClause = "WHERE username_canonical IN (%s)" % ", ".join(
+                "?" * len(arguments)
+            )
+        cursor.execute(
+            """DELETE FROM triviauserscore %s""" % userClause, tuple(arguments)
+        )
+        dateSql = "date(printf('%04d-%02d-%02d', year, month, day))"
+        periodKeys = (
+            ("day", dateSql),
+            ("week", "date(%s, 'weekday 0', '-6 days')" % dateSql),
+            ("month", "printf('%04d-%02d', year, month)"),
+            ("year", "printf('%04d', year)"),
+            ("total", "''"),
+        )
+        for period, periodKey in periodKeys:
+            for channelColumn in ("channel_canonical", "''"):
+                cursor.execute(
+                    """INSERT INTO triviauserscore 
+                             SELECT NULL, ?, %s AS pk, %s AS cc, username, 
+                                    username_canonical, SUM(points_made), 
+                                    SUM(num_answered)
+                             FROM triviauserlog %s
+                             GROUP BY pk, cc, username_canonical"""
+                    % (periodKey, channelColumn, userClause),
+                    tuple([period] + arguments),
+                )
+        if c is None:
+            self.commit()
+            cursor.close()
+
     def removeDelete(self, deleteId):
         c = self.conn.cursor()
         c.execute(
@@ -2503,7 +2534,7 @@ class Storage:
                      WHERE id=?""",
             (deleteId,),
         )
-        self.conn.commit()
+        self.commit()
         c.close()
 
     def removeDuplicateQuestions(self):
@@ -2516,7 +2547,7 @@ class Storage:
                         GROUP BY question_canonical)"""
         )
         num = c.rowcount
-        self.conn.commit()
+        self.commit()
         c.close()
         return num
 
@@ -2527,9 +2558,25 @@ class Storage:
                      WHERE id=?""",
             (editId,),
         )
-        self.conn.commit()
+        self.commit()
         c.close()
 
+    def removeFromDecks(self, questionId, c):
+        c.execute(
+            """UPDATE triviadeckinfo 
+                     SET remaining=remaining-1
+                     WHERE channel_canonical IN (
+                        SELECT channel_canonical
+                        FROM triviadeck
+                        WHERE question_id=?)""",
+            (questionId,),
+        )
+        c.execute(
+            """DELETE FROM triviadeck
+                     WHERE question_id=?""",
+            (questionId,),
+        )
+
     def removeLogin(self, username):
         usernameCanonical = ircutils.toLower(username)
         c = self.conn.cursor()
@@ -2538,7 +2585,7 @@ class Storage:
                      WHERE username_canonical=?""",
             (usernameCanonical,),
         )
-        self.conn.commit()
+        self.commit()
         c.close()
 
     def removeReport(self, repId):
@@ -2548,7 +2595,7 @@ class Storage:
                      WHERE id=?""",
             (repId,),
         )
-        self.conn.commit()
+        self.commit()
         c.close()
 
     def removeReportByQuestionNumber(self, id):
@@ -2558,7 +2605,7 @@ class Storage:
                      WHERE question_num=?""",
             (id,),
         )
-        self.conn.commit()
+        self.commit()
         c.close()
 
     def removeEditByQuestionNumber(self, id):
@@ -2568,7 +2615,7 @@ class Storage:
                      WHERE question_id=?""",
             (id,),
         )
-        self.conn.commit()
+        self.commit()
         c.close()
 
     def removeDeleteByQuestionNumber(self, id):
@@ -2578,7 +2625,7 @@ class Storage:
                      WHERE line_num=?""",
             (id,),
         )
-        self.conn.commit()
+        self.commit()
         c.close()
 
     def removeTemporaryQuestion(self, id):
@@ -2588,7 +2635,7 @@ class Storage:
                      WHERE id=?""",
             (id,),
         )
-        self.conn.commit()
+        self.commit()
         c.close()
 
     def removeUserLogs(self, username, channel):
@@ -2601,7 +2648,8 @@ class Storage:
                            channel_canonical=?""",
             (usernameCanonical, channelCanonical),
         )
-        self.conn.commit()
+        self.rebuildUserScores([username], c)
+        self.commit()
         c.close()
 
     def restoreQuestion(self, id):
@@ -2609,12 +2657,65 @@ class Storage:
         test = c.execute(
             """UPDATE triviaquestion 
                             SET deleted=0
-                            WHERE id=?""",
+                            WHERE deleted=1 AND 
+                                  id=?""",
             (id,),
         )
-        self.conn.commit()
+        if test.rowcount > 0:
+            self.removeFromDecks(id, c)
+            self.insertIntoDecks([id], c)
+        self.commit()
         c.close()
 
+    def shuffleDeck(self, channel, roundStart, skipAsked=False):
+        """
+        Deals a freshly shuffled deck of every question for a new round.
+        With skipAsked, questions already asked since roundStart are left out.
+        """
+        channelCanonical = ircutils.toLower(channel)
+        c = self.conn.cursor()
+        c.execute("""SELECT id FROM triviaquestion WHERE deleted=0""")
+        questionIds = [row[0] for row in c.fetchall()]
+        if skipAsked:
+            c.execute(
+                """SELECT line_num 
+                         FROM triviagameslog
+                         WHERE channel_canonical=? AND 
+                               asked_at>=?""",
+                (channelCanonical, roundStart),
+            )
+            asked = set(row[0] for row in c.fetchall())
+            questionIds = [id for id in questionIds if id not in asked]
+        random.shuffle(questionIds)
+        c.execute("""SELECT IFNULL(MAX(id), 0) FROM triviaquestion""")
+        lastId = c.fetchone()[0]
+        c.execute(
+            """DELETE FROM triviadeck
+                     WHERE channel_canonical=?""",
+            (channelCanonical,),
+        )
+        for chunk in self.chunk(list(enumerate(questionIds))):
+            c.executemany(
+                """INSERT INTO triviadeck 
+                         VALUES (?, ?, ?)""",
+                [(channelCanonical, position, id) for position, id in chunk],
+            )
+        c.execute(
+            """INSERT OR REPLACE INTO triviadeckinfo 
+                     VALUES (?, ?, ?, ?, ?)""",
+            (channelCanonical, roundStart, len(questionIds), len(questionIds), lastId),
+        )
+        self.commit()
+        c.execute(
+            """SELECT * 
+                     FROM triviadeckinfo
+                     WHERE channel_canonical=?""",
+            (channelCanonical,),
+        )
+        row = c.fetchone()
+        c.close()
+        return row
+
     def transferUserLogs(self, userFrom, userTo, channel):
         userFromCanonical = ircutils.toLower(userFrom)
         userToCanonical = ircutils.toLower(userTo)
@@ -2688,7 +2789,8 @@ class Storage:
                 userToCanonical,
             ),
         )
-        self.conn.commit()
+        self.rebuildUserScores([userTo], c)
+        self.commit()
 
         self.removeUserLogs(userFrom, channel)
 
@@ -2757,9 +2859,10 @@ class Storage:
                      WHERE username_canonical=?""",
             (username, salt, isHashed, password, capability, usernameCanonical),
         )
-        self.conn.commit()
+        self.commit()
         c.close()
 
+    @queued
     def updateUserLog(
         self,
         username,
@@ -2829,9 +2932,41 @@ class Storage:
                 year,
             ),
         )
-        self.conn.commit()
+        self.updateUserScores(
+            c, username, channel, score, numAnswered, day, month, year
+        )
+        self.commit()
         c.close()
 
+    def updateUserScores(
+        self, c, username, channel, score, numAnswered, day, month, year
+    ):
+        """
+        Adds points to the leaderboard aggregates, both for the channel and
+        across all channels.
+        """
+        usernameCanonical = ircutils.toLower(username)
+        for period, periodKey in self.getPeriodKeys(day, month, year):
+            for channelCanonical in (ircutils.toLower(channel), ""):
+                c.execute(
+                    """INSERT INTO triviauserscore 
+                             VALUES (NULL, ?, ?, ?, ?, ?, ?, ?)
+                             ON CONFLICT(period, period_key, channel_canonical, 
+                                         username_canonical)
+                             DO UPDATE SET username=excluded.username,
+                                           points=points+excluded.points,
+                                           num_answered=num_answered+excluded.num_answered""",
+                    (
+                        period,
+                        periodKey,
+                        channelCanonical,
+                        username,
+                        usernameCanonical,
+                        int(score),
+                        numAnswered,
+                    ),
+                )
+
     def updateUser(
         self,
         username,
@@ -2871,7 +3006,7 @@ class Storage:
                 usernameCanonical,
             ),
         )
-        self.conn.commit()
+        self.commit()
         c.close()
 
     def updateUserHighestStreak(self, username, streak):
@@ -2886,7 +3021,7 @@ class Storage:
                            username_canonical=?""",
             (streak, streak, usernameCanonical),
         )
-        self.conn.commit()
+        self.commit()
         c.close()
 
     def updateUserLevel(self, username, channel, level):
@@ -2904,7 +3039,7 @@ class Storage:
                            channel_canonical=?""",
             (level, usernameCanonical, channelCanonical),
         )
-        self.conn.commit()
+        self.commit()
         c.close()
 
     def updateGame(self, channel, numAsked):
@@ -2919,7 +3054,7 @@ class Storage:
                             WHERE channel_canonical=?""",
             (channel, numAsked, channelCanonical),
         )
-        self.conn.commit()
+        self.commit()
         c.close()
 
     def updateGameLongestStreak(self, channel, lastWinner, streak):
@@ -2935,7 +3070,7 @@ class Storage:
                                   longest_streak<?""",
             (streak, lastWinner, lastWinnerCanonical, channelCanonical, streak),
         )
-        self.conn.commit()
+        self.commit()
         c.close()
 
     def updateGameStreak(self, channel, lastWinner, streak):
@@ -2950,7 +3085,7 @@ class Storage:
                             WHERE channel_canonical=?""",
             (lastWinner, streak, channelCanonical),
         )
-        self.conn.commit()
+        self.commit()
         c.close()
 
     def updateGameRoundStarted(self, channel, lastRoundStarted):
@@ -2964,7 +3099,7 @@ class Storage:
                             WHERE channel_canonical=?""",
             (lastRoundStarted, channelCanonical),
         )
-        self.conn.commit()
+        self.commit()
         c.close()
 
     def updateQuestion(self, id, newQuestion):
@@ -2975,9 +3110,10 @@ class Storage:
                             WHERE id=?""",
             (newQuestion, id),
         )
-        self.conn.commit()
+        self.commit()
         c.close()
 
+    @queued
     def updateQuestionStats(self, id, timesAnswered, timesMissed):
         c = self.conn.cursor()
         test = c.execute(
@@ -2987,180 +3123,57 @@ class Storage:
                             WHERE id=?""",
             (timesAnswered, timesMissed, id),
         )
-        self.conn.commit()
+        self.commit()
         c.close()
 
-    def viewDayTop10(self, channel, numUpTo=10):
+    def viewTop10(self, period, periodKey, channel, numUpTo=10):
         numUpTo -= 10
-        dateObject = datetime.date.today()
-        day = dateObject.day
-        month = dateObject.month
-        year = dateObject.year
-
-        query = """SELECT id, 
-                          username,
-                          SUM(points_made) AS points,
-                          SUM(num_answered) AS num
-                   FROM triviauserlog
-                   WHERE day=? AND 
-                         month=? AND 
-                         year=?"""
-        arguments = [day, month, year]
-
+        channelCanonical = ""
         if channel is not None:
             channelCanonical = ircutils.toLower(channel)
-            query = """%s AND channel_canonical=?""" % (query)
-            arguments.append(channelCanonical)
-
-        query = """%s GROUP BY username_canonical
-                    ORDER BY points DESC LIMIT ?, 10""" % (
-            query
-        )
-        arguments.append(numUpTo)
-
         c = self.conn.cursor()
-        c.execute(query, tuple(arguments))
+        c.execute(
+            """SELECT id, 
+                             username,
+                             points,
+                             num_answered AS num
+                      FROM triviauserscore
+                      WHERE period=? AND 
+                            period_key=? AND 
+                            channel_canonical=?
+                      ORDER BY points DESC LIMIT ?, 10""",
+            (period, periodKey, channelCanonical, numUpTo),
+        )
         rows = c.fetchall()
         c.close()
         return rows
 
-    def viewAllTimeTop10(self, channel, numUpTo=10):
-        numUpTo -= 10
-
-        query = """SELECT id, 
-                          username,
-                          SUM(points_made) AS points,
-                          SUM(num_answered) AS num
-                   FROM triviauserlog"""
-        arguments = []
-
-        if channel is not None:
-            channelCanonical = ircutils.toLower(channel)
-            query = """%s WHERE channel_canonical=?""" % (query)
-            arguments.append(channelCanonical)
-
-        query = """%s GROUP BY username_canonical
-                    ORDER BY points DESC LIMIT ?, 10""" % (
-            query
-        )
-        arguments.append(numUpTo)
+    def viewDayTop10(self, channel, numUpTo=10):
+        period, periodKey = self.getPeriodKeys()[0]
+        return self.viewTop10(period, periodKey, channel, numUpTo)
 
-        c = self.conn.cursor()
-        c.execute(query, tuple(arguments))
-        rows = c.fetchall()
-        c.close()
-        return rows
+    def viewAllTimeTop10(self, channel, numUpTo=10):
+        period, periodKey = self.getPeriodKeys()[4]
+        return self.viewTop10(period, periodKey, channel, numUpTo)
 
     def viewMonthTop10(self, channel, numUpTo=10, year=None, month=None):
-        numUpTo -= 10
         d = datetime.date.today()
         if year is None or month is None:
             year = d.year
             month = d.month
-
-        query = """SELECT id, 
-                          username,
-                          SUM(points_made) AS points,
-                          SUM(num_answered) AS num
-                   FROM triviauserlog
-                   WHERE month=? AND 
-                         year=?"""
-        arguments = [month, year]
-
-        if channel is not None:
-            channelCanonical = ircutils.toLower(channel)
-            query = """%s AND channel_canonical=?""" % (query)
-            arguments.append(channelCanonical)
-
-        query = """%s GROUP BY username_canonical
-                    ORDER BY points DESC LIMIT ?, 10""" % (
-            query
+        return self.viewTop10(
+            "month", "%04d-%02d" % (year, month), channel, numUpTo
         )
-        arguments.append(numUpTo)
-
-        c = self.conn.cursor()
-        c.execute(query, tuple(arguments))
-        rows = c.fetchall()
-        c.close()
-        return rows
 
     def viewYearTop10(self, channel, numUpTo=10, year=None):
-        numUpTo -= 10
         d = datetime.date.today()
         if year is None:
             year = d.year
-
-        query = """SELECT id, 
-                          username,
-                          SUM(points_made) AS points,
-                          SUM(num_answered) AS num
-                   FROM triviauserlog
-                   WHERE year=?"""
-        arguments = [year]
-
-        if channel is not None:
-            channelCanonical = ircutils.toLower(channel)
-            query = """%s AND channel_canonical=?""" % (query)
-            arguments.append(channelCanonical)
-
-        query = """%s GROUP BY username_canonical
-                    ORDER BY points DESC LIMIT ?, 10""" % (
-            query
-        )
-        arguments.append(numUpTo)
-
-        c = self.conn.cursor()
-        c.execute(query, tuple(arguments))
-        rows = c.fetchall()
-        c.close()
-        return rows
+        return self.viewTop10("year", "%04d" % year, channel, numUpTo)
 
     def viewWeekTop10(self, channel, numUpTo=10):
-        numUpTo -= 10
-        d = datetime.date.today()
-        weekday = d.weekday()
-        d -= datetime.timedelta(weekday)
-        weekSqlString = ""
-        for i in range(7):
-            if i > 0:
-                weekSqlString += " or "
-            weekSqlString += """
-                        (year=%d
-                        AND month=%d
-                        AND day=%d)""" % (
-                d.year,
-                d.month,
-                d.day,
-            )
-            d += datetime.timedelta(1)
-
-        query = (
-            """SELECT id, 
-                          username, 
-                          SUM(points_made) AS points,
-                          SUM(num_answered) AS num 
-                   FROM triviauserlog
-                   WHERE (%s)"""
-            % weekSqlString
-        )
-        arguments = []
-
-        if channel is not None:
-            channelCanonical = ircutils.toLower(channel)
-            query = """%s AND channel_canonical=?""" % (query)
-            arguments.append(channelCanonical)
-
-        query = """%s GROUP BY username_canonical
-                    ORDER BY points DESC LIMIT ?, 10""" % (
-            query
-        )
-        arguments.append(numUpTo)
-
-        c = self.conn.cursor()
-        c.execute(query, tuple(arguments))
-        rows = c.fetchall()
-        c.close()
-        return rows
+        period, periodKey = self.getPeriodKeys()[1]
+        return self.viewTop10(period, periodKey, channel, numUpTo)
 
     def wasUserActiveIn(self, username, channel, timeSeconds):
         usernameCanonical = ircutils.toLower(username)
@@ -3194,11 +3207,95 @@ class Storage:
         return row[0] > 0
 
 
+class StorageWriter(threading.Thread):
+    """
+    Single writer thread for a database, committing queued writes in batches.
+    """
+
+    writers = {}
+    batchSize = 100
+    batchDelay = 0.5
+
+    def __init__(self, loc):
+        threading.Thread.__init__(self, name="TriviaTime writer")
+        self.daemon = True
+        self.storage = Storage(loc)
+        self.storage.batching = True
+        self.queue = queue.Queue()
+
+    @classmethod
+    def startFor(cls, loc):
+        if loc not in cls.writers:
+            writer = cls(loc)
+            cls.writers[loc] = writer
+            writer.start()
+
+    @classmethod
+    def stopFor(cls, loc):
+        writer = cls.writers.pop(loc, None)
+        if writer is not None:
+            writer.queue.put(None)
+            writer.join()
+
+    def put(self, name, args, kwargs):
+        self.queue.put((name, args, kwargs))
+
+    def flush(self):
+        done = threading.Event()
+        self.queue.put(done)
+        done.wait()
+
+    def run(self):
+        running = True
+        while running:
+            batch = [self.queue.get()]
+            deadline = time.time() + self.batchDelay
+            # Keep collecting until the batch is full, the delay runs out or
+            # someone is waiting on it. Nothing is written until then, so no
+            # write transaction stays open while we wait.
+            while len(batch) < self.batchSize and isinstance(batch[-1], tuple):
+                try:
+                    batch.append(self.queue.get(timeout=deadline - time.time()))
+                except (queue.Empty, ValueError):
+                    break
+            for job in batch:
+                if job is None:
+                    running = False
+                elif isinstance(job, tuple):
+                    name, args, kwargs = job
+                    try:
+                        getattr(self.storage, name)(*args, **kwargs)
+                    except Exception:
+                        log.exception("TriviaTime: unable to run %s:" % name)
+            try:
+                self.storage.conn.commit()
+            except sqlite3.Error:
+                log.exception("TriviaTime: unable to commit writes:")
+            for job in batch:
+                if isinstance(job, threading.Event):
+                    job.set()
+
+
 # A log wrapper, ripoff of ChannelLogger
-class Logger:
+class Logger(threading.Thread):
+    """
+    Writes the game logs from its own thread, so doLog never touches the disk.
+    """
+
+    maxBuffer = 10000  # lines held in memory while the disk is slow
+    flushLines = 100
+    flushDelay = 5
+
     def __init__(self, base):
+        threading.Thread.__init__(self, name="TriviaTime logger")
+        self.daemon = True
         self.logs = {}
         self.registryValue = base.registryValue
+        self.queue = queue.Queue(self.maxBuffer)
+        self.dropped = 0
+        self.droppedReported = 0
+        self.nextRotation = self.getNextRotation()
+        self.start()
 
     def logNameTimestamp(self, channel):
         return time.strftime("%Y-%m-%d")
@@ -3206,9 +3303,9 @@ class Logger:
     def getLogName(self, channel):
         return "%s.%s.log" % (channel, self.logNameTimestamp(channel))
 
-    def getLogDir(self, irc, channel):
+    def getLogDir(self, network, channel):
         logDir = conf.supybot.directories.log.dirize("TriviaTime")
-        logDir = os.path.join(logDir, irc.network)
+        logDir = os.path.join(logDir, network)
         logDir = os.path.join(logDir, channel)
         timeDir = time.strftime("%B")
         logDir = os.path.join(logDir, timeDir)
@@ -3216,38 +3313,41 @@ class Logger:
             os.makedirs(logDir)
         return logDir
 
-    def timestamp(self, log):
+    def getNextRotation(self):
+        tomorrow = datetime.date.today() + datetime.timedelta(1)
+        return time.mktime(tomorrow.timetuple())
+
+    def timestamp(self, log, when):
         format = conf.supybot.log.timestampFormat()
         if format:
-            log.write(time.strftime(format))
+            log.write(time.strftime(format, time.localtime(when)))
             log.write(" ")
 
     def checkLogNames(self):
-        for (irc, logs) in list(self.logs.items()):
+        for (network, logs) in list(self.logs.items()):
             for (channel, log) in list(logs.items()):
                 name = self.getLogName(channel)
                 if name != log.name:
                     log.close()
                     del logs[channel]
 
-    def getLog(self, irc, channel):
-        self.checkLogNames()
+    def getLog(self, network, channel):
         try:
-            logs = self.logs[irc]
+            logs = self.logs[network]
         except KeyError:
             logs = ircutils.IrcDict()
-            self.logs[irc] = logs
+            self.logs[network] = logs
         if channel in logs:
             return logs[channel]
         else:
             try:
                 name = self.getLogName(channel)
-                logDir = self.getLogDir(irc, channel)
-                log = open(os.path.join(logDir, name), "a")
-                logs[channel] = log
-                return log
+                logDir = self.getLogDir(network, channel)
+                logFile = open(os.path.join(logDir, name), "a")
+                logs[channel] = logFile
+                return logFile
             except IOError:
-                self.log.exception("Error opening log:")
+                log.exception("Error opening log:")
                 return self.FakeLog()
 
     def doLog(self, irc, channel, s, *args):
@@ -3255,17 +3355,71 @@ class Logger:
             return
         s = format(s, *args)
         channel = self.normalizeChannel(irc, channel)
-        log = self.getLog(irc, channel)
-        self.timestamp(log)
-        s = ircutils.stripFormatting(s)
-        log.write(s)
-        log.write("\n")
-        log.flush()
+        try:
+            self.queue.put_nowait((irc.network, channel, time.time(), s))
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self):
+        for logs in self.logs.values():
+            for log in logs.values():
+                log.flush()
+
+    def close(self):
+        for logs in self.logs.values():
+            for log in logs.values():
+                log.close()
+        self.logs.clear()
+
+    def stop(self):
+        self.queue.put(None)
+        self.join()
+
+    def run(self):
+        unflushed = 0
+        lastFlush = time.time()
+        while True:
+            try:
+                line = self.queue.get(timeout=self.flushDelay)
+            except queue.Empty:
+                line = False
+            if line is None:
+                break
+            if time.time() >= self.nextRotation:
+                self.checkLogNames()
+                self.nextRotation = self.getNextRotation()
+            if self.dropped != self.droppedReported:
+                log.warning(
+                    "TriviaTime: game log is behind, dropped %d lines so far."
+                    % self.dropped
+                )
+                self.droppedReported = self.dropped
+            if line:
+                (network, channel, when, s) = line
+                try:
+                    gameLog = self.getLog(network, channel)
+                    self.timestamp(gameLog, when)
+                    gameLog.write(ircutils.stripFormatting(s))
+                    gameLog.write("\n")
+                    unflushed += 1
+                except IOError:
+                    log.exception("Error writing log:")
+            if unflushed and (
+                unflushed >= self.flushLines
+                or time.time() - lastFlush >= self.flushDelay
+            ):
+                self.flush()
+                unflushed = 0
+                lastFlush = time.time()
+        self.flush()
+        self.close()
 
     def normalizeChannel(self, irc, channel):
         return ircutils.toLower(channel)
 
     class FakeLog(object):
+        name = None
+
         def flush(self):
             return
 
@@ -3313,10 +3467,13 @@ class TriviaTime(callbacks.Plugin):
             log.info("The database location did not exist, creating folder structure")
             os.makedirs(dbFolder)
         self.storage = Storage(dbLocation)
+        StorageWriter.startFor(dbLocation)
         # self.storage.dropActivityTable()
         self.storage.makeActivityTable()
         # self.storage.dropUserLogTable()
         self.storage.makeUserLogTable()
+        # self.storage.dropUserScoreTable()
+        self.storage.makeUserScoreTable()
         # self.storage.dropGameTable()
         self.storage.makeGameTable()
         # self.storage.dropGameLogTable()
@@ -3335,6 +3492,8 @@ class TriviaTime(callbacks.Plugin):
         self.storage.makeEditTable()
         # self.storage.dropDeleteTable()
         self.storage.makeDeleteTable()
+        # self.storage.dropDeckTable()
+        self.storage.makeDeckTable()
         self.storage.makeInfoTable()
         # self.storage.makeLevelTable()
         # self.storage.dropLevelTable()
@@ -3354,6 +3513,8 @@ class TriviaTime(callbacks.Plugin):
     def die(self):
         for game in self._games():
             game.stop()
+        StorageWriter.stopFor(self.storage.loc)
+        self.logger.stop()
 
     def reset(self):
         for game in self._games():
@@ -3962,6 +4123,7 @@ class TriviaTime(callbacks.Plugin):
         offset = num - 9
         dbLocation = self.registryValue("admin.db")
         threadStorage = Storage(dbLocation)
+        threadStorage.flush()
         if self.registryValue("general.globalStats"):
             tops = threadStorage.viewDayTop10(None, num)
         else:
@@ -4406,6 +4568,7 @@ class TriviaTime(callbacks.Plugin):
         """
         dbLocation = self.registryValue("admin.db")
         threadStorage = Storage(dbLocation)
+        threadStorage.flush()
         totalUsersEver = threadStorage.getNumUser(channel)
         numActiveThisWeek = threadStorage.getNumActiveThisWeek(channel)
         infoText = (
@@ -4454,6 +4617,7 @@ class TriviaTime(callbacks.Plugin):
         identified = ircdb.users.hasUser(msg.prefix)
         dbLocation = self.registryValue("admin.db")
         threadStorage = Storage(dbLocation)
+        threadStorage.flush()
 
         if self.registryValue("general.globalStats"):
             stat = threadStorage.getUserStat(username, None)
@@ -4572,6 +4736,7 @@ class TriviaTime(callbacks.Plugin):
         offset = num - 9
         dbLocation = self.registryValue("admin.db")
         threadStorage = Storage(dbLocation)
+        threadStorage.flush()
         if self.registryValue("general.globalStats"):
             tops = threadStorage.viewMonthTop10(None, num)
         else:
@@ -4788,6 +4953,19 @@ class TriviaTime(callbacks.Plugin):
 
     rmnew = wrap(rmnew, ["channel", "int"])
 
+    def rebuildstats(self, irc, msg, arg):
+        """
+        Rebuild the leaderboard totals used by top, me and stats from the
+        points log. Only needed after editing the database by hand.
+        """
+        irc.reply("Rebuilding leaderboards.. This may take a few minutes")
+        dbLocation = self.registryValue("admin.db")
+        threadStorage = Storage(dbLocation)
+        threadStorage.rebuildUserScores()
+        irc.reply("Leaderboards rebuilt.")
+
+    rebuildstats = wrap(rebuildstats, ["owner"])
+
     def repeat(self, irc, msg, arg, channel):
         """
         Repeat the current question.
@@ -5021,6 +5199,7 @@ class TriviaTime(callbacks.Plugin):
         """
         dbLocation = self.registryValue("admin.db")
         threadStorage = Storage(dbLocation)
+        threadStorage.flush()
         if self.registryValue("general.globalStats"):
             stat = threadStorage.getUserStat(username, None)
             rank = threadStorage.getUserRank(username, None)
@@ -5407,6 +5586,7 @@ class TriviaTime(callbacks.Plugin):
         offset = num - 9
         dbLocation = self.registryValue("admin.db")
         threadStorage = Storage(dbLocation)
+        threadStorage.flush()
         if self.registryValue("general.globalStats"):
             tops = threadStorage.viewAllTimeTop10(None, num)
         else:
@@ -5475,6 +5655,7 @@ class TriviaTime(callbacks.Plugin):
         offset = num - 9
         dbLocation = self.registryValue("admin.db")
         threadStorage = Storage(dbLocation)
+        threadStorage.flush()
         if self.registryValue("general.globalStats"):
             tops = threadStorage.viewWeekTop10(None, num)
         else:
@@ -5511,6 +5692,7 @@ class TriviaTime(callbacks.Plugin):
         offset = num - 9
         dbLocation = self.registryValue("admin.db")
         threadStorage = Storage(dbLocation)
+        threadStorage.flush()
         if self.registryValue("general.globalStats"):
             tops = threadStorage.viewYearTop10(None, num)
         else:
@@ -54,10 +54,12 @@ __contributors__ = {}
 __url__ = "https://github.com/oddluck/limnoria-plugins/"
 
 from . import config
+from . import tables
 from . import plugin
 from imp import reload
 
 reload(config)  # In case we're being reloaded.
+reload(tables)
 reload(plugin)
 # Add more reloads here if you add third-party modules and want them to be
 # reloaded when this plugin is reloaded.  Don't forget to import them as well!
@@ -39,7 +39,8 @@ import supybot.ircutils as ircutils
 import supybot.callbacks as callbacks
 import time
 import os, errno
-import pickle
+
+from .tables import Options, Tables
 
 try:
     from supybot.i18n import PluginInternationalization
@@ -58,16 +59,14 @@ class UNO(callbacks.Plugin):
 
     threaded = True
 
-    game = [{}, {}, {}, {}, {}]
-
-    channeloptions = {}
-    channeloptions["allow_game"] = False
-    channeloptions["debug"] = False
-    channeloptions["use_queue"] = True
-    channeloptions["nplayers"] = 10
-    channeloptions["maxbots"] = 9
-    channeloptions["use_colors"] = True
-    channeloptions["use_notice"] = True
+    defaultoptions = {}
+    defaultoptions["allow_game"] = False
+    defaultoptions["debug"] = False
+    defaultoptions["use_queue"] = True
+    defaultoptions["nplayers"] = 10
+    defaultoptions["maxbots"] = 9
+    defaultoptions["use_colors"] = True
+    defaultoptions["use_notice"] = True
 
     lastgame = time.time()
 
@@ -82,15 +81,18 @@ class UNO(callbacks.Plugin):
     dataPath = r"%s%suno%s" % (conf.supybot.directories.data(), os.sep, os.sep)
     prefixChar = conf.supybot.reply.whenAddressedBy.chars()[0]
 
+    def __init__(self, irc):
+        self.__parent = super(UNO, self)
+        self.__parent.__init__(irc)
+        self.game = Tables()
+        self.channeloptions = {}
+
     def start(self, irc, msg, args, text):
         """
         Start a new game of UNO. For the rules of the game, use the "uno rules" command.
         """
-        try:
-            self._read_options(irc)
-        except:
-            pass
-        if self.channeloptions["allow_game"] == False:
+        options = self._options(irc, msg.args[0])
+        if options["allow_game"] == False:
             irc.reply("Error: allow_game=False")
             return
 
@@ -122,18 +124,15 @@ class UNO(callbacks.Plugin):
             return
 
         table = self._getopentable()
-        if table == None:
-            irc.reply("Sorry, all the game tables are in use at the moment.")
-            return
 
         self._cleanup(table)
         self.game[table]["channel"] = msg.args[0]
         self.game[table]["type"] = gametype
 
         if gametype == "uno":
-            self.game[table]["players"][nick] = {}
-            # self.game[table]['nplayers']=int(self.channeloptions[gametype+'_nplayers'])
-            self.game[table]["nplayers"] = int(self.channeloptions["nplayers"])
+            self.game.add_player(table, nick)
+            # self.game[table]['nplayers']=int(options[gametype+'_nplayers'])
+            self.game[table]["nplayers"] = int(options["nplayers"])
             irc.reply(
                 "%s has started a new game of %s at table %s. For the rules of the"
                 ' game, type "%suno rules". To accept this challenge, join with "%suno'
@@ -245,7 +244,8 @@ class UNO(callbacks.Plugin):
                 # take their turn quickly, and no need to announce it.
                 pass
             else:
-                if self.channeloptions["use_colors"] == True:
+                options = self._options(irc, channel)
+                if options["use_colors"] == True:
                     if "Red" in topcard:
                         topcardcolor = ircutils.mircColor(topcard, "red", "black")
                     elif "Blue" in topcard:
@@ -296,7 +296,7 @@ class UNO(callbacks.Plugin):
                             prefixChar,
                         )
                     )
-                    if self.channeloptions["use_notice"] == True:
+                    if options["use_notice"] == True:
                         self.reply(irc, txt, to=nick, notice=True, private=True)
                     else:
                         self.reply(irc, txt, to=nick, notice=False, private=True)
@@ -311,7 +311,7 @@ class UNO(callbacks.Plugin):
                         ' %s. To play a card, use the "%suno play" command.'
                         % (topcard, ncards, yourhand, opponent_cards, prefixChar)
                     )
-                    if self.channeloptions["use_notice"] == True:
+                    if options["use_notice"] == True:
                         self.reply(irc, txt, to=nick, notice=True, private=True)
                     else:
                         self.reply(irc, txt, to=nick, notice=False, private=True)
@@ -399,11 +399,8 @@ class UNO(callbacks.Plugin):
         Join a game of UNO previously started with the "uno start" command.
         Specify <table> if there is more than one game to join in that channel.
         """
-        try:
-            self._read_options(irc)
-        except:
-            pass
-        if self.channeloptions["allow_game"] == False:
+        options = self._options(irc, msg.args[0])
+        if options["allow_game"] == False:
             irc.reply("Error: allow_game=False")
             return
 
@@ -457,7 +454,7 @@ class UNO(callbacks.Plugin):
             return
         isfake = False
         iscpu = False
-        if ((self.channeloptions["debug"]) and fakenick) or (
+        if ((options["debug"]) and fakenick) or (
             fakenick and fakenick.lower() == "cpu"
         ):
             nick = fakenick
@@ -473,7 +470,7 @@ class UNO(callbacks.Plugin):
                 if iscpu == True:
                     nick = self._uno_make_cpu(table)
                 else:
-                    self.game[table]["players"][nick] = {}
+                    self.game.add_player(table, nick)
                 if isfake == True:
                     self.game[table]["players"][nick]["fake"] = True
 
@@ -527,16 +524,13 @@ class UNO(callbacks.Plugin):
         """
         Leave a game of UNO.
         """
-        try:
-            self._read_options(irc)
-        except:
-            pass
-        if self.channeloptions["allow_game"] == False:
+        options = self._options(irc, msg.args[0])
+        if options["allow_game"] == False:
             irc.reply("Error: allow_game=False")
             return
 
         nick = msg.nick
-        if self.channeloptions["debug"] and fakenick:
+        if options["debug"] and fakenick:
             nick = fakenick
         table = self._gettablefromnick(nick)
         if table == None:
@@ -554,19 +548,14 @@ class UNO(callbacks.Plugin):
         """
         Leave a game of UNO.
         """
-        try:
-            self._read_options(irc)
-        except:
-            pass
-        if self.channeloptions["allow_game"] == False:
-            irc.reply("Error: allow_game=False")
-            return
-
         table = self._gettablefromnick(nick)
         if table == None:
             return
 
         channel = self.game[table]["channel"]
+        if self._options(irc, channel)["allow_game"] == False:
+            irc.reply("Error: allow_game=False")
+            return
 
         # leaving a game when you're the only player
         if len(self.game[table]["players"]) == 1:
@@ -591,12 +580,11 @@ class UNO(callbacks.Plugin):
         # ---- replace with cpu ----
         oldnick = nick
         nick = self._uno_make_cpu(table)
-        del self.game[table]["players"][
-            nick
-        ]  # remove new cpu player (we just want the nick)
+        self.game.remove_player(
+            table, nick
+        )  # remove new cpu player (we just want the nick)
 
-        self.game[table]["players"][nick] = self.game[table]["players"][oldnick]
-        del self.game[table]["players"][oldnick]
+        self.game.rename_player(table, oldnick, nick)
         self.game[table]["players"][nick]["fake"] = True
         self.game[table]["players"][nick]["cpu"] = True
 
@@ -668,13 +656,14 @@ class UNO(callbacks.Plugin):
         ]
         nick = random.choice(nicklist)
         # assumes nick isn't taken atm
-        self.game[table]["players"][nick] = {}
+        self.game.add_player(table, nick)
         self.game[table]["players"][nick]["fake"] = True
         self.game[table]["players"][nick]["cpu"] = True
         return nick
 
     def _uno_cpu_play(self, irc, table):
         channel = self.game[table]["channel"]
+        options = self._options(irc, channel)
 
         Human = False
         for n in list(self.game[table]["players"].keys()):
@@ -735,7 +724,7 @@ class UNO(callbacks.Plugin):
             ncards = len(self.game[table]["players"][nick]["hand"])
             if "Wild" in card:
                 card = "%s (%s)" % (card, self.game[table]["wildcolor"])
-            if self.channeloptions["use_colors"] == True:
+            if options["use_colors"] == True:
                 if "Red" in card:
                     cardcolor = ircutils.mircColor(card, "red", "black")
                 elif "Blue" in card:
@@ -832,10 +821,8 @@ class UNO(callbacks.Plugin):
             irc.reply("Error: You are not playing a game at any of the tables.")
             return
         channel = self.game[table]["channel"]
-        if (
-            self.channeloptions["debug"]
-            and text.rsplit(" ", 1)[-1] in self.game[table]["players"]
-        ):
+        options = self._options(irc, channel)
+        if options["debug"] and text.rsplit(" ", 1)[-1] in self.game[table]["players"]:
             fakenick = [
                 p
                 for p in self.game[table]["players"]
@@ -1006,7 +993,7 @@ class UNO(callbacks.Plugin):
             if "Wild" in card:
                 self.game[table]["wildcolor"] = newcolor
                 card = "%s (%s)" % (card, self.game[table]["wildcolor"])
-            if self.channeloptions["use_colors"] == True:
+            if options["use_colors"] == True:
                 if "Red" in card:
                     cardcolor = ircutils.mircColor(card, "red", "black")
                 elif "Blue" in card:
@@ -1109,33 +1096,27 @@ class UNO(callbacks.Plugin):
         Changes an option for UNO game. You can view the
         options for the current channel with the "uno showoptions" command.
         """
-        try:
-            self._read_options(irc)
-        except:
-            pass
+        options = self._options(irc, channel)
         if value.lower() == "true":
             value = True
         elif value.lower() == "false":
             value = False
         elif value.lower() == "unset":
-            if text in self.channeloptions:
-                irc.reply("Set %s %s-->(unset)" % (text, self.channeloptions[text]))
-                del self.channeloptions[text]
+            if options.isset(text):
+                irc.reply("Set %s %s-->(unset)" % (text, options[text]))
                 try:
-                    self._write_options(irc)
+                    options.unset(text)
                 except:
                     irc.reply("Failed to write options to file. :(")
             else:
                 irc.reply("%s was already unset." % text)
             return
-        if text in self.channeloptions:
-            irc.reply("Set %s %s-->%s" % (text, self.channeloptions[text], value))
-            self.channeloptions[text] = value
+        if text in options:
+            irc.reply("Set %s %s-->%s" % (text, options[text], value))
         else:
             irc.reply("Set %s (unset)-->%s" % (text, value))
-            self.channeloptions[text] = value
         try:
-            self._write_options(irc)
+            options.set(text, value)
         except:
             irc.reply("Failed to write options to file. :(")
 
@@ -1147,75 +1128,38 @@ class UNO(callbacks.Plugin):
         """
         Shows options for UNO game for the current channel.
         """
-        try:
-            self._read_options(irc)
-        except:
-            pass
+        options = self._options(irc, msg.args[0])
         txt = ", ".join(
-            [
-                "=".join([str(i) for i in item])
-                for item in list(self.channeloptions.items())
-            ]
+            ["=".join([str(i) for i in item]) for item in list(options.items())]
         )
         irc.reply(txt)
 
     showoptions = wrap(showoptions)
 
     def _cleanup(self, table):
-        self.game[table] = {}
-        self.game[table]["players"] = {}
-        self.game[table]["phase"] = ""
+        self.game.reset(table)
 
     def _getopentable(self):
-        openslot = [i for i in range(len(self.game)) if not self.game[i].get("phase")]
-        if len(openslot) == 0:
-            return None
-        else:
-            return openslot[0]
+        return self.game.open()
 
     def _getcurrenttables(self):
-        slot = [i for i in range(len(self.game)) if self.game[i].get("phase")]
-        return slot
+        return self.game.current()
 
     def _gettablefromnick(self, n):
-        tables = self._getcurrenttables()
-        if not tables:
-            return None
-        for table in tables:
-            if n.lower() in [
-                x.lower() for x in list(self.game[table]["players"].keys())
-            ]:
-                return table
-        return None
-
-    def _read_options(self, irc):
-        network = irc.network.replace(" ", "_")
-        channel = irc.msg.args[0]
-        # irc.reply('test: %s.%s.options' % (irc.network, irc.msg.args[0] ))
-
-        f = "%s%s.%s.options" % (self.dataPath, network, channel)
-        if os.path.isfile(f):
-            inputfile = open(f, "rb")
-            self.channeloptions = pickle.load(inputfile)
-            inputfile.close()
-        else:
-            # Use defaults
-            channeloptions = {}
-            channeloptions["allow_game"] = False
-            channeloptions["debug"] = False
-            channeloptions["use_queue"] = True
-            channeloptions["nplayers"] = 10
-            channeloptions["maxbots"] = 9
-            channeloptions["use_colors"] = True
-            channeloptions["use_notice"] = True
-        return
+        return self.game.find(n)
 
-    def _write_options(self, irc):
+    def _options(self, irc, channel):
         network = irc.network.replace(" ", "_")
-        channel = irc.msg.args[0]
-        outputfile = open("%s%s.%s.options" % (self.dataPath, network, channel), "wb")
-        pickle.dump(self.channeloptions, outputfile)
-        outputfile.close()
+        options = self.channeloptions.get((network, channel))
+        if options is None:
+            f = "%s%s.%s.options" % (self.dataPath, network, channel)
+            options = Options(f, self.defaultoptions)
+            try:
+                options.load()
+            except:
+                pass
+            self.channeloptions[(network, channel)] = options
+        return options
 
     def doNick(self, irc, msg):
         oldNick = msg.nick
@@ -1223,8 +1167,7 @@ class UNO(callbacks.Plugin):
         table = self._gettablefromnick(oldNick)
         if table == None:
             return
-        self.game[table]["players"][newNick] = self.game[table]["players"][oldNick]
-        del self.game[table]["players"][oldNick]
+        self.game.rename_player(table, oldNick, newNick)
 
     def doQuit(self, irc, msg):
         nick = msg.nick
@@ -1253,8 +1196,8 @@ class UNO(callbacks.Plugin):
                 self._leavegame(irc, msg, nick)
                 self._uno_do_cpu(irc, table)  # only works if game type is uno
 
-    def _sendMsg(self, irc, msg):
-        if self.channeloptions["use_queue"]:
+    def _sendMsg(self, irc, msg, channel):
+        if self._options(irc, channel)["use_queue"]:
             irc.queueMsg(msg)
         else:
             irc.sendMsg(msg)
@@ -1271,13 +1214,15 @@ class UNO(callbacks.Plugin):
         to="",
         fast=False,
     ):
+        channel = to
         table = self._gettablefromnick(to)
         if table == None:
             # hopefully it's a valid channel
             pass
         else:
+            channel = self.game[table]["channel"]
             if self.game[table]["players"][to].get("fake"):
-                if self.channeloptions["debug"]:
+                if self._options(irc, channel)["debug"]:
                     text = "(to %s): %s" % (to, text)
                     text = ircutils.mircColor(text, fg=14)
                     to = self.game[table]["channel"]
@@ -1298,7 +1243,7 @@ class UNO(callbacks.Plugin):
             if (prefixNick) and ("#" not in to):
                 text = "%s: %s" % (to, text)
             m = ircmsgs.privmsg(to, text)
-            self._sendMsg(irc, m)
+            self._sendMsg(irc, m, channel)
 
 
 Class = UNO
@@ -0,0 +1,150 @@
+###
+# Copyright (c) SpiderDave
+# Copyright (c) 2020, oddluck <oddluck@riseup.net>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+###
+
+import os
+import pickle
+
+import supybot.ircutils as ircutils
+
+
+class Tables(object):
+    """
+    The game tables, numbered from 0, and the tables each player sits at.
+    A table is reused once its game is over, and a new one is added whenever
+    all of them are in use.
+    """
+
+    def __init__(self):
+        self.tables = []
+        self.nicks = ircutils.IrcDict()
+
+    def __getitem__(self, table):
+        return self.tables[table]
+
+    def __len__(self):
+        return len(self.tables)
+
+    def open(self):
+        for table, game in enumerate(self.tables):
+            if not game.get("phase"):
+                return table
+        self.tables.append({"players": {}, "phase": ""})
+        return len(self.tables) - 1
+
+    def current(self):
+        return [table for table, game in enumerate(self.tables) if game.get("phase")]
+
+    def find(self, nick):
+        tables = self.nicks.get(nick)
+        if not tables:
+            return None
+        return tables[0]
+
+    def reset(self, table):
+        for nick in self.tables[table].get("players", ()):
+            self._unindex(table, nick)
+        self.tables[table] = {"players": {}, "phase": ""}
+
+    def add_player(self, table, nick, player=None):
+        if player is None:
+            player = {}
+        self.tables[table]["players"][nick] = player
+        self.nicks.setdefault(nick, []).append(table)
+        return player
+
+    def remove_player(self, table, nick):
+        players = self.tables[table]["players"]
+        if nick not in players:
+            for n in players:
+                if ircutils.strEqual(n, nick):
+                    nick = n
+                    break
+        player = players.pop(nick)
+        self._unindex(table, nick)
+        return player
+
+    def rename_player(self, table, oldnick, newnick):
+        self.add_player(table, newnick, self.remove_player(table, oldnick))
+
+    def _unindex(self, table, nick):
+        tables = self.nicks.get(nick)
+        if tables and table in tables:
+            tables.remove(table)
+            if not tables:
+                del self.nicks[nick]
+
+
+class Options(object):
+    """
+    The options of one channel, kept in memory and written to the channel's
+    options file whenever they change.  Options that haven't been set fall
+    back to the defaults.
+    """
+
+    def __init__(self, filename, defaults):
+        self.filename = filename
+        self.defaults = defaults
+        self.values = {}
+
+    def load(self):
+        if os.path.isfile(self.filename):
+            with open(self.filename, "rb") as f:
+                self.values = pickle.load(f)
+
+    def __getitem__(self, key):
+        if key in self.values:
+            return self.values[key]
+        return self.defaults[key]
+
+    def __contains__(self, key):
+        return key in self.values or key in self.defaults
+
+    def isset(self, key):
+        return key in self.values
+
+    def items(self):
+        values = dict(self.defaults)
+        values.update(self.values)
+        return values.items()
+
+    def set(self, key, value):
+        values = dict(self.values)
+        values[key] = value
+        self._write(values)
+
+    def unset(self, key):
+        values = dict(self.values)
+        del values[key]
+        self._write(values)
+
+    def _write(self, values):
+        with open(self.filename, "wb") as f:
+            pickle.dump(values, f)
+        self.values = values
@@ -39,7 +39,8 @@ import supybot.ircutils as ircutils
 import supybot.callbacks as callbacks
 import time
 import os, errno
-import pickle
+
+from .tables import Options, Tables
 
 # This will be used to change the name of the class to the folder name
 PluginName=os.path.dirname( __file__ ).split(os.sep)[-1]
@@ -50,16 +51,14 @@ class _Plugin(callbacks.Plugin):
     """
     threaded = True
     
-    game=[{},{},{},{},{}]
-
-    channeloptions = {}
-    channeloptions['allow_game']=False
-    channeloptions['debug']=False
-    channeloptions['use_queue']=True
-    channeloptions['undercut_goal']=40
-    channeloptions['flaunt1_goal']=40
-    channeloptions['flaunt2_goal']=200
-    channeloptions['flaunt3_goal']=40
+    defaultoptions = {}
+    defaultoptions['allow_game']=False
+    defaultoptions['debug']=False
+    defaultoptions['use_queue']=True
+    defaultoptions['undercut_goal']=40
+    defaultoptions['flaunt1_goal']=40
+    defaultoptions['flaunt2_goal']=200
+    defaultoptions['flaunt3_goal']=40
     lastgame=time.time()
 
     def make_sure_path_exists(path):
@@ -73,17 +72,20 @@ class _Plugin(callbacks.Plugin):
     dataPath=r'%s%sundercut%s' % (conf.supybot.directories.data(),os.sep,os.sep)
     prefixChar = conf.supybot.reply.whenAddressedBy.chars()[0]
 
+    def __init__(self, irc):
+        self.__parent = super(_Plugin, self)
+        self.__parent.__init__(irc)
+        self.game = Tables()
+        self.channeloptions = {}
+
     def ucstart(self, irc, msg, args, text):
         """[<gametype>]
         
         Start a new game of Undercut/Flaunt.  For the rules of the game, use the ucrules command.  
         Valid game types are undercut, flaunt1, flaunt2, and flaunt3.
         """
-        try:
-            self._read_options(irc)
-        except:
-            pass
-        if self.channeloptions['allow_game']==False:
+        options=self._options(irc, msg.args[0])
+        if options['allow_game']==False:
             irc.reply('Error: allow_game=False')
             return
 
@@ -105,18 +107,15 @@ class _Plugin(callbacks.Plugin):
             return
         
         table=self._getopentable()
-        if table==None:
-            irc.reply('Sorry, all the game tables are in use at the moment.')
-            return
 
         self._cleanup(table)
         self.game[table]['channel']=msg.args[0]
         self.game[table]['type']=gametype
         
         
-        goal=self.channeloptions[gametype+'_goal']
+        goal=options[gametype+'_goal']
         self.game[table]['goal']=goal
-        self.game[table]['players'][nick]={'score':0}
+        self.game.add_player(table, nick, {'score':0})
         self.game[table]['players'][nick]['numbers']=[0]
         irc.reply('%s has started a new game of %s at table %s.  For the rules of the game, type ".ucrules".  To accept this challenge, join with .ucjoin.' % (nick, gametype.capitalize(), table+1), prefixNick=False)
 
@@ -139,11 +138,8 @@ class _Plugin(callbacks.Plugin):
         Join a game of Undercut/Flaunt previously started with the ucstart command. 
         Specify <table> if there is more than one game to join in that channel.
         """
-        try:
-            self._read_options(irc)
-        except:
-            pass
-        if self.channeloptions['allow_game']==False:
+        options=self._options(irc, msg.args[0])
+        if options['allow_game']==False:
             irc.reply('Error: allow_game=False')
             return
 
@@ -181,7 +177,7 @@ class _Plugin(callbacks.Plugin):
             return
         isfake=False
         iscpu=False
-        if ((self.channeloptions['debug']) and fakenick) or (fakenick and fakenick.lower()=='cpu'):
+        if ((options['debug']) and fakenick) or (fakenick and fakenick.lower()=='cpu'):
             nick=fakenick
             isfake=True
             if fakenick.lower()=='cpu': iscpu=True
@@ -190,7 +186,7 @@ class _Plugin(callbacks.Plugin):
                 irc.reply('Error: you have already joined.')
                 return
 
-            self.game[table]['players'][nick]={'score':0}
+            self.game.add_player(table, nick, {'score':0})
             self.game[table]['players'][nick]['numbers']=[0]
             irc.reply('Game started!  Use .ucplay (privately) to play a number from 1 to 5.', prefixNick=False, to=self.game[table]['channel'])
 
@@ -213,16 +209,13 @@ class _Plugin(callbacks.Plugin):
         
         Leave a game of Undercut/Flaunt.
         """
-        try:
-            self._read_options(irc)
-        except:
-            pass
-        if self.channeloptions['allow_game']==False:
+        options=self._options(irc, msg.args[0])
+        if options['allow_game']==False:
             irc.reply('Error: allow_game=False')
             return
 
         nick=msg.nick
-        if self.channeloptions['debug'] and fakenick:
+        if options['debug'] and fakenick:
             nick=fakenick
         table=self._gettablefromnick(nick)
         if table==None:
@@ -230,7 +223,7 @@ class _Plugin(callbacks.Plugin):
             return
             
         irc.reply('%s has left the game.' % nick, prefixNick=False, to=self.game[table]['channel'])
-        del self.game[table]['players'][nick]
+        self.game.remove_player(table, nick)
         winner=[p for p in self.game[table]['players']]
         if len(winner)>0:
             winner=winner[0]
@@ -246,18 +239,13 @@ class _Plugin(callbacks.Plugin):
         
         Leave a game of Undercut/Flaunt.
         """
-        try:
-            self._read_options(irc)
-        except:
-            pass
-        if self.channeloptions['allow_game']==False:
-            irc.reply('Error: allow_game=False')
-            return
-
         table=self._gettablefromnick(nick)
         if table==None:
             #irc.reply('Error: You are not playing a game at any of the tables.')
             return
+        if self._options(irc, self.game[table]['channel'])['allow_game']==False:
+            irc.reply('Error: allow_game=False')
+            return
         #irc.reply('%s has left the game.' % nick, prefixNick=False, to=self.game[table]['channel'])
         
         # ---- replace with cpu ----
@@ -282,8 +270,10 @@ class _Plugin(callbacks.Plugin):
         be used in a private message."""
 
         nick=msg.nick
-        if self.channeloptions['debug'] and fakenick:
-            nick=fakenick
+        if fakenick:
+            table=self._gettablefromnick(fakenick)
+            if table!=None and self._options(irc, self.game[table]['channel'])['debug']:
+                nick=fakenick
         table=self._gettablefromnick(nick)
         if table==None:
             irc.reply('Error: You are not playing a game at any of the tables.')
@@ -451,33 +441,27 @@ class _Plugin(callbacks.Plugin):
         
         Changes an option for the Undercut/Flaunt games.  You can view the 
         options for the current channel with the ucshowoptions command."""
-        try:
-            self._read_options(irc)
-        except:
-            pass
+        options=self._options(irc, channel)
         if value.lower()=='true':
             value=True
         elif value.lower()=='false':
             value=False
         elif value.lower()=='unset':
-            if text in self.channeloptions:
-                irc.reply('Set %s %s-->(unset)' % (text, self.channeloptions[text]))
-                del self.channeloptions[text]
+            if options.isset(text):
+                irc.reply('Set %s %s-->(unset)' % (text, options[text]))
                 try:
-                    self._write_options(irc)
+                    options.unset(text)
                 except:
                     irc.reply('Failed to write options to file. :(')
             else:
                 irc.reply('%s was already unset.' % text)
             return
-        if text in self.channeloptions:
-            irc.reply('Set %s %s-->%s' % (text, self.channeloptions[text], value))
-            self.channeloptions[text]=value
+        if text in options:
+            irc.reply('Set %s %s-->%s' % (text, options[text], value))
         else:
             irc.reply('Set %s (unset)-->%s' % (text, value))
-            self.channeloptions[text]=value
         try:
-            self._write_options(irc)
+            options.set(text, value)
         except:
             irc.reply('Failed to write options to file. :(')
     ucsetoption = wrap(ucsetoption, [('checkChannelCapability', 'op'), 'something', 'something'])
@@ -486,71 +470,35 @@ class _Plugin(callbacks.Plugin):
         """(takes no arguments)
         
         Shows options for the Undercut/Flaunt games for the current channel."""
-        try:
-            self._read_options(irc)
-        except:
-            pass
-        txt=', '.join(['='.join([str(i) for i in item]) for item in list(self.channeloptions.items())])
+        options=self._options(irc, msg.args[0])
+        txt=', '.join(['='.join([str(i) for i in item]) for item in list(options.items())])
         irc.reply(txt)
     ucshowoptions = wrap(ucshowoptions)
 
     def _cleanup(self, table):
-        self.game[table]={}
-        self.game[table]['players']={}
-        self.game[table]['phase']=''
+        self.game.reset(table)
 
     def _getopentable(self):
-        openslot=[i for i in range(len(self.game)) if not self.game[i].get('phase')]
-        if len(openslot)==0:
-            return None
-        else:
-            return openslot[0]
+        return self.game.open()
 
     def _getcurrenttables(self):
-        slot=[i for i in range(len(self.game)) if self.game[i].get('phase')]
-        return slot
+        return self.game.current()
 
     def _gettablefromnick(self, n):
-        tables=self._getcurrenttables()
-        if not tables: return None
-        for table in tables:
-            #if n.lower() in map(lambda x:x.lower(), self.game[table]['players'].keys()):
-            if n.lower() in [x.lower() for x in list(self.game[table]['players'].keys())]:
-                return table
-        return None
-
-    def _read_options(self, irc):
-        network=irc.network.replace(' ','_')
-        channel=irc.msg.args[0]
-        #irc.reply('test: %s.%s.options' % (irc.network, irc.msg.args[0] ))
-        f="%s%s.%s.options" % (self.dataPath, network, channel)
-        if os.path.isfile(f):
-            inputfile = open(f, "rb")
-            self.channeloptions = pickle.load(inputfile)
-            inputfile.close()
-        else:
-            # Use defaults
-            channeloptions = {}
-            channeloptions['allow_game']=False
-            channeloptions['debug']=False
-            channeloptions['use_queue']=True
-            channeloptions['undercut_goal']=40
-            channeloptions['flaunt1_goal']=40
-            channeloptions['flaunt2_goal']=200
-            channeloptions['flaunt3_goal']=40
-        return
-
-    def _write_options(self, irc):
-        network=irc.network.replace(' ','_')
-        channel=irc.msg.args[0]
-        outputfile = open("%s%s.%s.options" % (self.dataPath, network, channel), "wb")
-        pickle.dump(self.channeloptions, outputfile)
-        outputfile.close()
+        return self.game.find(n)
 
-#    def _get_default_options(self):
-#        self.channeloptions = {}
-#        self.channeloptions['allow_game']=False
-#        self.channeloptions['debug']=False
+    def _options(self, irc, channel):
+        network=irc.network.replace(' ','_')
+        options=self.channeloptions.get((network, channel))
+        if options==None:
+            f="%s%s.%s.options" % (self.dataPath, network, channel)
+            options=Options(f, self.defaultoptions)
+            try:
+                options.load()
+            except:
+                pass
+            self.channeloptions[(network, channel)]=options
+        return options
 
     def doNick(self, irc, msg):
         oldNick = msg.nick
@@ -558,8 +506,7 @@ class _Plugin(callbacks.Plugin):
         table=self._gettablefromnick(oldNick)
         if table == None:
             return
-        self.game[table]['players'][newNick]=self.game[table]['players'][oldNick]
-        del self.game[table]['players'][oldNick]
+        self.game.rename_player(table, oldNick, newNick)
 
     def doQuit(self, irc, msg):
         nick=msg.nick
@@ -585,8 +532,8 @@ class _Plugin(callbacks.Plugin):
             if table!=None:
                 self._leavegame(irc, msg, nick)
 
-    def _sendMsg(self, irc, msg):
-        if self.channeloptions['use_queue']:
+    def _sendMsg(self, irc, msg, channel):
+        if self._options(irc, channel)['use_queue']:
             irc.queueMsg(msg)
         else:
             irc.sendMsg(msg)
@@ -594,13 +541,15 @@ class _Plugin(callbacks.Plugin):
 
     def reply(self, irc, text, action=False, private=False, prefixNick=False, to='', fast=False):
 
+        channel=to
         table=self._gettablefromnick(to)
         if table == None:
             # hopefully it's a valid channel
             pass
         else:
+            channel=self.game[table]['channel']
             if self.game[table]['players'][to].get('fake'):
-                if self.channeloptions['debug']:
+                if self._options(irc, channel)['debug']:
                     text='(to %s): %s' % (to, text)
                     text=ircutils.mircColor(text, fg=14)
                     to=self.game[table]['channel']
@@ -614,7 +563,7 @@ class _Plugin(callbacks.Plugin):
             if (prefixNick) and ('#' not in to):
                 text='%s: %s' % (to, text)
             m=ircmsgs.privmsg(to, text)
-            self._sendMsg(irc, m)
+            self._sendMsg(irc, m, channel)
 
 
 _Plugin.__name__=PluginName
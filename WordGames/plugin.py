@@ -31,6 +31,7 @@
 from operator import add, mul
 import random
 import re
+import threading
 import time
 
 import supybot.conf as conf
@@ -45,6 +46,7 @@ import supybot.log as log
 import supybot.world as world
 
 from .trie import Trie
+from .wordstore import WordStore
 from functools import reduce
 
 DEBUG = False
@@ -156,6 +158,8 @@ class WordGames(callbacks.Plugin):
         self.parent = super(WordGames, self)
         self.parent.__init__(irc)
         self.games = {}
+        self.store = None
+        self.puzzles = PuzzlePool()
 
     def die(self):
         for channel, game in self.games.items():
@@ -244,7 +248,7 @@ class WordGames(callbacks.Plugin):
         if difficulty not in ["easy", "medium", "hard", "evil"]:
             irc.reply("Difficulty must be easy, medium, hard, or evil.")
         else:
-            self._start_game(WordShrink, irc, channel, difficulty)
+            self._start_game(WordShrink, irc, channel, difficulty, self.puzzles)
 
     wordshrink = wrap(
         wordshrink, ["channel", optional("somethingWithoutSpaces", "medium")]
@@ -259,7 +263,7 @@ class WordGames(callbacks.Plugin):
         if difficulty not in ["easy", "medium", "hard", "evil"]:
             irc.reply("Difficulty must be easy, medium, hard, or evil.")
         else:
-            self._start_game(WordTwist, irc, channel, difficulty)
+            self._start_game(WordTwist, irc, channel, difficulty, self.puzzles)
 
     wordtwist = wrap(
         wordtwist, ["channel", optional("somethingWithoutSpaces", "medium")]
@@ -284,17 +288,24 @@ class WordGames(callbacks.Plugin):
                     break
         return my_game
 
-    def _get_words(self):
+    def _get_store(self):
+        """
+        Return the word store for the configured word file, reloading it if
+        the file or wordRegexp changed.
+        """
         try:
             regexp = re.compile(self.registryValue("wordRegexp"))
         except Exception as e:
             raise WordGamesError("Bad value for wordRegexp: %s" % str(e))
         path = self.registryValue("wordFile")
+        if not self.store or (self.store.path, self.store.regexp) != (path, regexp):
+            directory = conf.supybot.directories.data.dirize("WordGames")
+            self.store = WordStore(path, regexp, directory)
         try:
-            wordFile = open(path)
+            self.store.refresh()
         except Exception as e:
             raise WordGamesError("Unable to open word file: %s" % path)
-        return list(filter(regexp.match, list(map(str.strip, wordFile.readlines()))))
+        return self.store
 
     def _start_game(self, Game, irc, channel, *args, **kwargs):
         try:
@@ -303,8 +314,8 @@ class WordGames(callbacks.Plugin):
                 irc.reply("A word game is already running here.")
                 game.show()
             else:
-                words = self._get_words()
-                self.games[channel] = Game(words, irc, channel, *args, **kwargs)
+                store = self._get_store()
+                self.games[channel] = Game(store, irc, channel, *args, **kwargs)
                 self.games[channel].start()
         except WordGamesError as e:
             # Get rid of the game in case it's in an indeterminate state
@@ -327,8 +338,8 @@ class WordGames(callbacks.Plugin):
 class BaseGame(object):
     "Base class for the games in this plugin."
 
-    def __init__(self, words, irc, channel):
-        self.words = words
+    def __init__(self, store, irc, channel):
+        self.store = store
         self.irc = irc
         self.channel = channel
         self.running = False
@@ -528,10 +539,10 @@ class Boggle(BaseGame):
         def sorted_results(self):
             return sorted(list(self.player_results.values()), reverse=True)
 
-    def __init__(self, words, irc, channel, nick, delay, duration, difficulty):
+    def __init__(self, store, irc, channel, nick, delay, duration, difficulty):
         # See tech note in the WordGames class.
         self.parent = super(Boggle, self)
-        self.parent.__init__(words, irc, channel)
+        self.parent.__init__(store, irc, channel)
         self.delay = delay
         self.duration = duration
         self.difficulty = difficulty
@@ -795,8 +806,7 @@ class Boggle(BaseGame):
     def _generate_board(self):
         "Generate several boards and return the most bountiful board."
         attempts = 5
-        wordtrie = Trie()
-        list(map(wordtrie.add, self.words))
+        wordtrie = self.store.trie()
         boards = [
             BoggleBoard(wordtrie, Boggle.BOARD_SIZE, self.min_length)
             for i in range(0, attempts)
@@ -824,45 +834,44 @@ class BoggleBoard(object):
             result.append(text)
         return result
 
-    def _find_solutions(self, wordtrie, visited=None, row=0, col=0, prefix=""):
+    def _find_solutions(self, wordtrie):
         "Discover and return the set of all solutions for the current board."
+        n = self.size
+        cells = []
+        for row in self.rows:
+            for letter in row:
+                letter = letter.lower()
+                cells.append(letter + "u" if letter == "q" else letter)
+        neighbors = []
+        for row in range(0, n):
+            for col in range(0, n):
+                neighbors.append(
+                    [
+                        r * n + c
+                        for r in range(max(row - 1, 0), min(row + 2, n))
+                        for c in range(max(col - 1, 0), min(col + 2, n))
+                        if (r, c) != (row, col)
+                    ]
+                )
+        # Depth-first walk of the board and the trie together. Visited cells
+        # are kept as a bitmask.
         result = set()
-        if visited == None:
-            for row in range(0, self.size):
-                for col in range(0, self.size):
-                    result.update(self._find_solutions(wordtrie, [], row, col, ""))
-        else:
-            visited = visited + [(row, col)]
-            current = prefix + self.rows[row][col].lower()
-            if current[-1] == "q":
-                current += "u"
-            node = wordtrie.find_prefix(current)
-            if node:
-                if node["*"] and len(current) >= self.min_length:
-                    result.add(current)
-                # Explore all 8 directions out from here
-                offsets = [
-                    (-1, -1),
-                    (-1, 0),
-                    (-1, 1),
-                    (0, -1),
-                    (0, 1),
-                    (1, -1),
-                    (1, 0),
-                    (1, 1),
-                ]
-                for offset in offsets:
-                    point = (row + offset[0], col + offset[1])
-                    if point in visited:
-                        continue
-                    if point[0] < 0 or point[0] >= self.size:
-                        continue
-                    if point[1] < 0 or point[1] >= self.size:
-                        continue
-                    result.update(
-                        self._find_solutions(
-                            wordtrie, visited, point[0], point[1], current
-                        )
+        stack = []
+        for cell, letters in enumerate(cells):
+            node = wordtrie.walk(Trie.ROOT, letters)
+            if node is not None:
+                stack.append((cell, node, 1 << cell, letters))
+        while stack:
+            cell, node, visited, current = stack.pop()
+            if len(current) >= self.min_length and wordtrie.is_word(node):
+                result.add(current)
+            for point in neighbors[cell]:
+                if visited & (1 << point):
+                    continue
+                child = wordtrie.walk(node, cells[point])
+                if child is not None:
+                    stack.append(
+                        (point, child, visited | (1 << point), current + cells[point])
                     )
         return result
 
@@ -889,6 +898,52 @@ class BoggleBoard(object):
         return rows
 
 
+class PuzzlePool(object):
+    """
+    Keeps a few ready-made puzzles for each word chain game and difficulty,
+    generated in a background thread so that new games start right away.
+    """
+
+    SIZE = 3
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pools = {}
+        self.refilling = set()
+
+    def get(self, game):
+        "Return a puzzle for game, or None if none is ready. Starts a refill."
+        key = (game.__class__.__name__, game.difficulty)
+        with self.lock:
+            graph, puzzles = self.pools.get(key, (None, []))
+            if graph is not game.graph:
+                puzzles = []
+                self.pools[key] = (game.graph, puzzles)
+            puzzle = puzzles.pop() if puzzles else None
+            if key not in self.refilling:
+                self.refilling.add(key)
+                thread = threading.Thread(target=self._refill, args=(key, game))
+                thread.daemon = True
+                thread.start()
+        return puzzle
+
+    def _refill(self, key, game):
+        try:
+            while True:
+                with self.lock:
+                    graph, puzzles = self.pools[key]
+                    if graph is not game.graph or len(puzzles) >= PuzzlePool.SIZE:
+                        break
+                puzzle = game.generate_puzzle()
+                with self.lock:
+                    puzzles.append(puzzle)
+        except WordGamesError as e:
+            error("Generating %s puzzles: %s" % (key[0], str(e)))
+        finally:
+            with self.lock:
+                self.refilling.discard(key)
+
+
 class WordChain(BaseGame):
     "Base class for word-chain games like WordShrink and WordTwist."
 
@@ -909,72 +964,86 @@ class WordChain(BaseGame):
             self.word_lengths = word_lengths
             self.num_solutions = num_solutions
 
-    def __init__(self, words, irc, channel, settings):
+    def __init__(self, store, irc, channel, difficulty, settings, pool=None):
         # See tech note in the WordGames class.
         self.parent = super(WordChain, self)
-        self.parent.__init__(words, irc, channel)
+        self.parent.__init__(store, irc, channel)
+        self.difficulty = difficulty
         self.settings = settings
+        self.pool = pool
         self.solution_length = random.choice(settings.puzzle_lengths)
         self.solution = []
         self.solutions = []
-        self.word_map = {}
-        if settings.word_lengths:
-            self.words = [w for w in self.words if len(w) in settings.word_lengths]
-        else:
-            self.words = [w for w in self.words if len(w) >= 3]
-        self.build_word_map()
+        self.graph = store.graph(
+            self.__class__.__name__, settings.word_lengths, self.build_word_map
+        )
 
     def start(self):
-        # Build a puzzle
-        attempts = 100000  # Prevent infinite loops
-        while attempts:
-            self.solution = []
-            while len(self.solution) < self.solution_length:
-                attempts -= 1
-                if attempts == 0:
-                    raise WordGamesError(
-                        (
-                            "Unable to generate %s puzzle. This"
-                            + " is either a bug, or the word file is too small."
-                        )
-                        % self.__class__.__name__
-                    )
-                self.solution = [random.choice(self.words)]
-                for i in range(1, self.solution_length):
-                    values = self.word_map[self.solution[-1]]
-                    values = [w for w in values if w not in self.solution]
-                    if not values:
-                        break
-                    self.solution.append(random.choice(values))
-            self.solutions = []
-            self._find_solutions()
-            # Enforce maximum solutions limit (difficulty parameter)
-            happy = True
-            if (
-                self.settings.num_solutions
-                and len(self.solutions) not in self.settings.num_solutions
-            ):
-                happy = False
-            # Ensure no solution is trivial
-            for solution in self.solutions:
-                if self.is_trivial_solution(solution):
-                    happy = False
-                    break
-            if happy:
-                break
-        if not happy:
-            raise WordGamesError(
-                (
-                    "Unable to generate %s puzzle meeting the "
-                    + "game parameters. This is probably a bug."
-                )
-                % self.__class__.__name__
-            )
+        # Take a puzzle from the pool, or build one now if none is ready
+        puzzle = self.pool.get(self) if self.pool else None
+        if puzzle is None:
+            puzzle = self.generate_puzzle()
+        self.solution, self.solutions = puzzle
+        self.solution_length = len(self.solution)
 
         # Start the game
         self.show()
         self.parent.start()
 
+    def generate_puzzle(self):
+        """
+        Return a random (solution, solutions) pair meeting the game settings.
+
+        A breadth-first search from a random start word counts the shortest
+        paths to every word up to the puzzle length, so end words with the
+        right number of solutions can be picked without listing every path.
+        Only shortest paths count: a longer route to the end word would make
+        a shorter one trivial.
+        """
+        graph = self.graph
+        limits = self.settings.num_solutions
+        attempts = 1000  # Prevent infinite loops
+        while graph and attempts:
+            attempts -= 1
+            length = random.choice(self.settings.puzzle_lengths)
+            start = random.randrange(len(graph))
+            depths = {start: 0}
+            counts = {start: 1}
+            parents = {start: []}
+            frontier = [start]
+            for depth in range(1, length):
+                next_frontier = []
+                for i in frontier:
+                    for j in graph.successor_ids(i):
+                        if j not in depths:
+                            depths[j] = depth
+                            counts[j] = 0
+                            parents[j] = []
+                            next_frontier.append(j)
+                        if depths[j] == depth:
+                            counts[j] += counts[i]
+                            parents[j].append(i)
+                frontier = next_frontier
+            ends = [j for j in frontier if not limits or counts[j] in limits]
+            random.shuffle(ends)
+            for end in ends:
+                paths = [[end]]
+                for depth in range(1, length):
+                    paths = [[i] + path for path in paths for i in parents[path[0]]]
+                solutions = [[graph.words[i] for i in path] for path in paths]
+                for solution in solutions:
+                    if self.is_trivial_solution(solution):
+                        break
+                else:
+                    return (random.choice(solutions), solutions)
+        raise WordGamesError(
+            (
+                "Unable to generate %s puzzle. This"
+                + " is either a bug, or the word file is too small."
+            )
+            % self.__class__.__name__
+        )
+
     def show(self):
         words = [self.solution[0]]
         for word in self.solution[1:-1]:
@@ -1019,36 +1088,17 @@ class WordChain(BaseGame):
                 self.send("%s: Your solution is also valid." % msg.nick)
 
     # Override in game class
-    def build_word_map(self):
-        "Build a map of word -> [word1, word2] for all valid transitions."
-        pass
+    def build_word_map(self, words):
+        "Return a map of word -> [word1, word2] for all valid transitions."
+        return {}
 
     # Override in game class
     def is_trivial_solution(self, solution):
         return False
 
     def _get_successors(self, word):
-        "Lookup a word in the map and return list of possible successor words."
-        return self.word_map.get(word, [])
-
-    def _find_solutions(self, seed=None):
-        "Recursively find and save all solutions for the puzzle."
-        if seed is None:
-            seed = [self.solution[0]]
-            self.solutions = []
-            self._find_solutions(seed)
-        elif len(seed) == len(self.solution) - 1:
-            if self.solution[-1] in self._get_successors(seed[-1]):
-                self.solutions.append(seed + [self.solution[-1]])
-        else:
-            words = self._get_successors(seed[-1])
-            for word in words:
-                if word in seed:
-                    continue
-                if word == self.solution[-1]:
-                    self.solutions.append(seed + [word])
-                else:
-                    self._find_solutions(seed + [word])
+        "Lookup a word in the graph and return list of possible successor words."
+        return self.graph.successors(word)
 
     def _join_words(self, words):
         sep = "%s > %s" % (LGREEN, YELLOW)
@@ -1070,7 +1120,7 @@ class WordChain(BaseGame):
             return False
         # Check dictionary
         for word in words:
-            if word not in self.words:
+            if word not in self.graph:
                 self.send("%s: %s is not a word I know." % (nick, word))
                 return False
         # Enforce pairwise relationships
@@ -1084,7 +1134,7 @@ class WordChain(BaseGame):
 
 
 class WordShrink(WordChain):
-    def __init__(self, words, irc, channel, difficulty):
+    def __init__(self, store, irc, channel, difficulty, pool=None):
         assert difficulty in ["easy", "medium", "hard", "evil"], "Bad mojo."
         settings = {
             "easy": WordChain.Settings([4], list(range(3, 9)), list(range(15, 100))),
@@ -1092,30 +1142,33 @@ class WordShrink(WordChain):
             "hard": WordChain.Settings([6], list(range(4, 12)), list(range(4, 12))),
             "evil": WordChain.Settings([7], list(range(4, 15)), list(range(1, 10))),
         }
-        super(WordShrink, self).__init__(words, irc, channel, settings[difficulty])
+        super(WordShrink, self).__init__(
+            store, irc, channel, difficulty, settings[difficulty], pool
+        )
 
-    def build_word_map(self):
-        "Build a map of word -> [word1, word2] for all valid transitions."
+    def build_word_map(self, words):
+        "Return a map of word -> [word1, word2] for all valid transitions."
         keymap = {}
-        for word in self.words:
+        for word in words:
             s = "".join(sorted(word))
             if s in keymap:
                 keymap[s].append(word)
             else:
                 keymap[s] = [word]
-        self.word_map = {}
-        for word1 in self.words:
+        word_map = {}
+        for word1 in words:
             s = "".join(sorted(word1))
-            if s in self.word_map:
-                self.word_map[word1] = self.word_map[s]
+            if s in word_map:
+                word_map[word1] = word_map[s]
             else:
-                self.word_map[s] = self.word_map[word1] = []
+                word_map[s] = word_map[word1] = []
                 keys = set()
                 for i in range(0, len(s)):
                     keys.add(s[0:i] + s[i + 1 :])
                 for key in keys:
                     for word2 in keymap.get(key, []):
-                        self.word_map[s].append(word2)
+                        word_map[s].append(word2)
+        return word_map
 
     def is_trivial_solution(self, solution):
         "Consider pure substring solutions trivial."
@@ -1127,7 +1180,7 @@ class WordShrink(WordChain):
 
 
 class WordTwist(WordChain):
-    def __init__(self, words, irc, channel, difficulty):
+    def __init__(self, store, irc, channel, difficulty, pool=None):
         assert difficulty in ["easy", "medium", "hard", "evil"], "Bad mojo."
         settings = {
             "easy": WordChain.Settings([4], [3, 4], list(range(10, 100))),
@@ -1135,25 +1188,28 @@ class WordTwist(WordChain):
             "hard": WordChain.Settings([6], [4, 5, 6], list(range(2, 5))),
             "evil": WordChain.Settings([7], [4, 5, 6], list(range(1, 3))),
         }
-        super(WordTwist, self).__init__(words, irc, channel, settings[difficulty])
+        super(WordTwist, self).__init__(
+            store, irc, channel, difficulty, settings[difficulty], pool
+        )
 
-    def build_word_map(self):
-        "Build the map of word -> [word1, word2, ...] for all valid pairs."
+    def build_word_map(self, words):
+        "Return the map of word -> [word1, word2, ...] for all valid pairs."
         keymap = {}
         wildcard = "*"
-        for word in self.words:
+        for word in words:
             for pos in range(0, len(word)):
                 key = word[0:pos] + wildcard + word[pos + 1 :]
                 if key not in keymap:
                     keymap[key] = [word]
                 else:
                     keymap[key].append(word)
-        self.word_map = {}
-        for word in self.words:
-            self.word_map[word] = []
+        word_map = {}
+        for word in words:
+            word_map[word] = []
             for pos in range(0, len(word)):
                 key = word[0:pos] + wildcard + word[pos + 1 :]
-                self.word_map[word] += [w for w in keymap.get(key, []) if w != word]
+                word_map[word] += [w for w in keymap.get(key, []) if w != word]
+        return word_map
 
     def is_trivial_solution(self, solution):
         "If it's possible to get there in fewer hops, this is trivial."
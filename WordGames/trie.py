@@ -29,62 +29,110 @@
 ###
 
 """
-Quick & dirty prefix tree (aka trie).
+Compact prefix tree (aka trie).
 """
 
-# This got a little uglier because using a nice object-oriented approach took
-# too much time and memory on big trees.  Now every node is simply a dict,
-# with the special '*' field meaning that the word is complete at that node.
+from array import array
+from bisect import bisect_left
+
+# Nodes live in flat arrays instead of one dict per node, which took too much
+# time and memory on big trees.  The edges leaving node n are
+# labels[first[n]:first[n] + count[n]] (sorted letter codes) pointing to the
+# same slice of targets.  terminal[n] is set if a word ends at node n.
 
 
 class Trie(object):
-    def __init__(self):
-        self.contents = {"*": False}
-
-    def add(self, value, contents=None):
-        if contents is None:
-            contents = self.contents
-        if not value:
-            contents["*"] = True
-            return
-        prefix = value[0]
-        remainder = value[1:]
-        child_contents = contents.get(prefix, None)
-        if not child_contents:
-            child_contents = {"*": False}
-            contents[prefix] = child_contents
-        self.add(remainder, child_contents)
+    ROOT = 0
+
+    def __init__(self, words=()):
+        self.first = array("I", [0])
+        self.count = array("H", [0])
+        self.labels = array("I")
+        self.targets = array("I")
+        self.terminal = bytearray(1)
+        self._build(sorted(set(words)))
+
+    def _build(self, words):
+        # Words are added in sorted order, so a node's children are all known
+        # once a word leaves its prefix and its edges can be written out in
+        # one contiguous block.
+        path = [Trie.ROOT]
+        pending = [[]]
+        previous = ""
+        for word in words:
+            common = 0
+            for a, b in zip(previous, word):
+                if a != b:
+                    break
+                common += 1
+            while len(path) > common + 1:
+                self._close(path.pop(), pending.pop())
+            for letter in word[common:]:
+                node = len(self.terminal)
+                self.terminal.append(0)
+                self.first.append(0)
+                self.count.append(0)
+                pending[-1].append((ord(letter), node))
+                path.append(node)
+                pending.append([])
+            self.terminal[path[-1]] = 1
+            previous = word
+        while path:
+            self._close(path.pop(), pending.pop())
+
+    def _close(self, node, edges):
+        self.first[node] = len(self.labels)
+        self.count[node] = len(edges)
+        for code, child in edges:
+            self.labels.append(code)
+            self.targets.append(child)
+
+    def __len__(self):
+        "Return the number of nodes in the tree."
+        return len(self.terminal)
+
+    def child(self, node, letter):
+        "Return the node reached from node by letter, or None."
+        lo = self.first[node]
+        hi = lo + self.count[node]
+        code = ord(letter)
+        i = bisect_left(self.labels, code, lo, hi)
+        if i < hi and self.labels[i] == code:
+            return self.targets[i]
+        return None
+
+    def walk(self, node, value):
+        "Follow every letter of value from node, returning the end node or None."
+        for letter in value:
+            node = self.child(node, letter)
+            if node is None:
+                return None
+        return node
+
+    def is_word(self, node):
+        "Return true if a word ends at node."
+        return self.terminal[node] == 1
 
     def find(self, value):
         "Return true if the value appears, false otherwise."
-        x = self.find_prefix(value)
-        return x and x["*"] == True
-
-    def find_prefix(self, value, contents=None):
-        "Return true if the given prefix appears in the tree."
-        if contents is None:
-            contents = self.contents
-        if not value:
-            return contents
-        child_contents = contents.get(value[0], None)
-        if not child_contents:
-            return None
-        return self.find_prefix(value[1:], child_contents)
-
-    def dump(self, indent=0, contents=None):
+        node = self.find_prefix(value)
+        return node is not None and self.is_word(node)
+
+    def find_prefix(self, value):
+        "Return the node for the given prefix, or None if it doesn't appear."
+        return self.walk(Trie.ROOT, value)
+
+    def dump(self, indent=0, node=ROOT):
         "Dump the trie to stdout."
-        if contents is None:
-            contents = self.contents
-        for key in sorted(contents.keys()):
-            if key == "*":
-                continue
+        start = self.first[node]
+        for i in range(start, start + self.count[node]):
+            child = self.targets[i]
             text = indent * " "
-            text += key
-            child_contents = contents[key]
-            if child_contents["*"]:
+            text += chr(self.labels[i])
+            if self.is_word(child):
                 text += "*"
             print(text)
-            self.dump(indent + 2, child_contents)
+            self.dump(indent + 2, child)
 
 
 if __name__ == "__main__":
@@ -95,27 +143,28 @@ if __name__ == "__main__":
     if "--perf" in sys.argv:
         # Performance test, last arg should be input file
         start = time.time()
-        t = Trie()
-        f = open(sys.argv[-1], "r")
-        for line in f:
-            t.add(line.strip())
+        with open(sys.argv[-1], "r") as f:
+            t = Trie(line.strip() for line in f)
         mem = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
         elapsed = time.time() - start
-        print("Trie created in %g seconds." % elapsed)
+        print("Trie of %d nodes created in %g seconds." % (len(t), elapsed))
         print("Used %dMB RAM." % (mem / 1024))
     else:
         # Regular sanity test
-        t = Trie()
-        t.add("hell")
-        t.add("hello")
-        t.add("he")
-        t.add("world")
-        t.add("alphabet")
-        t.add("foo")
-        t.add("food")
-        t.add("foodie")
-        t.add("bar")
-        t.add("alphanumeric")
+        t = Trie(
+            [
+                "hell",
+                "hello",
+                "he",
+                "world",
+                "alphabet",
+                "foo",
+                "food",
+                "foodie",
+                "bar",
+                "alphanumeric",
+            ]
+        )
         t.dump()
 
         assert not t.find("h")
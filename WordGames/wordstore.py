@@ -0,0 +1,192 @@
+###
+# Copyright (c) 2012, Mike Mueller
+# Copyright (c) 2020, oddluck <oddluck@riseup.net>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+###
+
+"""
+Word lists and the structures derived from them, kept between games.
+"""
+
+from array import array
+import os
+import pickle
+import threading
+
+from .trie import Trie
+
+
+class WordGraph(object):
+    """
+    Map of word -> successor words, stored as flat arrays.  The successors of
+    words[i] are words[j] for j in targets[offsets[i]:offsets[i + 1]].
+    """
+
+    VERSION = 1
+
+    def __init__(self, words, offsets, targets):
+        self.words = words
+        self.offsets = offsets
+        self.targets = targets
+        self.index = dict((word, i) for i, word in enumerate(words))
+
+    @classmethod
+    def from_map(cls, words, word_map):
+        "Build a graph from a word -> [word1, word2, ...] dict."
+        words = tuple(words)
+        index = dict((word, i) for i, word in enumerate(words))
+        offsets = array("I", [0])
+        targets = array("I")
+        for word in words:
+            targets.extend(index[w] for w in word_map.get(word, []) if w in index)
+            offsets.append(len(targets))
+        return cls(words, offsets, targets)
+
+    @classmethod
+    def load(cls, filename, key):
+        "Load a saved graph, or return None if it's missing or stale."
+        try:
+            with open(filename, "rb") as f:
+                data = pickle.load(f)
+        except Exception:
+            return None
+        if data.get("version") != cls.VERSION or data.get("key") != key:
+            return None
+        return cls(data["words"], data["offsets"], data["targets"])
+
+    def save(self, filename, key):
+        data = {
+            "version": self.VERSION,
+            "key": key,
+            "words": self.words,
+            "offsets": self.offsets,
+            "targets": self.targets,
+        }
+        tmp = filename + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, filename)
+
+    def __contains__(self, word):
+        return word in self.index
+
+    def __len__(self):
+        return len(self.words)
+
+    def successor_ids(self, i):
+        "Return the indexes of the successors of words[i]."
+        return self.targets[self.offsets[i] : self.offsets[i + 1]]
+
+    def successors(self, word):
+        "Return the list of successors of a word."
+        i = self.index.get(word)
+        if i is None:
+            return []
+        return [self.words[j] for j in self.successor_ids(i)]
+
+
+class WordStore(object):
+    """
+    The filtered contents of a word file.  The file is only read again when
+    its modification time changes, and the trie and transition graphs built
+    from it are kept until then.  Graphs are also saved in directory, so they
+    survive restarts.
+    """
+
+    def __init__(self, path, regexp, directory):
+        self.path = path
+        self.regexp = regexp
+        self.directory = directory
+        self.lock = threading.RLock()
+        self.mtime = None
+        self.words = ()
+        self.word_set = frozenset()
+        self._trie = None
+        self._graphs = {}
+
+    def refresh(self):
+        "Reload the word file if it changed. Raises OSError if it can't be read."
+        with self.lock:
+            mtime = os.path.getmtime(self.path)
+            if mtime == self.mtime:
+                return
+            with open(self.path) as f:
+                words = [w for w in map(str.strip, f) if self.regexp.match(w)]
+            self.words = tuple(words)
+            self.word_set = frozenset(words)
+            self.mtime = mtime
+            self._trie = None
+            self._graphs = {}
+
+    def __contains__(self, word):
+        return word in self.word_set
+
+    def trie(self):
+        "Return the trie of all words."
+        with self.lock:
+            if self._trie is None:
+                self._trie = Trie(self.words)
+            return self._trie
+
+    def graph(self, name, word_lengths, build):
+        """
+        Return the WordGraph called name over the words whose length is in
+        word_lengths (or at least 3 letters if None).  build is called with
+        the word list to make the word -> [word1, word2, ...] map when there
+        is no saved copy.
+        """
+        lengths = tuple(word_lengths) if word_lengths else None
+        with self.lock:
+            graph = self._graphs.get((name, lengths))
+            if graph is not None:
+                return graph
+            key = (
+                os.path.abspath(self.path),
+                self.mtime,
+                self.regexp.pattern,
+                name,
+                lengths,
+            )
+            filename = os.path.join(
+                self.directory,
+                "%s-%s.graph" % (name, "-".join(map(str, lengths or ["all"]))),
+            )
+            graph = WordGraph.load(filename, key)
+            if graph is None:
+                if lengths:
+                    words = [w for w in self.words if len(w) in lengths]
+                else:
+                    words = [w for w in self.words if len(w) >= 3]
+                words = list(dict.fromkeys(words))
+                graph = WordGraph.from_map(words, build(words))
+                try:
+                    os.makedirs(self.directory, exist_ok=True)
+                    graph.save(filename, key)
+                except OSError:
+                    pass
+            self._graphs[(name, lengths)] = graph
+            return graph